@@ -0,0 +1,51 @@
+"""Benchmark of DB insert strategies: rows per second for every strategy of the backend.
+
+Usage: PYTHONPATH=src python3 benchmarks/bench_db.py [db-config.py] [rows]
+
+Without a config file a temporary SQLite database is used. With a MySQL config the rows are inserted
+into a separate list, which is deleted afterwards.
+"""
+import os
+import sys
+import tempfile
+import time
+
+from ip.convert import CIDR
+from ip.db import TABLES, SQLiteBackend, connect
+
+BENCH_LIST = "Benchmark"
+
+
+def bench(backend, rows: int):
+    table_rows = [(x.ip, x.suffix, BENCH_LIST, "", 0) for x in (CIDR(prefix << 8, 24) for prefix in range(rows))]
+    results = {}
+    for strategy in type(backend).STRATEGIES:
+        for batch_size in (100, 1000, 10000):
+            start = time.perf_counter()
+            backend.insert_rows(TABLES[0], iter(table_rows), batch_size, strategy)
+            backend.commit()
+            seconds = time.perf_counter() - start
+            cursor = backend.cursor()
+            cursor.execute(backend.sql(f"DELETE FROM {TABLES[0]} WHERE list = %s"), (BENCH_LIST,))
+            cursor.close()
+            backend.commit()
+            results[f"{strategy}/{batch_size}"] = rows / seconds
+            print(f"{strategy:>12} batch={batch_size:<6}: {rows / seconds:12,.0f} rows/s")
+            if strategy == "load-data":
+                break  # no batches
+    return results
+
+
+def main(config_file: str = None, rows: int = 100_000):
+    if config_file:
+        config = {}
+        with open(config_file) as f:
+            exec(f.read(), config)
+        with connect(config, allow_local_infile=True) as backend:
+            return bench(backend, rows)
+    with tempfile.TemporaryDirectory() as tmp, SQLiteBackend.connect(os.path.join(tmp, "bench.sqlite")) as backend:
+        return bench(backend, rows)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], *map(int, sys.argv[2:3]))
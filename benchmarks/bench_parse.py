@@ -0,0 +1,37 @@
+"""Microbenchmark of line parsers: lines per second on czsk.csv for every ``--format``.
+
+Usage: PYTHONPATH=src python3 benchmarks/bench_parse.py [file] [repeat]
+"""
+import sys
+import timeit
+from os.path import abspath, dirname, join
+
+from ip.parse import PARSERS
+from ip.pipeline import PipelineStats, filter_chunks, parse_chunks, read_chunks
+
+ADDRESS_FILE = join(dirname(abspath(__file__)), "..", "czsk.csv")
+
+
+def main(file_name=ADDRESS_FILE, repeat=5):
+    chunks = list(filter_chunks(read_chunks(file_name)))
+    lines = sum(len(chunk) for chunk in chunks)
+    results = {}
+    for line_format in ("auto",) + tuple(PARSERS):
+        def parse():
+            for _ in parse_chunks(chunks, PipelineStats(), line_format):
+                pass
+        try:
+            parse()
+        except ValueError:
+            continue  # file is not in this format
+        seconds = min(timeit.repeat(parse, number=1, repeat=repeat))
+        results[line_format] = lines / seconds
+        print(f"{line_format:>10}: {lines / seconds:12,.0f} lines/s")
+    if "auto" in results:
+        for line_format, speed in list(results.items())[1:]:
+            print(f"{line_format:>10}: {speed / results['auto']:.1f}x auto")
+    return results
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], *map(int, sys.argv[2:3]))
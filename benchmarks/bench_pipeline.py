@@ -0,0 +1,163 @@
+"""Benchmark suite of the parse, aggregate and write stages on synthetic dbip-shaped inputs (see generate.py).
+
+Every stage is timed (best of ``--repeat`` runs) and its peak memory is measured by :mod:`tracemalloc` in one more
+run. Results are stored as JSON and may be compared with a previous run; the same stages run under
+pytest-benchmark from test_benchmarks.py.
+
+Usage: PYTHONPATH=src python3 benchmarks/bench_pipeline.py [--lines 10000 100000 ...] [--fragmentation F]
+       [--v6 RATIO] [--repeat N] [--data-dir DIR] [--output results.json] [--compare previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from os.path import abspath, dirname, exists, join
+from typing import Callable, Dict, List
+
+from generate import write_file
+from ip import aggregate_subnets
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.pipeline import Chunk, PipelineStats, aggregate_chunks, filter_chunks, parse_chunks, read_chunks
+from ip.writers import FORMATS, write_text
+
+
+@dataclass
+class Dataset:
+    file_name: str
+    output_dir: str
+    lines: int = 0
+    parsed: List[Chunk] = None
+    aggregated: List[Chunk] = None
+
+    def prepare(self):
+        """Computes inputs of the later stages"""
+        self.parsed = parse(self)
+        self.lines = sum(map(len, filter_chunks(read_chunks(self.file_name))))
+        self.aggregated = aggregate_streaming(self)
+
+
+def parse(data: Dataset, line_format: str = "auto") -> List[Chunk]:
+    return list(parse_chunks(filter_chunks(read_chunks(data.file_name)), PipelineStats(), line_format))
+
+
+def aggregate(data: Dataset) -> Chunk:
+    ranges = (CIDRSet(), CIDRv6Set())
+    for chunk in data.parsed:
+        for collected, parsed in zip(ranges, chunk):
+            collected.extend(parsed)
+    return aggregate_subnets(ranges[0]), aggregate_subnets(ranges[1])
+
+
+def aggregate_streaming(data: Dataset) -> List[Chunk]:
+    return list(aggregate_chunks(data.parsed, PipelineStats()))
+
+
+def writer(output_format: str) -> Callable[[Dataset], None]:
+    def write(data: Dataset):
+        write_text(join(data.output_dir, "output"), data.aggregated, False, "Benchmark", FORMATS[output_format])
+    return write
+
+
+STAGES: Dict[str, Callable[[Dataset], object]] = {
+    "parse": parse,
+    "parse-dbip-csv": lambda data: parse(data, "dbip-csv"),
+    "aggregate": aggregate,
+    "aggregate-streaming": aggregate_streaming,
+    "write-plain": writer("plain"),
+    "write-rsc": writer("rsc"),
+}
+
+
+def measure(stage: Callable[[Dataset], object], data: Dataset, repeat: int) -> Dict[str, float]:
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage(data)
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        stage(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": seconds, "lines_per_second": data.lines / seconds, "peak_bytes": peak}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=dirname(abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run(lines: List[int], fragmentation: float, v6_ratio: float, repeat: int, data_dir: str) -> dict:
+    results = []
+    for count in lines:
+        file_name = join(data_dir, f"dbip-{count}-{fragmentation}-{v6_ratio}.csv")
+        if not exists(file_name):
+            print(f"Generating {file_name}...")
+            write_file(file_name, count, v6_ratio=v6_ratio, fragmentation=fragmentation)
+        with tempfile.TemporaryDirectory() as output_dir:
+            data = Dataset(file_name, output_dir)
+            data.prepare()
+            for name, stage in STAGES.items():
+                result = {"lines": count, "fragmentation": fragmentation, "v6": v6_ratio, "stage": name,
+                          **measure(stage, data, repeat)}
+                results.append(result)
+                print(f"{count:>10,} {name:>20}: {result['seconds']:9.3f} s {result['lines_per_second']:12,.0f} lines/s"
+                      f" {result['peak_bytes'] / 2 ** 20:9.1f} MiB")
+    return {
+        "meta": {"date": datetime.now(timezone.utc).isoformat(timespec="seconds"), "commit": _git_commit(),
+                 "python": platform.python_version(), "platform": platform.platform(), "repeat": repeat},
+        "results": results,
+    }
+
+
+def compare(current: dict, previous: dict):
+    """Prints speed and memory of the current results relative to a previous run"""
+    def key(result):
+        return result["lines"], result["fragmentation"], result["v6"], result["stage"]
+
+    old = {key(result): result for result in previous["results"]}
+    print(f"Compared with {previous['meta'].get('commit') or previous['meta']['date']}:")
+    for result in current["results"]:
+        before = old.get(key(result))
+        if before:
+            print(f"{result['lines']:>10,} {result['stage']:>20}: {before['seconds'] / result['seconds']:6.2f}x speed"
+                  f" {result['peak_bytes'] / max(before['peak_bytes'], 1):6.2f}x memory")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", default=[10_000, 100_000],
+                        help="sizes of generated inputs, e.g. 10000 100000 1000000 10000000")
+    parser.add_argument("--fragmentation", type=float, default=0.5)
+    parser.add_argument("--v6", type=float, default=0.3, help="share of IPv6 lines")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", help="keeps generated inputs for later runs (default: temporary directory)")
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--compare", help="JSON file with results of a previous run")
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        results = run(args.lines, args.fragmentation, args.v6, args.repeat, data_dir)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return results
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
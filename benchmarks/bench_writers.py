@@ -0,0 +1,46 @@
+"""Microbenchmark of output formats: subnets per second for every format, with and without gzip,
+compared with formatting every subnet by ``str()``.
+
+Usage: PYTHONPATH=src python3 benchmarks/bench_writers.py [file] [repeat]
+"""
+import os
+import sys
+import tempfile
+import timeit
+from os.path import abspath, dirname, join
+
+from ip.pipeline import PipelineStats, aggregate_chunks, filter_chunks, parse_chunks, read_chunks
+from ip.writers import FORMATS, write_text
+
+ADDRESS_FILE = join(dirname(abspath(__file__)), "..", "czsk.csv")
+
+
+def main(file_name=ADDRESS_FILE, repeat=5):
+    stats = PipelineStats()
+    chunks = list(aggregate_chunks(parse_chunks(filter_chunks(read_chunks(file_name)), stats), stats))
+    subnets = stats.subnets_v4 + stats.subnets_v6
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        def per_subnet():
+            with open(join(directory, "str.txt"), "w") as f:
+                for chunk in chunks:
+                    for ranges in chunk:
+                        for x in ranges:
+                            f.write(f"{x}\n")
+
+        seconds = min(timeit.repeat(per_subnet, number=1, repeat=repeat))
+        results["str()"] = subnets / seconds
+        print(f"{'str()':>14}: {subnets / seconds:12,.0f} subnets/s")
+        for name, output_format in FORMATS.items():
+            for extension in ("", ".gz"):
+                out = join(directory, "out" + extension)
+                seconds = min(timeit.repeat(lambda: write_text(out, chunks, False, "Czech Republic", output_format),
+                                            number=1, repeat=repeat))
+                label = name + extension
+                results[label] = subnets / seconds
+                print(f"{label:>14}: {subnets / seconds:12,.0f} subnets/s ({os.path.getsize(out):,} B)")
+    return results
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], *map(int, sys.argv[2:3]))
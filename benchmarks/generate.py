@@ -0,0 +1,75 @@
+"""Generator of synthetic dbip-shaped inputs: sorted disjoint ranges ``first,last,COUNTRY``, IPv4 before IPv6.
+
+The address space is divided into aligned slots of a typical range size, one per line. A slot is used whole
+with probability ``1 - fragmentation``, so neighbouring whole slots merge into large subnets; otherwise the line
+is a random part of the slot with less aligned bounds, which splits into several subnets and leaves gaps.
+Countries change in runs.
+
+Usage: python3 benchmarks/generate.py OUTPUT LINES [--v6 RATIO] [--fragmentation RATIO] [--seed N]
+"""
+import argparse
+import random
+from socket import AF_INET6, inet_ntoa, inet_ntop
+from typing import Iterator, Sequence
+
+V6_BASE = 0x2A00 << 112  # 2a00::/12
+SLOT_BITS = {4: 8, 6: 80}  # typical sizes of dbip ranges: /24 and /48
+SPACE_BITS = {4: 32, 6: 116}
+
+
+def _slot_bits(family: int, lines: int) -> int:
+    return min(SLOT_BITS[family], SPACE_BITS[family] - max(lines - 1, 1).bit_length())
+
+
+def _format(family: int, address: int) -> str:
+    if family == 4:
+        return inet_ntoa(address.to_bytes(4, "big"))
+    return inet_ntop(AF_INET6, address.to_bytes(16, "big"))
+
+
+def generate_lines(lines: int, v6_ratio: float = 0.3, fragmentation: float = 0.5,
+                   countries: Sequence[str] = ("CZ", "SK"), seed: int = 0) -> Iterator[str]:
+    r = random.Random(seed)
+    country = countries[0]
+    lines_v6 = round(lines * v6_ratio)
+    for family, count in ((4, lines - lines_v6), (6, lines_v6)):
+        if not count:
+            continue
+        slot_bits = _slot_bits(family, count)
+        base = 0 if family == 4 else V6_BASE
+        for i in range(count):
+            start = base + (i << slot_bits)
+            end = start + (1 << slot_bits) - 1
+            if r.random() < fragmentation:
+                # bounds on a grid of 2..8 parts of the slot, like ranges of a few smaller blocks in dbip
+                levels = r.randint(1, 3)
+                parts, grid = 1 << levels, 1 << (slot_bits - levels)
+                first = r.randrange(parts)
+                last = r.randrange(first, parts)
+                start, end = start + first * grid, start + (last + 1) * grid - 1
+            if r.random() < 0.05:
+                country = r.choice(countries)
+            yield f"{_format(family, start)},{_format(family, end)},{country}"
+
+
+def write_file(file_name: str, lines: int, **options):
+    with open(file_name, "w") as f:
+        for line in generate_lines(lines, **options):
+            f.write(line)
+            f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output")
+    parser.add_argument("lines", type=int)
+    parser.add_argument("--v6", type=float, default=0.3, help="share of IPv6 lines (default: 0.3)")
+    parser.add_argument("--fragmentation", type=float, default=0.5,
+                        help="share of lines with unaligned bounds (default: 0.5)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_file(args.output, args.lines, v6_ratio=args.v6, fragmentation=args.fragmentation, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Stages of bench_pipeline.py under pytest-benchmark:
+
+PYTHONPATH=src python3 -m pytest benchmarks --benchmark-json=results.json [--benchmark-compare]
+"""
+from importlib.util import find_spec
+
+import pytest
+
+from bench_pipeline import STAGES, Dataset
+from generate import generate_lines, write_file
+from ip.pipeline import PipelineStats, aggregate_chunks, parse_chunks
+
+needs_benchmark = pytest.mark.skipif(find_spec("pytest_benchmark") is None, reason="pytest-benchmark is not installed")
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("bench")
+    data = Dataset(str(directory / "dbip.csv"), str(directory))
+    write_file(data.file_name, 10_000)
+    data.prepare()
+    return data
+
+
+@needs_benchmark
+@pytest.mark.parametrize("stage", STAGES)
+def test_stage(benchmark, dataset, stage):
+    benchmark(STAGES[stage], dataset)
+
+
+@pytest.mark.parametrize("fragmentation", [0, 0.5, 1])
+def test_generated_lines_are_sorted_and_disjoint(fragmentation):
+    lines = list(generate_lines(2000, v6_ratio=0.5, fragmentation=fragmentation))
+    stats = PipelineStats()
+    parsed = list(parse_chunks([lines], stats, "dbip-csv"))
+    for _ in aggregate_chunks(parsed, stats):
+        pass  # raises on unsorted input
+    union = PipelineStats()
+    for _ in aggregate_chunks(parsed, union, union=True):
+        pass
+    assert stats.lines_v4 == stats.lines_v6 == 1000
+    assert (stats.addresses_v4, stats.addresses_v6) == (union.addresses_v4, union.addresses_v6)  # disjoint
+    if fragmentation == 0:
+        assert stats.subnets_v4 + stats.subnets_v6 < 20
@@ -2,3 +2,4 @@ ADDRESS = "db.example.com"
 DB = "mydb"
 USER = "user"
 PASSWORD = "password1"
+# BACKEND = "sqlite"  # lokální SQLite databáze místo MySQL; DB je pak cesta k souboru
@@ -1,8 +1,9 @@
-import locale
 from collections import deque
-from typing import Tuple, Deque
+from itertools import chain
+from typing import TYPE_CHECKING, Tuple, Deque, Iterable, Iterator, List
 
-locale.setlocale(locale.LC_ALL, '')
+if TYPE_CHECKING:
+    from ip.pipeline import PipelineStats
 
 
 def filter_country(file_in: str, file_out: str, codes: Tuple[str, ...]):
@@ -12,7 +13,157 @@ def filter_country(file_in: str, file_out: str, codes: Tuple[str, ...]):
                 out.write(line)
 
 
-def aggregate_subnets(subnets: Deque, report=False):
+def aggregate_subnets(subnets: Iterable, report=False, union=False, stats: "PipelineStats" = None):
+    """Merges subnets into the shortest equivalent list of subnets in a single pass.
+
+    By default only buddy subnets (both halves of a common supernet) are merged and ``subnets`` must be sorted,
+    the same as in :func:`aggregate_subnets_reference`.
+    With ``union=True`` the input may be in any order and overlapping or adjacent ranges are joined as well.
+    A :class:`ip.cidrset.CIDRSet` input produces a ``CIDRSet`` of the same type, anything else a deque.
+    The number of merges is added to ``stats``, if given.
+    """
+    from ip.cidrset import CIDRSet
+
+    if isinstance(subnets, CIDRSet):
+        cls = subnets.CIDR_CLASS
+        pairs = subnets.pairs()
+    else:
+        iterator = iter(subnets)
+        first = next(iterator, None)
+        if first is None:
+            return deque()
+        cls = type(first)
+        pairs = ((subnet.prefix, subnet.suffix) for subnet in chain((first,), iterator))
+    if union:
+        merger = UnionMerger(cls.BITS)
+        pairs = sort_by_start(pairs, cls.BITS)
+    else:
+        merger = BuddyMerger(cls.BITS)
+    merged = _merge(merger, pairs)
+    if isinstance(subnets, CIDRSet):
+        subnets = type(subnets).from_pairs(merged)
+    else:
+        subnets = deque(cls(prefix, suffix) for prefix, suffix in merged)
+    if stats is not None:
+        stats.merges += merger.merges
+    if report:
+        if isinstance(subnets, CIDRSet):
+            _report_total(subnets.size())
+        else:
+            _report_total(sum(subnet.size() for subnet in subnets))
+    return subnets
+
+
+def _report_total(total: int):
+    print(f"Total number of addresses: {total:n}",
+          '' if total < 1e9 else f"~= {total:.2e}")
+
+
+class BuddyMerger:
+    """Carry-style merge of sorted ``(prefix, suffix)`` pairs that hands out finished subnets as early as possible.
+
+    Every new subnet is pushed onto a stack and merged with the top of the stack for as long as they are buddies,
+    just like a carry propagating through a binary counter.
+    The stack is released when the input leaves a gap or its top is a right half (neither can ever merge again),
+    so it holds at most ``bits + 1`` subnets of strictly decreasing size.
+    """
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.merges = 0  # pairs of buddies merged so far
+        self._stack = []
+        self._previous = -1
+
+    def push(self, prefix: int, suffix: int) -> List[Tuple[int, int]]:
+        """Adds next subnet; returns subnets which are final"""
+        if prefix <= self._previous:
+            raise ValueError(f"Input is not sorted; prefix {prefix} follows {self._previous}")
+        self._previous = prefix
+        bits = self.bits
+        stack = self._stack
+        finished = []
+        if stack:
+            top_prefix, top_suffix = stack[-1]
+            shift = bits - top_suffix
+            if (top_prefix >> shift << shift) + (1 << shift) != prefix >> (bits - suffix) << (bits - suffix):
+                finished, stack = stack, []  # a gap; nothing on the stack can merge any more
+        while stack and suffix:
+            top_prefix, top_suffix = stack[-1]
+            shift = bits - suffix + 1
+            if top_suffix != suffix or top_prefix >> shift != prefix >> shift:
+                break
+            stack.pop()
+            prefix = prefix >> shift << shift
+            suffix -= 1
+            self.merges += 1
+        stack.append((prefix, suffix))
+        if not suffix or prefix & (1 << (bits - suffix)):  # a right half can't grow any more
+            finished.extend(stack)
+            stack = []
+        self._stack = stack
+        return finished
+
+    def flush(self) -> List[Tuple[int, int]]:
+        """Returns all remaining subnets; call when the input is exhausted"""
+        finished, self._stack = self._stack, []
+        return finished
+
+
+class UnionMerger:
+    """Streaming counterpart of ``aggregate_subnets(union=True)`` for input sorted by prefix.
+
+    Overlapping and adjacent subnets are joined into one range, which is covered by the fewest subnets
+    as soon as a gap follows it.
+    """
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.merges = 0  # pushed subnets minus finished ones so far, the same as of BuddyMerger
+        self._start = -1
+        self._end = -2
+
+    def push(self, prefix: int, suffix: int) -> List[Tuple[int, int]]:
+        """Adds next subnet; returns subnets which are final"""
+        shift = self.bits - suffix
+        start = prefix >> shift << shift
+        if start < self._start:
+            raise ValueError(f"Input is not sorted; prefix {prefix} follows {self._start}")
+        end = start + (1 << shift) - 1
+        if start <= self._end + 1:
+            if end > self._end:
+                self._end = end
+            self.merges += 1
+            return []
+        finished = self.flush()
+        self._start, self._end = start, end
+        return finished
+
+    def flush(self) -> List[Tuple[int, int]]:
+        """Returns all remaining subnets; call when the input is exhausted"""
+        if self._end < 0:
+            return []
+        finished = list(split_range(self._start, self._end, self.bits))
+        self._end = -2
+        self.merges -= len(finished) - 1  # a joined range may need more subnets than one
+        return finished
+
+
+def _merge(merger, pairs: Iterable[Tuple[int, int]]) -> Iterator[Tuple[int, int]]:
+    for prefix, suffix in pairs:
+        yield from merger.push(prefix, suffix)
+    yield from merger.flush()
+
+
+def sort_by_start(pairs: Iterable[Tuple[int, int]], bits: int) -> List[Tuple[int, int]]:
+    """Returns subnets sorted by their first address; host bits of prefixes are cleared"""
+    return sorted((prefix >> (bits - suffix) << (bits - suffix), suffix) for prefix, suffix in pairs)
+
+
+def aggregate_subnets_reference(subnets: Deque, report=False):
+    """Original fixed-point implementation of :func:`aggregate_subnets`; repeats passes until nothing merges.
+
+    Kept for cross-checking the single-pass engine.
+    """
     subnets = subnets.copy()
     while True:
         did_merge = False
@@ -43,10 +194,20 @@ def aggregate_subnets(subnets: Deque, report=False):
 
 
 def lowest_bit_on(n):
-    for off in range(int.bit_length(n)):
-        if n & (1 << off):
-            return off
-    raise ValueError(f"No bit on in '{n}'!")
+    if not n:
+        raise ValueError(f"No bit on in '{n}'!")
+    return int.bit_length(n & -n) - 1
+
+
+def split_range(a: int, b: int, bits: int) -> Iterator[Tuple[int, int]]:
+    """Yields ``(prefix, suffix)`` of the fewest subnets that cover addresses ``a`` to ``b`` (inclusive)"""
+    end = b + 1
+    while a < end:
+        aligned = a & -a if a else 1 << bits  # largest subnet that can start at `a`
+        fitting = 1 << (int.bit_length(end - a) - 1)  # largest subnet that does not overshoot `b`
+        size = min(aligned, fitting)
+        yield a, bits + 1 - int.bit_length(size)
+        a += size
 
 
 if __name__ == '__main__':
@@ -0,0 +1,114 @@
+"""On-disk cache of aggregated subnets, so that unchanged inputs skip parsing and aggregation.
+
+Every entry holds the aggregated subnets of one address family as a fixed-layout binary file (a header followed by
+:meth:`ip.cidrset.CIDRSet.tobytes`) which is read back via :mod:`mmap`. Entries are keyed by a hash of the input
+file contents and of the options that affect the result. The least recently used entries are evicted
+when the cache grows over its size limit.
+"""
+import mmap
+import os
+import struct
+from typing import Optional, Tuple
+
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.pipeline import Chunk, PipelineStats
+
+DEFAULT_DIRECTORY = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "ip_aggregate")
+DEFAULT_MAX_BYTES = 256 << 20
+
+_MAGIC = b"IPAC"
+_VERSION = 1
+_HEADER = struct.Struct("<4sBxxxQQ")  # magic, version, number of subnets, number of original input lines
+_SUFFIX = ".bin"
+
+
+def _blake2b(data: bytes = b""):
+    import hashlib  # loads OpenSSL; not needed by runs without --cache
+
+    return hashlib.blake2b(data, digest_size=20)
+
+
+def hash_file(file_name: str) -> str:
+    digest = _blake2b()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class AggregateCache:
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(file_hash: str, **options) -> str:
+        """Returns key of a cache entry for input with hash ``file_hash`` processed with given options"""
+        description = repr((file_hash, sorted(options.items())))
+        return _blake2b(description.encode()).hexdigest()
+
+    def _path(self, key: str, cls) -> str:
+        return os.path.join(self.directory, f"{key}-{'v6' if cls is CIDRv6Set else 'v4'}{_SUFFIX}")
+
+    def get(self, key: str) -> Optional[Tuple[Chunk, PipelineStats]]:
+        """Returns cached subnets of both families and their statistics, or ``None`` when any of them is missing
+
+        Nothing is split or merged by a cached run, so ``ranges_split`` and ``merges`` of the statistics are zero.
+        """
+        stats = PipelineStats()
+        chunk = []
+        for cls in (CIDRSet, CIDRv6Set):
+            path = self._path(key, cls)
+            try:
+                ranges, lines = self._read(path, cls)
+            except (FileNotFoundError, ValueError):
+                return None
+            os.utime(path)  # mark as recently used
+            chunk.append(ranges)
+            if cls is CIDRSet:
+                stats.lines_v4, stats.subnets_v4, stats.addresses_v4 = lines, len(ranges), ranges.size()
+            else:
+                stats.lines_v6, stats.subnets_v6, stats.addresses_v6 = lines, len(ranges), ranges.size()
+        return (chunk[0], chunk[1]), stats
+
+    @staticmethod
+    def _read(path: str, cls) -> Tuple[CIDRSet, int]:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise ValueError(f"Poškozený soubor {path}")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                magic, version, count, lines = _HEADER.unpack_from(m)
+                if magic != _MAGIC or version != _VERSION or len(m) != _HEADER.size + count * cls.record_size():
+                    raise ValueError(f"Poškozený soubor {path}")
+                with memoryview(m) as view, view[_HEADER.size:] as records:
+                    return cls.frombytes(records, count), lines
+
+    def put(self, key: str, chunk: Chunk, stats: PipelineStats):
+        import tempfile
+
+        for ranges, lines in zip(chunk, (stats.lines_v4, stats.lines_v6)):
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(_HEADER.pack(_MAGIC, _VERSION, len(ranges), lines))
+                    f.write(ranges.tobytes())
+                os.replace(tmp_path, self._path(key, type(ranges)))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits into ``max_bytes``"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.unlink(path)
+            total -= size
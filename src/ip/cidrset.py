@@ -0,0 +1,271 @@
+import sys
+from array import array
+from bisect import bisect_right
+from heapq import merge
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+from ip import split_range
+from ip.convert import CIDR, CIDRv6
+
+_LOW_64 = (1 << 64) - 1
+
+Interval = Tuple[int, int]
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Joins overlapping and adjacent intervals ``(first, last)`` of a sorted sequence"""
+    out = []
+    for start, end in intervals:
+        if out and start <= out[-1][1] + 1:
+            if end > out[-1][1]:
+                out[-1] = out[-1][0], end
+        else:
+            out.append((start, end))
+    return out
+
+
+def intersect_intervals(a: List[Interval], b: List[Interval]) -> List[Interval]:
+    """Returns addresses in both ``a`` and ``b``; both sorted and disjoint"""
+    out = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start, end = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+        if start <= end:
+            out.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return out
+
+
+def subtract_intervals(a: List[Interval], b: List[Interval]) -> List[Interval]:
+    """Returns addresses of ``a`` not in ``b``; both sorted and disjoint"""
+    out = []
+    j = 0
+    for start, end in a:
+        while j < len(b) and b[j][1] < start:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] <= end:
+            if b[k][0] > start:
+                out.append((start, b[k][0] - 1))
+            start = max(start, b[k][1] + 1)
+            k += 1
+        if start <= end:
+            out.append((start, end))
+    return out
+
+
+class CIDRSet:
+    """Sequence of IPv4 subnets packed into parallel arrays of prefixes and suffixes.
+
+    Uses 5 bytes per subnet instead of a full :class:`CIDR` instance; the instances are created only
+    when the items are accessed.
+    """
+    CIDR_CLASS = CIDR
+
+    def __init__(self, subnets: Iterable[CIDR] = ()):
+        self._init_prefixes()
+        self._suffixes = array("B")
+        self.extend(subnets)
+
+    def _init_prefixes(self):
+        self._prefixes = array("I")
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[int, int]]):
+        out = cls()
+        out.extend_pairs(pairs)
+        return out
+
+    def append_pair(self, prefix: int, suffix: int):
+        self._prefixes.append(prefix)
+        self._suffixes.append(suffix)
+
+    def _prefix_at(self, index: int) -> int:
+        return self._prefixes[index]
+
+    def append(self, subnet: CIDR):
+        self.append_pair(subnet.prefix, subnet.suffix)
+
+    def extend(self, subnets: Iterable[CIDR]):
+        if type(subnets) is type(self):
+            self._extend_arrays(subnets)
+            return
+        for subnet in subnets:
+            self.append_pair(subnet.prefix, subnet.suffix)
+
+    def _arrays(self) -> Tuple[array, ...]:
+        return self._prefixes, self._suffixes
+
+    def _extend_arrays(self, other: "CIDRSet"):
+        for mine, theirs in zip(self._arrays(), other._arrays()):
+            mine.extend(theirs)
+
+    def extend_pairs(self, pairs: Iterable[Tuple[int, int]]):
+        for prefix, suffix in pairs:
+            self.append_pair(prefix, suffix)
+
+    def extend_ranges(self, starts: Sequence[int], ends: Sequence[int]) -> int:
+        """Appends the fewest subnets covering every range ``starts[i]``..``ends[i]``
+
+        See :func:`ip.vectorized.split_ranges`; columns may be NumPy arrays.
+        Returns how many ranges needed more than one subnet.
+        """
+        from ip.vectorized import split_ranges_counted
+
+        prefixes, suffixes, split = split_ranges_counted(starts, ends, self.CIDR_CLASS.BITS)
+        if hasattr(prefixes, "tolist"):  # NumPy arrays
+            prefixes, suffixes = prefixes.tolist(), suffixes.tolist()
+        self.extend_pairs(zip(prefixes, suffixes))
+        return split
+
+    @classmethod
+    def record_size(cls) -> int:
+        """Returns number of bytes per subnet in :meth:`tobytes`"""
+        return sum(a.itemsize for a in cls()._arrays())
+
+    def tobytes(self) -> bytes:
+        """Packs all subnets into fixed-layout little-endian bytes: array of prefixes followed by array of suffixes"""
+        out = []
+        for a in self._arrays():
+            if sys.byteorder == "big":
+                a = array(a.typecode, a)
+                a.byteswap()
+            out.append(a.tobytes())
+        return b"".join(out)
+
+    @classmethod
+    def frombytes(cls, data, count: int):
+        """Inverse of :meth:`tobytes`; ``data`` may be any buffer, e.g. a slice of :class:`mmap.mmap`"""
+        out = cls()
+        offset = 0
+        for a in out._arrays():
+            size = a.itemsize * count
+            a.frombytes(data[offset:offset + size])
+            if sys.byteorder == "big":
+                a.byteswap()
+            offset += size
+        return out
+
+    def pairs(self) -> Iterator[Tuple[int, int]]:
+        """Yields ``(prefix, suffix)`` of every subnet without creating :class:`CIDR` instances"""
+        return zip(self._prefixes, self._suffixes)
+
+    def size(self) -> int:
+        """Returns total number of addresses in all subnets"""
+        bits = self.CIDR_CLASS.BITS
+        return sum(1 << (bits - suffix) for suffix in self._suffixes)
+
+    def intervals(self) -> List[Interval]:
+        """Returns sorted disjoint intervals ``(first, last)`` of addresses in the subnets, which may be unsorted
+
+        Host bits of a prefix (e.g. ``192.168.0.1/24``) are ignored.
+        """
+        bits = self.CIDR_CLASS.BITS
+        starts = ((prefix >> (bits - suffix) << (bits - suffix), suffix) for prefix, suffix in self.pairs())
+        return merge_intervals(sorted((start, start + (1 << (bits - suffix)) - 1) for start, suffix in starts))
+
+    @classmethod
+    def from_intervals(cls, intervals: Iterable[Interval]):
+        """Returns the fewest subnets covering sorted disjoint intervals, see :func:`ip.split_range`"""
+        bits = cls.CIDR_CLASS.BITS
+        return cls.from_pairs(pair for start, end in intervals for pair in split_range(start, end, bits))
+
+    def _check_family(self, other: "CIDRSet"):
+        if self.CIDR_CLASS is not other.CIDR_CLASS:
+            raise TypeError(f"Nelze kombinovat {type(self).__name__} a {type(other).__name__}")
+
+    def union(self, other: "CIDRSet"):
+        """Returns the fewest subnets covering addresses of both sets; same for the other set operations"""
+        self._check_family(other)
+        return self.from_intervals(merge_intervals(merge(self.intervals(), other.intervals())))
+
+    def intersection(self, other: "CIDRSet"):
+        self._check_family(other)
+        return self.from_intervals(intersect_intervals(self.intervals(), other.intervals()))
+
+    def difference(self, other: "CIDRSet"):
+        self._check_family(other)
+        return self.from_intervals(subtract_intervals(self.intervals(), other.intervals()))
+
+    def complement(self):
+        """Returns all addresses of the family which are not in this set"""
+        return self.from_intervals(subtract_intervals([(0, (1 << self.CIDR_CLASS.BITS) - 1)], self.intervals()))
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    __invert__ = complement
+
+    def __len__(self):
+        return len(self._suffixes)
+
+    def __getitem__(self, index: int) -> CIDR:
+        if isinstance(index, slice):
+            out = type(self)()
+            for mine, theirs in zip(out._arrays(), self._arrays()):
+                mine.extend(theirs[index])
+            return out
+        return self.CIDR_CLASS(self._prefix_at(index), self._suffixes[index])
+
+    def _prefix_sequence(self) -> Sequence[int]:
+        return self._prefixes
+
+    def bisect(self, address: int) -> int:
+        """Returns index of the last subnet with prefix ``<= address`` or -1; the subnets must be sorted"""
+        return bisect_right(self._prefix_sequence(), address) - 1
+
+    def __iter__(self) -> Iterator[CIDR]:
+        cls = self.CIDR_CLASS
+        for prefix, suffix in self.pairs():
+            yield cls(prefix, suffix)
+
+    def __eq__(self, other):
+        if not isinstance(other, CIDRSet):
+            return NotImplemented
+        return self.CIDR_CLASS is other.CIDR_CLASS and list(self.pairs()) == list(other.pairs())
+
+    def __repr__(self):
+        return f"{type(self).__name__}([{', '.join(str(x) for x in self)}])"
+
+
+class CIDRv6Set(CIDRSet):
+    """Sequence of IPv6 subnets; every prefix is stored as two 64-bit halves."""
+    CIDR_CLASS = CIDRv6
+
+    def _init_prefixes(self):
+        self._high = array("Q")
+        self._low = array("Q")
+
+    def append_pair(self, prefix: int, suffix: int):
+        self._high.append(prefix >> 64)
+        self._low.append(prefix & _LOW_64)
+        self._suffixes.append(suffix)
+
+    def _prefix_at(self, index: int) -> int:
+        return self._high[index] << 64 | self._low[index]
+
+    def _arrays(self) -> Tuple[array, ...]:
+        return self._high, self._low, self._suffixes
+
+    def _prefix_sequence(self) -> Sequence[int]:
+        return _Prefixes(self)
+
+    def pairs(self) -> Iterator[Tuple[int, int]]:
+        return ((high << 64 | low, suffix) for high, low, suffix in zip(self._high, self._low, self._suffixes))
+
+
+class _Prefixes:
+    """Read-only sequence of prefixes of a :class:`CIDRv6Set` for :func:`bisect.bisect_right`"""
+    __slots__ = ("_ranges",)
+
+    def __init__(self, ranges: CIDRv6Set):
+        self._ranges = ranges
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def __getitem__(self, index: int) -> int:
+        return self._ranges._prefix_at(index)
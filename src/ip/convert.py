@@ -6,9 +6,9 @@ except ModuleNotFoundError:
     print("Je potřeba nainstalovat balík 'dataclasses' následujícím příkazem:\n"
           "pip3 install dataclasses\n")
     raise
-from operator import sub
+from socket import AF_INET6, inet_ntop
 
-from ip import lowest_bit_on
+from ip import split_range
 
 
 @dataclass
@@ -90,30 +90,7 @@ class CIDR:
     @classmethod
     def _from_two_addresses(cls, a: int, b: int):
         total_before = b - a + 1
-        prefix = a & b
-        mask = a ^ b
-        mask_length = int.bit_length(mask)
-        if a == prefix and (1 << mask_length) - 1 == mask:
-            out = [cls(prefix, cls.BITS - mask_length)]
-        else:
-            # not a proper subnet; need to find multiple subnets that cover the given range of addresses
-            sub_start = a
-            total_end = b + 1
-            out = []
-            while True:
-                next_subnet = cls(sub_start, cls.BITS - lowest_bit_on(sub_start))
-                if next_subnet.next_address() >= total_end:
-                    break
-                out.append(next_subnet)
-                sub_start = next_subnet.next_address()
-            remainder = total_end - sub_start
-            while remainder:
-                assert remainder > 0
-                next_subnet = cls(sub_start, cls.BITS + 1 - int.bit_length(remainder))
-                sub_start += next_subnet.size()
-                out.append(next_subnet)
-                remainder = total_end - sub_start
-
+        out = [cls(prefix, suffix) for prefix, suffix in split_range(a, b, cls.BITS)]
         total_after = sum(ip.size() for ip in out)
         assert total_before == total_after, f"{total_before} != {total_after}\n" \
                                             f"a = {a} = {bin(a)} ({cls._int2ip(a)})\n" \
@@ -153,16 +130,15 @@ class CIDRv6(CIDR):
     BITS = 128
     IP_PATTERN = re.compile(r"(?P<address>(?:[0-9A-Fa-f]{0,4}:){2,7}[0-9A-Fa-f]{0,4})(?:/(?P<suffix>\d+))?")
 
-    _IPV6_BLOCKS_OF_ZEROS = re.compile(r"(?:\W|^)0(?::0)+:?")
-
     @classmethod
     def _int2ip(cls, ip: int) -> str:
-        ip = ":".join(format((ip & ((1 << n) - 1)) >> (n - 16), "x") for n in range(128, 0, -16))
-        matches = [m.span() for m in re.finditer(cls._IPV6_BLOCKS_OF_ZEROS, ip)]
-        if matches:
-            start, end = max(matches, key=lambda t: -sub(*t))
-            return ip[:start] + "::" + ip[end:]
-        return ip
+        address = inet_ntop(AF_INET6, ip.to_bytes(16, "big"))
+        if "." in address:  # IPv4-mapped or compatible address; keep the hexadecimal notation after leading zeros
+            words = [ip >> 32 & 0xFFFF, ip >> 16 & 0xFFFF, ip & 0xFFFF]
+            while not words[0]:
+                words.pop(0)
+            address = "::" + ":".join(format(word, "x") for word in words)
+        return address
 
     @classmethod
     def _ip2int(cls, ip: str) -> int:
@@ -1,56 +1,241 @@
-from typing import Deque
+import os
+from itertools import islice
+from typing import Iterable, Iterator, Tuple
 
 from ip.convert import CIDR
 
-try:
-    import mysql.connector
-    from mysql.connector import Error
-    from mysql.connector.connection import MySQLConnection
-except ModuleNotFoundError as e:
-    if e.name == "mysql":
-        print("Je potřeba nainstalovat balík 'mysql-connector-python' následujícím příkazem:\n"
-              "pip3 install mysql-connector-python\n")
-    raise
+FIREWALL_LIST = "Country_IP_Allows"
+TABLES = ("address_list_ipv4", "address_list_ipv6")
+COLUMNS = ("address", "mask", "list", "comment", "disabled")
+BATCH_SIZE = 1000
 
 
-def create_connection(host_name, user_name, user_password, database):
-    print(f"Připojuji se k MySQL {host_name}, databáze {database}")
-    return mysql.connector.connect(
-        host=host_name,
-        user=user_name,
-        password=user_password,
-        db=database,
-        raise_on_warnings=True,
-    )
+class Backend:
+    """Wraps a DB-API connection; one instance is shared by all tables written during a run."""
+    PLACEHOLDER = "%s"
+    STRATEGIES = ("executemany", "values")
 
+    def __init__(self, connection):
+        self.connection = connection
 
-FIREWALL_LIST = "Country_IP_Allows"
+    def sql(self, query: str) -> str:
+        """Adapts ``%s`` placeholders to the placeholder style of the backend"""
+        if self.PLACEHOLDER == "%s":
+            return query
+        return query.replace("%s", self.PLACEHOLDER)
 
+    def cursor(self):
+        return self.connection.cursor()
 
-def insert_into(connection: MySQLConnection, table, ip_ranges: Deque[CIDR], comment: str, delete_old: bool = False):
-    try:
-        count_where_list = f"SELECT COUNT(*) FROM {table} WHERE list = %s"
-        cursor = connection.cursor()
-        cursor.execute(count_where_list, (FIREWALL_LIST,))
-        old_count = cursor.fetchone()[0]
-        cursor.close()
-        if not delete_old:
-            print(f"Před vložením nových dat je v tabulce {table} {old_count} řádků.")
-        else:
-            print(f"Z tabulky {table} bude odstraněno {old_count} řádků.")
-            delete_where_list = f"DELETE FROM {table} WHERE list = %s"
-            cursor = connection.cursor()
-            cursor.execute(delete_where_list, (FIREWALL_LIST,))
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        self.connection.close()
+
+    def executemany(self, query: str, rows: list):
+        cursor = self.cursor()
+        try:
+            cursor.executemany(self.sql(query), rows)
+        finally:
             cursor.close()
 
-        insert_query = (f"INSERT INTO {table} (address, mask, list, comment, disabled) "
-                        "VALUES (%s, %s, %s, %s, %s)")
-        cursor = connection.cursor()
-        cursor.executemany(insert_query,
-                           [(ip.ip, ip.suffix, FIREWALL_LIST, comment, 0) for ip in ip_ranges])
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def insert_rows(self, table: str, rows: Iterable[tuple], batch_size: int = BATCH_SIZE,
+                    strategy: str = "executemany") -> int:
+        """Inserts rows with :data:`COLUMNS` from a generator in batches of at most ``batch_size`` rows
+
+        Doesn't commit. Returns the number of inserted rows.
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Strategy '{strategy}' is not supported by {type(self).__name__}; "
+                             f"use one of {self.STRATEGIES}")
+        insert = f"INSERT INTO {table} ({', '.join(COLUMNS)}) VALUES "
+        values = "(" + ", ".join(["%s"] * len(COLUMNS)) + ")"
+        count = 0
+        for batch in _batches(rows, self._batch_size(batch_size, strategy)):
+            if strategy == "values":  # a single multi-row INSERT per batch
+                cursor = self.cursor()
+                try:
+                    cursor.execute(self.sql(insert + ", ".join([values] * len(batch))),
+                                   [value for row in batch for value in row])
+                finally:
+                    cursor.close()
+            else:
+                self.executemany(insert + values, batch)
+            count += len(batch)
+        return count
+
+    def _batch_size(self, batch_size: int, strategy: str) -> int:
+        return batch_size
+
+
+class MySQLBackend(Backend):
+    STRATEGIES = Backend.STRATEGIES + ("load-data",)
+
+    @classmethod
+    def connect(cls, host_name, user_name, user_password, database, allow_local_infile: bool = False):
+        try:
+            import mysql.connector
+        except ModuleNotFoundError as e:
+            if e.name == "mysql":
+                print("Je potřeba nainstalovat balík 'mysql-connector-python' následujícím příkazem:\n"
+                      "pip3 install mysql-connector-python\n")
+            raise
+        print(f"Připojuji se k MySQL {host_name}, databáze {database}")
+        return cls(mysql.connector.connect(
+            host=host_name,
+            user=user_name,
+            password=user_password,
+            db=database,
+            raise_on_warnings=True,
+            allow_local_infile=allow_local_infile,
+        ))
+
+    def insert_rows(self, table: str, rows: Iterable[tuple], batch_size: int = BATCH_SIZE,
+                    strategy: str = "executemany") -> int:
+        if strategy == "load-data":
+            return self._load_data(table, rows)
+        return super().insert_rows(table, rows, batch_size, strategy)
+
+    def _load_data(self, table: str, rows: Iterable[tuple]) -> int:
+        """Bulk load via ``LOAD DATA LOCAL INFILE``; the server must allow ``local_infile``"""
+        import tempfile
+
+        count = 0
+        with tempfile.NamedTemporaryFile("w", suffix=".tsv", delete=False) as f:
+            try:
+                for row in rows:
+                    f.write("\t".join(str(value) for value in row))
+                    f.write("\n")
+                    count += 1
+                f.close()
+                cursor = self.cursor()
+                try:
+                    cursor.execute(f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} "
+                                   f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({', '.join(COLUMNS)})",
+                                   (f.name,))
+                finally:
+                    cursor.close()
+            finally:
+                os.unlink(f.name)
+        return count
+
+
+class SQLiteBackend(Backend):
+    """Local stand-in for MySQL; creates the tables if they don't exist."""
+    PLACEHOLDER = "?"
+    MAX_VARIABLES = 999  # the lowest limit of bound parameters among SQLite versions
+
+    @classmethod
+    def connect(cls, database: str):
+        import sqlite3
+
+        print(f"Připojuji se k SQLite databázi {database}")
+        connection = sqlite3.connect(database)
+        for table in TABLES:
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, address TEXT NOT NULL, "
+                               "mask INTEGER NOT NULL, list TEXT NOT NULL, comment TEXT, "
+                               "disabled INTEGER NOT NULL DEFAULT 0)")
         connection.commit()
+        return cls(connection)
+
+    def _batch_size(self, batch_size: int, strategy: str) -> int:
+        if strategy == "values":
+            return min(batch_size, self.MAX_VARIABLES // len(COLUMNS))
+        return batch_size
+
+
+def connect(config: dict, allow_local_infile: bool = False) -> Backend:
+    """Connects to the DB described by variables of a config file: ``BACKEND`` ("mysql" or "sqlite"), ``DB``,
+    and for MySQL also ``ADDRESS``, ``USER``, ``PASSWORD``"""
+    backend = config.get("BACKEND", "mysql")
+    if backend == "sqlite":
+        return SQLiteBackend.connect(config["DB"])
+    if backend == "mysql":
+        return MySQLBackend.connect(config["ADDRESS"], config["USER"], config["PASSWORD"], config["DB"],
+                                    allow_local_infile=allow_local_infile)
+    raise ValueError(f"Neznámý typ databáze BACKEND = '{backend}'")
+
+
+def _batches(rows: Iterable[tuple], batch_size: int) -> Iterator[list]:
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def to_rows(ip_ranges: Iterable[CIDR], comment: str) -> Iterator[tuple]:
+    """Yields rows with :data:`COLUMNS`"""
+    return ((ip.ip, ip.suffix, FIREWALL_LIST, comment, 0) for ip in ip_ranges)
+
+
+def clear_list(backend: Backend, table, delete_old: bool = False):
+    """Reports the number of rows in the list and deletes them if ``delete_old``; doesn't commit"""
+    cursor = backend.cursor()
+    cursor.execute(backend.sql(f"SELECT COUNT(*) FROM {table} WHERE list = %s"), (FIREWALL_LIST,))
+    old_count = cursor.fetchone()[0]
+    cursor.close()
+    if not delete_old:
+        print(f"Před vložením nových dat je v tabulce {table} {old_count} řádků.")
+    else:
+        print(f"Z tabulky {table} bude odstraněno {old_count} řádků.")
+        cursor = backend.cursor()
+        cursor.execute(backend.sql(f"DELETE FROM {table} WHERE list = %s"), (FIREWALL_LIST,))
         cursor.close()
-        print(f"Bylo vloženo {len(ip_ranges)} řádků.")
-    except mysql.connector.Error:
-        connection.rollback()
+
+
+def insert_into(backend: Backend, table, ip_ranges: Iterable[CIDR], comment: str, delete_old: bool = False,
+                batch_size: int = BATCH_SIZE, strategy: str = "executemany") -> int:
+    try:
+        clear_list(backend, table, delete_old)
+        count = backend.insert_rows(table, to_rows(ip_ranges, comment), batch_size, strategy)
+        backend.commit()
+    except Exception:
+        backend.rollback()
+        raise
+    print(f"Bylo vloženo {count} řádků.")
+    return count
+
+
+def sync_into(backend: Backend, table, ip_ranges: Iterable[CIDR], comment: str,
+              batch_size: int = BATCH_SIZE) -> Tuple[int, int]:
+    """Makes rows of the list with given comment equal to ``ip_ranges`` by inserting and deleting only the changes
+
+    Changes are committed in transactions of at most ``batch_size`` rows; new rows are inserted before old ones
+    are deleted, so the list is never empty in the meantime. Returns numbers of added and removed rows.
+    """
+    cursor = backend.cursor()
+    cursor.execute(backend.sql(f"SELECT address, mask FROM {table} WHERE list = %s AND comment = %s"),
+                   (FIREWALL_LIST, comment))
+    old_rows = {(address, int(mask)) for address, mask in cursor.fetchall()}
+    cursor.close()
+    new_rows = {(ip.ip, ip.suffix) for ip in ip_ranges}
+    added = sorted(new_rows - old_rows)
+    removed = sorted(old_rows - new_rows)
+
+    delete_query = f"DELETE FROM {table} WHERE address = %s AND mask = %s AND list = %s AND comment = %s"
+    try:
+        for batch in _batches(((address, mask, FIREWALL_LIST, comment, 0) for address, mask in added), batch_size):
+            backend.insert_rows(table, batch, batch_size)
+            backend.commit()
+        for batch in _batches(((address, mask, FIREWALL_LIST, comment) for address, mask in removed), batch_size):
+            backend.executemany(delete_query, batch)
+            backend.commit()
+    except Exception:
+        backend.rollback()
         raise
+    print(f"V tabulce {table} bylo přidáno {len(added)} a odstraněno {len(removed)} řádků, "
+          f"beze změny zůstalo {len(old_rows) - len(removed)} řádků.")
+    return len(added), len(removed)
+
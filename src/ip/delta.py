@@ -0,0 +1,209 @@
+"""Incremental update of aggregated subnets by the difference between two versions of the raw input.
+
+Aggregation of disjoint ranges is the unique cover of their addresses by the largest aligned subnets, and every
+contiguous run of addresses is covered independently. Changed ranges are therefore applied only to the runs of
+the previous aggregated subnets which they touch; those runs are split into intervals, the removed addresses are
+cut out, the added ones joined in and the result covered again by :func:`ip.split_range`. All other subnets are
+copied unchanged. The changed lines are found by one pass over both inputs, see :func:`diff_lines`.
+"""
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+from ip.cidrset import CIDRSet, CIDRv6Set, merge_intervals, subtract_intervals
+from ip.parse import detect_format, first_address
+from ip.pipeline import Chunk, PipelineStats, filter_chunks, parse_chunks, read_chunks, read_ranges
+
+
+@dataclass
+class Delta:
+    """New aggregated subnets and the subnets added to and removed from the previous ones"""
+    ranges: Chunk = field(default_factory=lambda: (CIDRSet(), CIDRv6Set()))
+    added: Chunk = field(default_factory=lambda: (CIDRSet(), CIDRv6Set()))
+    removed: Chunk = field(default_factory=lambda: (CIDRSet(), CIDRv6Set()))
+    lines_added: int = 0
+    lines_removed: int = 0
+
+
+def apply_delta(aggregated: CIDRSet, removed: CIDRSet, added: CIDRSet) -> Tuple[CIDRSet, CIDRSet, CIDRSet]:
+    """Removes addresses of ``removed`` from sorted aggregated subnets and adds those of ``added``
+
+    Returns the new aggregated subnets and the subnets added to and removed from ``aggregated``.
+    """
+    cls = type(aggregated)
+    # (first, last, is_added) of every change
+    changes = sorted([(start, end, False) for start, end in removed.intervals()] +
+                     [(start, end, True) for start, end in added.intervals()])
+    out, out_added, out_removed = cls(), cls(), cls()
+    n = len(aggregated)
+
+    def end_of(index: int) -> int:
+        subnet = aggregated[index]
+        return subnet.prefix + subnet.size() - 1
+
+    position = 0  # subnets before this index are already in `out`
+    k = 0
+    while k < len(changes):
+        first = k
+        low, high, _ = changes[k]
+        # the window starts with the run of contiguous subnets touching the change
+        i = max(aggregated.bisect(low), position)
+        if i < n and end_of(i) + 1 < low:
+            i += 1
+        while position < i < n and end_of(i - 1) + 1 == aggregated[i].prefix:
+            i -= 1
+        # and it extends over all subnets and changes touching it
+        j = i
+        while True:
+            while j < n and aggregated[j].prefix <= high + 1:
+                high = max(high, end_of(j))
+                j += 1
+            if k + 1 < len(changes) and changes[k + 1][0] <= high + 1:
+                k += 1
+                high = max(high, changes[k][1])
+                continue
+            break
+        k += 1
+        old = aggregated[i:j]
+        window = changes[first:k]
+        intervals = subtract_intervals(old.intervals(), [(start, end) for start, end, is_added in window
+                                                         if not is_added])
+        intervals = merge_intervals(sorted(intervals + [(start, end) for start, end, is_added in window if is_added]))
+        new = cls.from_intervals(intervals)
+        out.extend(aggregated[position:i])
+        out.extend(new)
+        position = j
+        old_pairs, new_pairs = set(old.pairs()), set(new.pairs())
+        out_added.extend_pairs(pair for pair in new.pairs() if pair not in old_pairs)
+        out_removed.extend_pairs(pair for pair in old.pairs() if pair not in new_pairs)
+    out.extend(aggregated[position:])
+    return out, out_added, out_removed
+
+
+class _Cursor:
+    """Position in the stripped lines of a file which is read chunk by chunk"""
+
+    def __init__(self, file_name: str, filter_str: str, key: Callable[[str], Optional[Tuple[int, int]]]):
+        self._chunks = filter_chunks(read_chunks(file_name), filter_str)
+        self._lines: List[str] = []
+        self._index = 0
+        self._key = key
+        self._current_key = _UNKNOWN
+        self.previous: Optional[str] = None
+
+    @property
+    def line(self) -> Optional[str]:
+        """Returns the current line, ``None`` at the end of the file"""
+        while self._index == len(self._lines):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return None
+            self._lines, self._index = chunk, 0
+        return self._lines[self._index]
+
+    @property
+    def key(self) -> Optional[Tuple[int, int]]:
+        if self._current_key is _UNKNOWN:
+            self._current_key = self._key(self.line)
+        return self._current_key
+
+    def advance(self):
+        self.previous = self._lines[self._index]
+        self._index += 1
+        self._current_key = _UNKNOWN
+
+
+_UNKNOWN = object()
+
+
+def _line_key(line: str, line_format: str, key_format: str) -> Optional[Tuple[int, int]]:
+    """Returns ``(family, first address)`` of the range on a line, ``None`` for a line without a range
+
+    ``key_format`` is the format detected for an ``"auto"`` input, which allows to read just the first address.
+    """
+    if key_format in ("dbip-csv", "cidr-list"):
+        try:
+            is_v6, address = first_address(line, key_format)
+            return int(is_v6), address
+        except ValueError:
+            if line_format != "auto":
+                raise
+    for family, ranges in enumerate(next(parse_chunks([[line]], PipelineStats(), line_format))):
+        if ranges:
+            return family, ranges[0].prefix
+    return None
+
+
+def _precedes(key: Optional[Tuple[int, int]], other: Optional[Tuple[int, int]]) -> bool:
+    """Lines without a range (headers, comments) precede all ranges"""
+    return other is not None and (key is None or key < other)
+
+
+def diff_lines(old_input: str, new_input: str, delta: Delta, stats: PipelineStats, filter_str: str = None,
+               line_format: str = "auto") -> Tuple[List[str], List[str]]:
+    """Walks both inputs sorted by first address at once and returns their removed and added lines
+
+    Equal lines are only compared as strings; lines are parsed just to order the differing ones and to count
+    the lines of ``new_input`` into ``stats``. An unsorted input gives more changed lines, not a wrong result.
+    A removed line is not returned while an equal duplicate line stays, because its addresses are still covered;
+    it is counted in ``delta`` nevertheless.
+    """
+    key_format = line_format
+    if line_format == "auto":
+        first_chunk = next(filter_chunks(read_chunks(new_input), filter_str), [])
+        key_format = detect_format(first_chunk)
+    old = _Cursor(old_input, filter_str, lambda line: _line_key(line, line_format, key_format))
+    new = _Cursor(new_input, filter_str, lambda line: _line_key(line, line_format, key_format))
+    removed, added = [], []
+    lines = [0, 0]
+    while True:
+        old_line, new_line = old.line, new.line
+        if old_line is None and new_line is None:
+            break
+        if old_line == new_line:
+            remove = add = False
+        elif new_line is None or (old_line is not None and _precedes(old.key, new.key)):
+            remove, add = True, False
+        elif old_line is None or _precedes(new.key, old.key):
+            remove, add = False, True
+        else:  # the same first address, e.g. a changed end or country
+            remove = add = True
+        if remove:
+            delta.lines_removed += 1
+            if old_line not in (new.previous, new_line):
+                removed.append(old_line)
+        if add:
+            delta.lines_added += 1
+            added.append(new_line)
+        if remove or not add:
+            old.advance()
+        if add or not remove:
+            if new.key is not None:
+                lines[new.key[0]] += 1
+            new.advance()
+    stats.lines_v4 += lines[0]
+    stats.lines_v6 += lines[1]
+    return removed, added
+
+
+def update_aggregated(previous_output: str, old_input: str, new_input: str, filter_str: str = None,
+                      line_format: str = "auto") -> Tuple[Delta, PipelineStats]:
+    """Applies the difference between ``old_input`` and ``new_input`` to subnets aggregated from ``old_input``
+
+    ``previous_output`` is a list of subnets, one per line, as written for ``old_input`` without ``--append``,
+    i.e. sorted. Ranges of both inputs must not overlap each other, as in dbip dumps; duplicate lines are allowed.
+    Both inputs and the previous output are read once in a linear pass; only the changed lines are parsed in
+    full and only the runs of subnets they touch are aggregated again, see :func:`apply_delta`.
+    """
+    stats = PipelineStats()
+    delta = Delta()
+    removed_lines, added_lines = diff_lines(old_input, new_input, delta, stats, filter_str, line_format)
+    previous = read_ranges(previous_output, "cidr-list")
+    removed = next(parse_chunks([removed_lines], PipelineStats(), line_format))
+    added = next(parse_chunks([added_lines], PipelineStats(), line_format))
+    for family in range(2):
+        for result, ranges in zip((delta.ranges, delta.added, delta.removed),
+                                  apply_delta(previous[family], removed[family], added[family])):
+            result[family].extend(ranges)
+    stats.subnets_v4, stats.subnets_v6 = map(len, delta.ranges)
+    stats.addresses_v4, stats.addresses_v6 = (ranges.size() for ranges in delta.ranges)
+    return delta, stats
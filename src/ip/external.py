@@ -0,0 +1,136 @@
+"""External merge sort of parsed subnets, so that unsorted inputs larger than memory aggregate with bounded memory.
+
+Subnets of every address family are collected up to ``run_size``; a full buffer is sorted and spilled into
+a temporary file as a run of blocks packed by :meth:`ip.cidrset.CIDRSet.tobytes`. Runs are read back block by
+block and merged by :func:`heapq.merge`; whenever ``fan_in`` runs of the same number of merge passes exist,
+they are merged into one right away, so open files grow only logarithmically with the input. The final sorted
+stream is aggregated on the fly by :class:`ip.UnionMerger`. Overlapping and adjacent subnets are
+therefore joined, the same as by ``aggregate_subnets(union=True)``.
+"""
+import struct
+from heapq import merge
+from typing import BinaryIO, Iterable, Iterator, List, Tuple, Type
+
+from ip import UnionMerger, sort_by_start
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.pipeline import CHUNK_SIZE, RUN_SIZE, Chunk, PipelineStats, count_chunk
+
+FAN_IN = 64  # runs merged at once
+BLOCK_SIZE = CHUNK_SIZE  # subnets per block of a run
+
+_COUNT = struct.Struct("<I")
+_CLASSES: Tuple[Type[CIDRSet], ...] = (CIDRSet, CIDRv6Set)
+
+
+def _sorted(ranges: CIDRSet) -> List[Tuple[int, int]]:
+    return sort_by_start(ranges.pairs(), ranges.CIDR_CLASS.BITS)
+
+
+def _write_run(f: BinaryIO, pairs: Iterable[Tuple[int, int]], cls: Type[CIDRSet]):
+    block = cls()
+    for pair in pairs:
+        block.append_pair(*pair)
+        if len(block) >= BLOCK_SIZE:
+            f.write(_COUNT.pack(len(block)))
+            f.write(block.tobytes())
+            block = cls()
+    if block:
+        f.write(_COUNT.pack(len(block)))
+        f.write(block.tobytes())
+
+
+def _read_run(f: BinaryIO, cls: Type[CIDRSet]) -> Iterator[Tuple[int, int]]:
+    record_size = cls.record_size()
+    f.seek(0)
+    while True:
+        header = f.read(_COUNT.size)
+        if not header:
+            return
+        count, = _COUNT.unpack(header)
+        yield from cls.frombytes(f.read(count * record_size), count).pairs()
+
+
+class ExternalSorter:
+    """Sorts ``(prefix, suffix)`` of both families by spilling sorted runs into temporary files"""
+
+    def __init__(self, run_size: int = RUN_SIZE, directory: str = None, fan_in: int = FAN_IN):
+        self.run_size = run_size
+        self.directory = directory
+        self.fan_in = fan_in
+        self.runs: Tuple[List[BinaryIO], List[BinaryIO]] = ([], [])
+        # merge passes every run has been through; ``fan_in`` runs of one level are merged into the next one as
+        # soon as they exist, so at most ``fan_in - 1`` runs of every level are open at a time
+        self._levels: Tuple[List[int], List[int]] = ([], [])
+        self._buffers = [CIDRSet(), CIDRv6Set()]
+
+    def push(self, chunk: Chunk):
+        for family, ranges in enumerate(chunk):
+            buffer = self._buffers[family]
+            buffer.extend(ranges)
+            if len(buffer) >= self.run_size:
+                self._spill(family, _sorted(buffer))
+                self._buffers[family] = _CLASSES[family]()
+
+    def _spill(self, family: int, pairs: Iterable[Tuple[int, int]], level: int = 0):
+        import tempfile
+
+        f = tempfile.TemporaryFile(dir=self.directory)
+        _write_run(f, pairs, _CLASSES[family])
+        runs, levels = self.runs[family], self._levels[family]
+        runs.append(f)
+        levels.append(level)
+        if len(runs) >= self.fan_in and levels[-self.fan_in] == level:
+            self._merge_last(family, level + 1)
+
+    def _merge_last(self, family: int, level: int):
+        """Replaces the last ``fan_in`` runs by a single run merged from them"""
+        runs, levels = self.runs[family], self._levels[family]
+        group = runs[-self.fan_in:]
+        del runs[-self.fan_in:], levels[-self.fan_in:]
+        try:
+            self._spill(family, merge(*(_read_run(f, _CLASSES[family]) for f in group)), level)
+        finally:
+            for f in group:
+                f.close()
+
+    def sorted_pairs(self, family: int) -> Iterator[Tuple[int, int]]:
+        """Returns all pushed subnets of the family in sorted order; call when the input is exhausted"""
+        runs, levels = self.runs[family], self._levels[family]
+        while len(runs) >= self.fan_in:
+            self._merge_last(family, levels[-self.fan_in] + 1)
+        return merge(_sorted(self._buffers[family]), *(_read_run(f, _CLASSES[family]) for f in runs))
+
+    def close(self):
+        for runs, levels in zip(self.runs, self._levels):
+            for f in runs:
+                f.close()
+            runs.clear()
+            levels.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def aggregate_unsorted(chunks: Iterable[Chunk], stats: PipelineStats, run_size: int = RUN_SIZE,
+                       directory: str = None, chunk_size: int = CHUNK_SIZE) -> Iterator[Chunk]:
+    """Aggregates parsed chunks in any order with memory bounded by ``run_size``; see the module docstring
+
+    Nothing is yielded before the whole input has been read, then IPv4 subnets come before IPv6.
+    """
+    with ExternalSorter(run_size, directory) as sorter:
+        for chunk in chunks:
+            sorter.push(chunk)
+        for family, cls in enumerate(_CLASSES):
+            merger = UnionMerger(cls.CIDR_CLASS.BITS)
+            out = cls()
+            for prefix, suffix in sorter.sorted_pairs(family):
+                out.extend_pairs(merger.push(prefix, suffix))
+                if len(out) >= chunk_size:
+                    yield count_chunk(stats, (out, CIDRv6Set()) if family == 0 else (CIDRSet(), out))
+                    out = cls()
+            out.extend_pairs(merger.flush())
+            stats.merges += merger.merges
+            yield count_chunk(stats, (out, CIDRv6Set()) if family == 0 else (CIDRSet(), out))
@@ -0,0 +1,297 @@
+"""Lookup of addresses in aggregated subnets, e.g. "is this IP in the CZ/SK allow-list?".
+
+:class:`LookupIndex` keeps disjoint address ranges in sorted arrays and answers lookups by bisection
+(or by ``numpy.searchsorted`` for batches of IPv4 integers). :class:`PrefixTrie` is a path-compressed binary trie
+for longest-prefix match of possibly nested subnets. Both carry a payload (country or comment) with every subnet
+and both can be saved to and loaded from the same compact binary file.
+
+Usage: PYTHONPATH=src python3 -m ip.lookup INDEX [ADDRESS ...]  (reads addresses from stdin when none are given)
+"""
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from socket import AF_INET, AF_INET6, inet_pton
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from ip import split_range
+from ip.cidrset import CIDRSet, CIDRv6Set
+
+Entries = Iterable[Tuple[str, CIDRSet]]
+
+_MAGIC = b"IPLX"
+_VERSION = 1
+_HEADER = struct.Struct("<4sBxxxIII")  # magic, version, number of payloads, IPv4 and IPv6 subnets
+
+
+def _parse(address: Union[str, int], ipv6: bool = False) -> Tuple[bool, int]:
+    """Returns ``(is_ipv6, address)``; integers are IPv4 unless ``ipv6``
+
+    Raises :class:`ValueError` for a malformed address.
+    """
+    if isinstance(address, str):
+        address = address.strip()
+        ipv6 = ":" in address
+        try:
+            return ipv6, int.from_bytes(inet_pton(AF_INET6 if ipv6 else AF_INET, address), "big")
+        except OSError:
+            raise ValueError(f"Neplatná IP adresa '{address}'") from None
+    return ipv6, int(address)
+
+
+def _group(entries: Entries) -> Tuple[List[str], Tuple[List[Tuple[int, int, int]], List[Tuple[int, int, int]]]]:
+    """Converts subnets of every payload to ``(payload id, prefix, suffix)`` of both families"""
+    payloads: Dict[str, int] = {}
+    records = ([], [])
+    for payload, ranges in entries:
+        payload_id = payloads.setdefault(payload, len(payloads))
+        family = isinstance(ranges, CIDRv6Set)
+        records[family].extend((payload_id, prefix, suffix) for prefix, suffix in ranges.pairs())
+    return list(payloads), records
+
+
+def save_entries(file_name: str, entries: Entries):
+    """Writes subnets with their payloads into a compact binary file"""
+    payloads, records = _group(entries)
+    with open(file_name, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(payloads), len(records[0]), len(records[1])))
+        for payload in payloads:
+            encoded = payload.encode()
+            f.write(struct.pack("<H", len(encoded)))
+            f.write(encoded)
+        for cls, family_records in zip((CIDRSet, CIDRv6Set), records):
+            f.write(cls.from_pairs((prefix, suffix) for _, prefix, suffix in family_records).tobytes())
+            payload_ids = array("H", (payload_id for payload_id, _, _ in family_records))
+            if sys.byteorder == "big":
+                payload_ids.byteswap()
+            f.write(payload_ids.tobytes())
+
+
+def load_entries(file_name: str) -> Iterator[Tuple[str, CIDRSet]]:
+    """Inverse of :func:`save_entries`"""
+    with open(file_name, "rb") as f:
+        data = memoryview(f.read())
+    magic, version, payload_count, *counts = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"Soubor {file_name} není index IP adres (verze {_VERSION})")
+    offset = _HEADER.size
+    payloads = []
+    for _ in range(payload_count):
+        length, = struct.unpack_from("<H", data, offset)
+        payloads.append(bytes(data[offset + 2:offset + 2 + length]).decode())
+        offset += 2 + length
+    for cls, count in zip((CIDRSet, CIDRv6Set), counts):
+        size = cls.record_size() * count
+        ranges = cls.frombytes(data[offset:offset + size], count)
+        offset += size
+        payload_ids = array("H")
+        payload_ids.frombytes(data[offset:offset + 2 * count])
+        if sys.byteorder == "big":
+            payload_ids.byteswap()
+        offset += 2 * count
+        by_payload = [cls() for _ in payloads]
+        for payload_id, (prefix, suffix) in zip(payload_ids, ranges.pairs()):
+            by_payload[payload_id].append_pair(prefix, suffix)
+        for payload, payload_ranges in zip(payloads, by_payload):
+            if payload_ranges:
+                yield payload, payload_ranges
+
+
+class LookupIndex:
+    """Disjoint address ranges of both families in sorted arrays; adjacent ranges of equal payload are joined."""
+
+    def __init__(self, entries: Entries = ()):
+        self.payloads, records = _group(entries)
+        # per family: first addresses, last addresses and payload ids of the ranges
+        self._starts = (array("I"), [])
+        self._ends = (array("I"), [])
+        self._payload_ids = (array("H"), array("H"))
+        self._numpy = None
+        for family, family_records in enumerate(records):
+            self._build(family, family_records, 128 if family else 32)
+
+    def _build(self, family: int, records: List[Tuple[int, int, int]], bits: int):
+        ranges = sorted((prefix >> (bits - suffix) << (bits - suffix), (1 << (bits - suffix)) - 1, payload_id)
+                        for payload_id, prefix, suffix in records)
+        starts, ends, payload_ids = self._starts[family], self._ends[family], self._payload_ids[family]
+        for start, size, payload_id in ranges:
+            end = start + size
+            if starts and start <= ends[-1] + 1 and payload_id == payload_ids[-1]:
+                ends[-1] = max(ends[-1], end)  # adjacent or overlapping
+                continue
+            if starts and start <= ends[-1]:
+                raise ValueError(f"Rozsahy '{self.payloads[payload_ids[-1]]}' a '{self.payloads[payload_id]}' "
+                                 f"se překrývají; pro takové použijte PrefixTrie")
+            starts.append(start)
+            ends.append(end)
+            payload_ids.append(payload_id)
+
+    def entries(self) -> Iterator[Tuple[str, CIDRSet]]:
+        """Yields subnets of every payload"""
+        for family, cls in enumerate((CIDRSet, CIDRv6Set)):
+            by_payload = [cls() for _ in self.payloads]
+            for start, end, payload_id in zip(self._starts[family], self._ends[family], self._payload_ids[family]):
+                by_payload[payload_id].extend_pairs(split_range(start, end, cls.CIDR_CLASS.BITS))
+            for payload, ranges in zip(self.payloads, by_payload):
+                if ranges:
+                    yield payload, ranges
+
+    def __len__(self):
+        return len(self._starts[0]) + len(self._starts[1])
+
+    def lookup(self, address: Union[str, int], ipv6: bool = False) -> Optional[str]:
+        """Returns payload of the range containing ``address`` or ``None``; integers are IPv4 unless ``ipv6``"""
+        family, address = _parse(address, ipv6)
+        i = bisect_right(self._starts[family], address) - 1
+        if i >= 0 and address <= self._ends[family][i]:
+            return self.payloads[self._payload_ids[family][i]]
+        return None
+
+    def __contains__(self, address: Union[str, int]) -> bool:
+        return self.lookup(address) is not None
+
+    def lookup_many(self, addresses: Iterable[Union[str, int]], ipv6: bool = False) -> List[Optional[str]]:
+        """Batch version of :meth:`lookup`; a NumPy array of IPv4 integers is searched vectorized"""
+        if not ipv6 and hasattr(addresses, "dtype"):
+            return self._lookup_many_numpy(addresses)
+        starts, ends, payload_ids, payloads = self._starts, self._ends, self._payload_ids, self.payloads
+        out = []
+        for address in addresses:
+            family, address = _parse(address, ipv6)
+            i = bisect_right(starts[family], address) - 1
+            out.append(payloads[payload_ids[family][i]] if i >= 0 and address <= ends[family][i] else None)
+        return out
+
+    def _lookup_many_numpy(self, addresses) -> List[Optional[str]]:
+        import numpy
+
+        if not self._starts[0]:
+            return [None] * len(addresses)
+        if self._numpy is None:
+            self._numpy = (numpy.frombuffer(self._starts[0], dtype=numpy.uint32).astype(numpy.int64),
+                           numpy.frombuffer(self._ends[0], dtype=numpy.uint32).astype(numpy.int64),
+                           numpy.frombuffer(self._payload_ids[0], dtype=numpy.uint16),
+                           numpy.array(self.payloads + [None], dtype=object))
+        starts, ends, payload_ids, payloads = self._numpy
+        addresses = numpy.asarray(addresses, dtype=numpy.int64)
+        i = numpy.maximum(numpy.searchsorted(starts, addresses, side="right") - 1, 0)
+        found = (starts[i] <= addresses) & (addresses <= ends[i])
+        return payloads[numpy.where(found, payload_ids[i], len(self.payloads))].tolist()
+
+    def save(self, file_name: str):
+        save_entries(file_name, self.entries())
+
+    @classmethod
+    def load(cls, file_name: str):
+        return cls(load_entries(file_name))
+
+
+class _Node:
+    __slots__ = ("prefix", "length", "payload", "children")
+
+    def __init__(self, prefix: int, length: int, payload: Optional[str] = None):
+        self.prefix = prefix
+        self.length = length
+        self.payload = payload
+        self.children = [None, None]
+
+
+class PrefixTrie:
+    """Path-compressed binary trie of subnets of one family for longest-prefix match"""
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self._root = _Node(0, 0)
+        self._entries: Dict[Tuple[int, int], str] = {}  # payload of every inserted (prefix, length)
+
+    @classmethod
+    def from_entries(cls, entries: Entries) -> Tuple["PrefixTrie", "PrefixTrie"]:
+        """Returns tries of IPv4 and IPv6 subnets"""
+        tries = (cls(32), cls(128))
+        for payload, ranges in entries:
+            trie = tries[isinstance(ranges, CIDRv6Set)]
+            for prefix, suffix in ranges.pairs():
+                trie.insert(prefix, suffix, payload)
+        return tries
+
+    def insert(self, prefix: int, length: int, payload: str):
+        bits = self.bits
+        prefix = prefix >> (bits - length) << (bits - length)
+        self._entries[prefix, length] = payload  # an inserted subnet again only replaces the payload
+        node = self._root
+        while node.length != length:
+            bit = (prefix >> (bits - node.length - 1)) & 1
+            child = node.children[bit]
+            if child is None:
+                node.children[bit] = _Node(prefix, length, payload)
+                return
+            limit = min(child.length, length)
+            diff = (child.prefix ^ prefix) >> (bits - limit)
+            common = limit - int.bit_length(diff)  # number of leading bits shared by `child` and `prefix`
+            if common == child.length:
+                node = child
+                continue
+            # `prefix` diverges from `child` (or ends) inside its compressed path; split the path
+            middle = _Node(prefix >> (bits - common) << (bits - common), common)
+            node.children[bit] = middle
+            middle.children[(child.prefix >> (bits - common - 1)) & 1] = child
+            node = middle
+        node.payload = payload
+
+    def lookup(self, address: Union[str, int]) -> Optional[str]:
+        """Returns payload of the longest subnet containing ``address`` or ``None``
+
+        Raises :class:`ValueError` for an address string of the other family.
+        """
+        if isinstance(address, str):
+            ipv6, number = _parse(address)
+            if ipv6 != (self.bits == 128):
+                raise ValueError(f"Adresa '{address.strip()}' není IPv{6 if self.bits == 128 else 4}")
+            address = number
+        bits = self.bits
+        node = self._root
+        best = None
+        while node is not None:
+            if node.length and (address ^ node.prefix) >> (bits - node.length):
+                break
+            if node.payload is not None:
+                best = node.payload
+            if node.length == bits:
+                break
+            node = node.children[(address >> (bits - node.length - 1)) & 1]
+        return best
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup_many(self, addresses: Iterable[Union[str, int]]) -> List[Optional[str]]:
+        lookup = self.lookup
+        return [lookup(address) for address in addresses]
+
+    def entries(self) -> Iterator[Tuple[str, CIDRSet]]:
+        cls = CIDRSet if self.bits == 32 else CIDRv6Set
+        by_payload: Dict[str, CIDRSet] = {}
+        for (prefix, length), payload in self._entries.items():
+            by_payload.setdefault(payload, cls()).append_pair(prefix, length)
+        return iter(by_payload.items())
+
+
+def cli(argv: List[str] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print(__doc__.strip().splitlines()[-1])
+        return 2
+    index = LookupIndex.load(argv[0])
+    addresses = argv[1:] or (line.strip() for line in sys.stdin if line.strip())
+    status = 0
+    for address in addresses:
+        try:
+            print(f"{address}\t{index.lookup(address) or '-'}")
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
@@ -0,0 +1,106 @@
+"""Lossy aggregation which trades extra addresses for fewer subnets, e.g. for routers with limited list sizes.
+
+Neighbouring subnets are greedily replaced by their smallest common supernet, always the merge adding the fewest
+addresses first. The smallest common supernets of neighbours form a binary tree over the subnets, each of them
+with the addresses and subnets it covers; a merge replaces its whole subtree by a single subnet and changes only
+the costs of the enclosing supernets, at most one per prefix length. Every changed cost is pushed into a heap
+of candidate merges again, so the whole run takes O(n log n) for n subnets.
+"""
+from heapq import heapify, heappop, heappush
+from typing import Optional, Tuple
+
+from ip.cidrset import CIDRSet
+
+
+def aggregate_lossy(ranges: CIDRSet, max_entries: Optional[int] = None,
+                    max_extra: Optional[int] = None) -> Tuple[CIDRSet, int]:
+    """Merges subnets until there are at most ``max_entries`` of them or the next merge would exceed ``max_extra``
+    added addresses in total; at least one of the limits must be given
+
+    Returns the subnets, which cover all addresses of ``ranges``, and the number of added addresses.
+    """
+    if max_entries is None and max_extra is None:
+        raise ValueError("Je potřeba zadat max_entries nebo max_extra")
+    bits = ranges.CIDR_CLASS.BITS
+    exact = ranges.from_intervals(ranges.intervals())
+    # nodes 0..n-1 are the subnets, nodes n.. the smallest common supernets of neighbours, all as inclusive
+    # intervals; a node without children is a subnet of the output unless it lies inside a merged supernet
+    starts = []
+    ends = []
+    for prefix, suffix in exact.pairs():
+        starts.append(prefix)
+        ends.append(prefix + (1 << (bits - suffix)) - 1)
+    n = len(starts)
+    left = [-1] * n
+    right = [-1] * n
+    # the supernets form a Cartesian tree ordered by size, built by a stack of its right spine
+    spine = []
+    for i in range(n - 1):
+        length = (starts[i] ^ ends[i + 1]).bit_length()
+        node = len(starts)
+        starts.append(starts[i] >> length << length)
+        ends.append(starts[node] + (1 << length) - 1)
+        child = i
+        while spine and ends[spine[-1]] - starts[spine[-1]] < ends[node] - starts[node]:
+            child = spine.pop()
+        if spine:
+            right[spine[-1]] = node
+        left.append(child)
+        right.append(i + 1)
+        spine.append(node)
+    root = spine[0] if spine else n - 1
+    parent = [-1] * len(starts)
+    covered = [end - start + 1 for start, end in zip(starts, ends)]  # addresses of the subnets inside
+    count = [1] * len(starts)  # subnets inside
+    alive = [True] * len(starts)
+    for node in sorted(range(n, len(starts)), key=lambda x: ends[x] - starts[x]):  # children first
+        parent[left[node]] = parent[right[node]] = node
+        covered[node] = covered[left[node]] + covered[right[node]]
+        count[node] = count[left[node]] + count[right[node]]
+
+    def candidate(node: int) -> Tuple[int, int, int, int]:
+        """Returns ``(added addresses, -removed subnets, start, node)`` of merging everything inside ``node``"""
+        return ends[node] - starts[node] + 1 - covered[node], 1 - count[node], starts[node], node
+
+    heap = [candidate(node) for node in range(n, len(starts))]
+    heapify(heap)
+    entries = n
+    extra = 0
+    while heap:
+        item = heappop(heap)
+        node = item[3]
+        if not alive[node] or left[node] < 0 or item != candidate(node):
+            continue  # already merged, or an old cost of a supernet whose current cost was pushed later
+        cost, removed, _, _ = item
+        if max_extra is not None and extra + cost > max_extra:
+            break
+        if max_entries is not None and entries <= max_entries and cost:
+            break  # merges of buddies add nothing, so they continue below the limit
+        # the supernet becomes a subnet; the subtree below it is dropped
+        stack = [left[node], right[node]]
+        while stack:
+            i = stack.pop()
+            alive[i] = False
+            if left[i] >= 0:
+                stack.extend((left[i], right[i]))
+        left[node] = right[node] = -1
+        covered[node] = ends[node] - starts[node] + 1
+        count[node] = 1
+        i = parent[node]
+        while i >= 0:
+            covered[i] += cost
+            count[i] += removed
+            heappush(heap, candidate(i))
+            i = parent[i]
+        entries += removed
+        extra += cost
+    out = type(ranges)()
+    stack = [root] if n else []
+    while stack:
+        node = stack.pop()
+        if left[node] < 0:
+            out.append_pair(starts[node], bits + 1 - (ends[node] - starts[node] + 1).bit_length())
+        else:
+            stack.append(right[node])
+            stack.append(left[node])
+    return out, extra
@@ -0,0 +1,167 @@
+"""Machine-readable metrics of a run: time spent in every pipeline stage, counters and peak memory.
+
+The pipeline stages are lazy generators pulling from each other, so :meth:`Metrics.time_iter` measures the time
+spent inside every ``next()`` and subtracts the time of the stages nested in it; every stage thus gets its own
+exclusive time. :data:`DISABLED` has the same interface and does nothing, so an uninstrumented run costs
+no more than before.
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict
+from typing import Callable, Dict, Iterable, Iterator, Optional, TypeVar
+
+from ip.pipeline import Chunk, PipelineStats
+
+T = TypeVar("T")
+
+PROMETHEUS_PREFIX = "ip_aggregate"
+
+
+def subnet_count(chunk: Chunk) -> int:
+    return len(chunk[0]) + len(chunk[1])
+
+
+def peak_rss(children: bool = False) -> Optional[int]:
+    """Returns peak resident memory of this process (or of its finished child processes) in bytes"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    return usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+class Metrics:
+    def __init__(self):
+        self.timers: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self._stack = []  # [name, start, time of nested stages] of running timers
+
+    def add(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def _start(self, name: str):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def _stop(self):
+        name, start, nested = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self.timers[name] = self.timers.get(name, 0.0) + elapsed - nested
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    @contextmanager
+    def timer(self, name: str):
+        self._start(name)
+        try:
+            yield
+        finally:
+            self._stop()
+
+    def time_iter(self, name: str, iterable: Iterable[T], counter: str = None,
+                  size: Callable[[T], int] = len) -> Iterator[T]:
+        """Passes items through, adds time spent producing them to timer ``name`` and their sizes to ``counter``"""
+        iterator = iter(iterable)
+        while True:
+            self._start(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._stop()
+            if counter:
+                self.add(counter, size(item))
+            yield item
+
+    def add_stats(self, stats: PipelineStats):
+        """Adds the final statistics of the pipeline to the counters"""
+        for name, value in asdict(stats).items():
+            self.add(name, value)
+
+    def add_derived(self):
+        """Adds counters computed from the others: lines dropped by the filter"""
+        counters = self.counters
+        if "lines_read" in counters and "lines_parsed" in counters:
+            self.add("lines_filtered", counters["lines_read"] - counters["lines_parsed"])
+
+    def to_dict(self) -> dict:
+        return {
+            "stage_seconds": dict(self.timers),
+            "counters": dict(self.counters),
+            "peak_rss_bytes": peak_rss(),
+            "peak_rss_children_bytes": peak_rss(children=True),
+        }
+
+    def to_prometheus(self) -> str:
+        """Returns the metrics as gauges in the Prometheus text format, e.g. for the node_exporter textfile collector"""
+        data = self.to_dict()
+        lines = [f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds gauge"]
+        lines.extend(f'{PROMETHEUS_PREFIX}_stage_seconds{{stage="{stage}"}} {seconds:.6f}'
+                     for stage, seconds in data["stage_seconds"].items())
+        values = dict(data["counters"], peak_rss_bytes=data["peak_rss_bytes"],
+                      peak_rss_children_bytes=data["peak_rss_children_bytes"])
+        for name, value in values.items():
+            if value is not None:
+                lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge")
+                lines.append(f"{PROMETHEUS_PREFIX}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, file_name: str, metrics_format: str = None):
+        """Writes the metrics atomically as JSON or Prometheus text (the default for a ``.prom`` file)"""
+        import json
+        import tempfile
+
+        if metrics_format is None:
+            metrics_format = "prometheus" if file_name.endswith(".prom") else "json"
+        text = self.to_prometheus() if metrics_format == "prometheus" else json.dumps(self.to_dict(), indent=2)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_name)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(text)
+            os.replace(tmp_path, file_name)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+class _DisabledMetrics(Metrics):
+    def add(self, name: str, value: int = 1):
+        pass
+
+    @contextmanager
+    def timer(self, name: str):
+        yield
+
+    def time_iter(self, name: str, iterable: Iterable[T], counter: str = None,
+                  size: Callable[[T], int] = len) -> Iterable[T]:
+        return iterable
+
+    def add_stats(self, stats: PipelineStats):
+        pass
+
+    def add_derived(self):
+        pass
+
+
+DISABLED = _DisabledMetrics()
+
+
+@contextmanager
+def profile(file_name: Optional[str]):
+    """Profiles the block by :mod:`cProfile` and saves the statistics into ``file_name`` (for :mod:`pstats`);
+    does nothing if ``file_name`` is empty"""
+    if not file_name:
+        yield
+        return
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(file_name)
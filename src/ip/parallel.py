@@ -0,0 +1,71 @@
+"""Parsing and aggregation spread over several processes.
+
+Input chunks are parsed by a pool of workers. The parsed subnets are sharded by their top-level prefix
+(``/8`` for IPv4, ``/16`` for IPv6) and the shards are aggregated in parallel. Subnets of different shards can
+only merge into a subnet larger than the shard, so a final single-pass merge over the concatenated shards is cheap.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from ip import aggregate_subnets
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.pipeline import Chunk, PipelineStats, parse_chunks
+
+SHARD_BITS = {CIDRSet: 8, CIDRv6Set: 16}
+
+ShardKey = Tuple[int, int]  # (0 for IPv4 or 1 for IPv6, top-level prefix)
+
+
+def _parse_and_shard(args: Tuple[List[str], str]) -> Tuple[Dict[ShardKey, CIDRSet], PipelineStats]:
+    chunk, line_format = args
+    stats = PipelineStats()
+    shards = {}
+    for ranges in next(parse_chunks([chunk], stats, line_format)):
+        family = isinstance(ranges, CIDRv6Set)
+        shift = ranges.CIDR_CLASS.BITS - SHARD_BITS[type(ranges)]
+        for prefix, suffix in ranges.pairs():
+            key = (family, prefix >> shift)
+            shard = shards.get(key)
+            if shard is None:
+                shard = shards[key] = type(ranges)()
+            shard.append_pair(prefix, suffix)
+    return shards, stats
+
+
+def _aggregate_shard(args: Tuple[CIDRSet, bool]) -> Tuple[CIDRSet, int]:
+    ranges, union = args
+    stats = PipelineStats()
+    return aggregate_subnets(ranges, union=union, stats=stats), stats.merges
+
+
+def aggregate_parallel(chunks: Iterable[List[str]], stats: PipelineStats, jobs: int, line_format: str = "auto",
+                       union: bool = False) -> Iterator[Chunk]:
+    """Parses and aggregates filtered line chunks in ``jobs`` processes
+
+    Unlike :func:`ip.pipeline.aggregate_chunks` the whole input is held in memory (packed in CIDR sets),
+    and the result is yielded as a single chunk.
+    """
+    shards: Dict[ShardKey, CIDRSet] = {}
+    with ProcessPoolExecutor(jobs) as pool:
+        for chunk_shards, chunk_stats in pool.map(_parse_and_shard, ((chunk, line_format) for chunk in chunks)):
+            stats.lines_v4 += chunk_stats.lines_v4
+            stats.lines_v6 += chunk_stats.lines_v6
+            stats.ranges_split += chunk_stats.ranges_split
+            for key, ranges in chunk_shards.items():
+                if key in shards:
+                    shards[key].extend(ranges)
+                else:
+                    shards[key] = ranges
+        keys = sorted(shards)
+        aggregated = pool.map(_aggregate_shard, ((shards.pop(key), union) for key in keys))
+        out = (CIDRSet(), CIDRv6Set())
+        for (family, _), (ranges, merges) in zip(keys, aggregated):
+            out[family].extend(ranges)
+            stats.merges += merges
+    # merges across shard boundaries
+    ranges_v4, ranges_v6 = (aggregate_subnets(ranges, union=union, stats=stats) for ranges in out)
+    stats.subnets_v4 += len(ranges_v4)
+    stats.subnets_v6 += len(ranges_v6)
+    stats.addresses_v4 += ranges_v4.size()
+    stats.addresses_v6 += ranges_v6.size()
+    yield ranges_v4, ranges_v6
@@ -0,0 +1,147 @@
+"""Format-aware line parsers that read every line exactly once.
+
+Unlike :meth:`ip.convert.CIDR.many_from_str` they don't try the regular expressions of both families;
+the address family is told from the first column and addresses are converted by :func:`socket.inet_pton`.
+"""
+from socket import AF_INET, AF_INET6, inet_pton
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple
+
+from ip.cidrset import CIDRSet, CIDRv6Set
+
+if TYPE_CHECKING:
+    from ip.pipeline import Chunk, PipelineStats
+
+
+def _ip2int(address: str) -> Tuple[bool, int]:
+    """Returns ``(is_ipv6, address)``"""
+    if ":" in address:
+        return True, int.from_bytes(inet_pton(AF_INET6, address), "big")
+    return False, int.from_bytes(inet_pton(AF_INET, address), "big")
+
+
+def first_address(line: str, line_format: str) -> Tuple[bool, int]:
+    """Returns ``(is_ipv6, first address)`` of a stripped ``dbip-csv`` or ``cidr-list`` line; the rest is not parsed"""
+    try:
+        return _ip2int(line.partition("," if line_format == "dbip-csv" else "/")[0].strip())
+    except (ValueError, OSError):
+        raise ValueError(f"Unprocessed line!\n'{line}'") from None
+
+
+def parse_dbip_csv(lines: List[str], stats: "PipelineStats") -> "Chunk":
+    """Parses stripped lines ``first address,last address,country``"""
+    starts = ([], [])
+    ends = ([], [])
+    for line in lines:
+        try:
+            first, last = line.split(",", 2)[:2]
+            is_v6, start = _ip2int(first.strip())
+            end = int.from_bytes(inet_pton(AF_INET6 if is_v6 else AF_INET, last.strip()), "big")
+            if start > end:
+                raise ValueError(end)
+        except (ValueError, OSError):
+            raise ValueError(f"Unprocessed line!\n'{line}'") from None
+        starts[is_v6].append(start)
+        ends[is_v6].append(end)
+    stats.lines_v4 += len(starts[0])
+    stats.lines_v6 += len(starts[1])
+    ranges_v4 = CIDRSet()
+    ranges_v6 = CIDRv6Set()
+    stats.ranges_split += ranges_v4.extend_ranges(starts[0], ends[0]) + ranges_v6.extend_ranges(starts[1], ends[1])
+    return ranges_v4, ranges_v6
+
+
+def parse_cidr_list(lines: List[str], stats: "PipelineStats") -> "Chunk":
+    """Parses stripped lines ``address/suffix``; a missing suffix means a single address"""
+    ranges = (CIDRSet(), CIDRv6Set())
+    for line in lines:
+        address, slash, suffix = line.partition("/")
+        suffix = suffix.strip()
+        try:
+            is_v6, prefix = _ip2int(address.strip())
+            bits = ranges[is_v6].CIDR_CLASS.BITS
+            if slash and not (suffix.isdigit() and int(suffix) <= bits):
+                raise ValueError(suffix)
+            ranges[is_v6].append_pair(prefix, int(suffix) if slash else bits)
+        except (ValueError, OSError, OverflowError):
+            raise ValueError(f"Unprocessed line!\n'{line}'") from None
+    stats.lines_v4 += len(ranges[0])
+    stats.lines_v6 += len(ranges[1])
+    return ranges
+
+
+def _is_rir_header(columns: List[str]) -> bool:
+    """Tells whether split columns are the version line ``version|registry|serial|...`` or a summary
+    ``registry|*|type|*|count|summary``"""
+    return columns[0].replace(".", "", 1).isdigit() or (len(columns) == 6 and columns[1] == "*"
+                                                          and columns[5] == "summary")
+
+
+def parse_rir_delegated(lines: List[str], stats: "PipelineStats") -> "Chunk":
+    """Parses stripped lines of RIR delegated statistics ``registry|cc|type|start|value|date|status[|...]``
+
+    ``value`` is the number of addresses for IPv4 and the prefix length for IPv6. The version line, summaries,
+    comments, ASN records and unassigned (``available``, ``reserved``) space of the extended format are skipped;
+    any other line raises ``ValueError``.
+    """
+    starts = []
+    ends = []
+    ranges_v6 = CIDRv6Set()
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        columns = line.split("|")
+        try:
+            if _is_rir_header(columns):
+                continue
+            record_type, status = columns[2], columns[6]
+            if record_type == "asn" or status in ("available", "reserved"):
+                continue
+            if status not in ("allocated", "assigned"):
+                raise ValueError(status)
+            value = int(columns[4])
+            if record_type == "ipv4":
+                start = int.from_bytes(inet_pton(AF_INET, columns[3]), "big")
+                if value < 1 or start + value > 1 << 32:
+                    raise ValueError(value)
+                starts.append(start)
+                ends.append(start + value - 1)
+            elif record_type == "ipv6":
+                prefix = int.from_bytes(inet_pton(AF_INET6, columns[3]), "big")
+                if not 0 <= value <= 128 or prefix & ((1 << (128 - value)) - 1):
+                    raise ValueError(value)
+                ranges_v6.append_pair(prefix, value)
+            else:
+                raise ValueError(record_type)
+        except (IndexError, ValueError, OSError, OverflowError):
+            raise ValueError(f"Unprocessed line!\n'{line}'") from None
+    stats.lines_v4 += len(starts)
+    stats.lines_v6 += len(ranges_v6)
+    ranges_v4 = CIDRSet()
+    stats.ranges_split += ranges_v4.extend_ranges(starts, ends)
+    return ranges_v4, ranges_v6
+
+
+PARSERS: Dict[str, Callable[[List[str], "PipelineStats"], "Chunk"]] = {
+    "dbip-csv": parse_dbip_csv,
+    "cidr-list": parse_cidr_list,
+    "rir-delegated": parse_rir_delegated,
+}
+
+
+def detect_format(lines: List[str]) -> str:
+    """Returns the name of the parser for the first data line of stripped ``lines``, or ``"auto"``"""
+    from ip.pipeline import PipelineStats
+
+    for line in lines:
+        if not line or line.startswith("#"):
+            continue
+        if "|" in line:
+            return "rir-delegated"
+        for line_format in ("dbip-csv", "cidr-list"):
+            try:
+                PARSERS[line_format]([line], PipelineStats())
+                return line_format
+            except ValueError:
+                pass
+        return "auto"
+    return "auto"
@@ -0,0 +1,185 @@
+"""Generator pipeline reader → filter → parse → aggregate that works on bounded chunks of lines.
+
+Every stage yields chunks of at most a few thousand items, so sorted input is aggregated with flat memory usage
+and the first subnets reach the writer long before the whole input is read.
+"""
+from dataclasses import dataclass
+from itertools import islice
+from typing import Collection, Dict, Iterable, Iterator, List, Tuple
+
+from ip import BuddyMerger, aggregate_subnets
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.convert import CIDR, CIDRv6
+from ip.parse import PARSERS
+
+CHUNK_SIZE = 10000
+RUN_SIZE = 1000000  # subnets of one family kept in memory by ip.external before they are spilled
+
+Chunk = Tuple[CIDRSet, CIDRv6Set]
+
+
+@dataclass
+class PipelineStats:
+    lines_v4: int = 0
+    lines_v6: int = 0
+    subnets_v4: int = 0
+    subnets_v6: int = 0
+    addresses_v4: int = 0
+    addresses_v6: int = 0
+    extra_addresses_v4: int = 0  # added by lossy aggregation, see ip.lossy
+    extra_addresses_v6: int = 0
+    ranges_split: int = 0  # input ranges covered by more than one subnet
+    merges: int = 0  # subnets removed by aggregation, by merging buddies or joining overlapping and adjacent ranges
+
+
+def read_chunks(file_name: str, chunk_size: int = CHUNK_SIZE) -> Iterator[List[str]]:
+    with open(file_name) as f:
+        while True:
+            chunk = list(islice(f, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+def filter_chunks(chunks: Iterable[List[str]], filter_str: str = None) -> Iterator[List[str]]:
+    """Strips the lines and drops empty ones and those which don't contain ``filter_str``"""
+    for chunk in chunks:
+        lines = [line.strip() for line in chunk if not filter_str or filter_str in line]
+        yield [line for line in lines if line]
+
+
+def parse_chunks(chunks: Iterable[List[str]], stats: PipelineStats, line_format: str = "auto") -> Iterator[Chunk]:
+    """Parses lines of any supported format
+
+    ``line_format`` other than ``"auto"`` selects one of the faster single-format parsers in :mod:`ip.parse`.
+    """
+    if line_format != "auto":
+        parser = PARSERS[line_format]
+        for chunk in chunks:
+            yield parser(chunk, stats)
+        return
+    for chunk in chunks:
+        ranges_v4 = CIDRSet()
+        ranges_v6 = CIDRv6Set()
+        for line in chunk:
+            if CIDR.match(line):
+                stats.lines_v4 += 1
+                subnets = CIDR.many_from_str(line)
+                ranges_v4.extend(subnets)
+            elif CIDRv6.match(line):
+                stats.lines_v6 += 1
+                subnets = CIDRv6.many_from_str(line)
+                ranges_v6.extend(subnets)
+            else:
+                raise ValueError(f"Unprocessed line!\n'{line}'")
+            if len(subnets) > 1:
+                stats.ranges_split += 1
+        yield ranges_v4, ranges_v6
+
+
+def read_ranges(file_name: str, line_format: str = "auto") -> Chunk:
+    """Reads and parses a whole file into a single chunk, e.g. a list of subnets to exclude"""
+    out = (CIDRSet(), CIDRv6Set())
+    for chunk in parse_chunks(filter_chunks(read_chunks(file_name)), PipelineStats(), line_format):
+        for ranges, parsed in zip(out, chunk):
+            ranges.extend(parsed)
+    return out
+
+
+def aggregate_chunks(chunks: Iterable[Chunk], stats: PipelineStats, union: bool = False) -> Iterator[Chunk]:
+    """Aggregates sorted input on the fly; yields subnets as soon as they can't merge any more.
+
+    See :class:`ChunkAggregator`.
+    """
+    aggregator = ChunkAggregator(stats, union)
+    for chunk in chunks:
+        yield aggregator.push(chunk)
+    yield aggregator.flush()
+
+
+class ChunkAggregator:
+    """Push-based aggregation of parsed chunks; every push returns the subnets which can't merge any more.
+
+    Both families are merged independently, so they may come interleaved. IPv4 leftovers are returned only by
+    :meth:`flush`, after IPv6 subnets of earlier pushes; :func:`ip.writers.write_chunks` orders the families.
+
+    With ``union=True`` the input may be unsorted, therefore it is collected whole and aggregated by :meth:`flush`.
+    """
+
+    def __init__(self, stats: PipelineStats, union: bool = False):
+        self.stats = stats
+        self.union = union
+        self._merger_v4 = BuddyMerger(CIDR.BITS)
+        self._merger_v6 = BuddyMerger(CIDRv6.BITS)
+        self._collected = (CIDRSet(), CIDRv6Set())
+
+    def push(self, chunk: Chunk) -> Chunk:
+        ranges_v4, ranges_v6 = chunk
+        if self.union:
+            self._collected[0].extend(ranges_v4)
+            self._collected[1].extend(ranges_v6)
+            return CIDRSet(), CIDRv6Set()
+        return self._count((_push_all(self._merger_v4, ranges_v4), _push_all(self._merger_v6, ranges_v6)))
+
+    def flush(self) -> Chunk:
+        """Returns all remaining subnets; call when the input is exhausted"""
+        if self.union:
+            collected, self._collected = self._collected, (CIDRSet(), CIDRv6Set())
+            return self._count(tuple(aggregate_subnets(ranges, union=True, stats=self.stats) for ranges in collected))
+        self.stats.merges += self._merger_v4.merges + self._merger_v6.merges
+        self._merger_v4.merges = self._merger_v6.merges = 0
+        return self._count((CIDRSet.from_pairs(self._merger_v4.flush()), CIDRv6Set.from_pairs(self._merger_v6.flush())))
+
+    def _count(self, chunk: Chunk) -> Chunk:
+        return count_chunk(self.stats, chunk)
+
+
+def count_chunk(stats: PipelineStats, chunk: Chunk) -> Chunk:
+    """Adds aggregated subnets of ``chunk`` to ``stats``; returns the chunk"""
+    ranges_v4, ranges_v6 = chunk
+    stats.subnets_v4 += len(ranges_v4)
+    stats.subnets_v6 += len(ranges_v6)
+    stats.addresses_v4 += ranges_v4.size()
+    stats.addresses_v6 += ranges_v6.size()
+    return chunk
+
+
+def split_countries(chunks: Iterable[List[str]], countries: Collection[str] = None) -> Iterator[Dict[str, List[str]]]:
+    """Splits every chunk of stripped lines by the country code in the last column; ``countries=None`` keeps all"""
+    for chunk in chunks:
+        by_country = {}
+        for line in chunk:
+            _, comma, country = line.rpartition(",")
+            if not comma:
+                raise ValueError(f"Line without a country column!\n'{line}'")
+            country = country.strip()
+            if countries is None or country in countries:
+                by_country.setdefault(country, []).append(line)
+        yield by_country
+
+
+def aggregate_countries(chunks: Iterable[List[str]], countries: Collection[str] = None, line_format: str = "auto",
+                        union: bool = False) -> Dict[str, Tuple[Chunk, PipelineStats]]:
+    """Aggregates every country on its own in a single pass over chunks of stripped lines
+
+    Returns aggregated subnets and statistics of every country that was found.
+    """
+    aggregators: Dict[str, ChunkAggregator] = {}
+    results: Dict[str, Chunk] = {}
+    for by_country in split_countries(chunks, countries):
+        for country, lines in by_country.items():
+            aggregator = aggregators.get(country)
+            if aggregator is None:
+                aggregator = aggregators[country] = ChunkAggregator(PipelineStats(), union)
+                results[country] = CIDRSet(), CIDRv6Set()
+            parsed = next(parse_chunks([lines], aggregator.stats, line_format))
+            for ranges, finished in zip(results[country], aggregator.push(parsed)):
+                ranges.extend(finished)
+    for country, aggregator in aggregators.items():
+        for ranges, finished in zip(results[country], aggregator.flush()):
+            ranges.extend(finished)
+    return {country: (results[country], aggregators[country].stats) for country in results}
+
+
+def _push_all(merger: BuddyMerger, ranges: CIDRSet) -> CIDRSet:
+    return type(ranges).from_pairs(pair for prefix, suffix in ranges.pairs() for pair in merger.push(prefix, suffix))
@@ -0,0 +1,342 @@
+"""Long-running local server which keeps aggregated lists in memory and answers lookups and exports.
+
+Every list is aggregated from its source (see :mod:`ip.sources`) into a :class:`ip.lookup.LookupIndex`. Loading
+runs in a worker thread and its result replaces the state of the list by a single assignment, so requests keep
+being served from the old state until the new one is complete; a source that fails to load keeps the old state.
+Local source files are polled for changes and reloaded on their own.
+
+The protocol is a minimal HTTP/1.1 with keep-alive, on localhost TCP or on a Unix socket:
+
+- ``GET /lookup?ip=ADDRESS&ip=...[&list=NAME...]`` or ``POST /lookup`` with one address per line: one line
+  ``ADDRESS<TAB>NAME,NAME`` (or ``-``) per address, in the same order
+- ``GET /export/NAME[?format=rsc]``: the list rendered by :mod:`ip.writers`, cached until the list changes
+- ``GET /stats``: JSON with the lists and latency percentiles of every endpoint
+- ``POST /reload[?list=NAME]``: reloads lists now
+
+Usage: PYTHONPATH=src python3 -m ip.server --list NAME[@CC,CC]=[FORMAT=]LOCATION ... [--port N | --socket PATH]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from ip.lookup import LookupIndex
+from ip.pipeline import Chunk, PipelineStats
+from ip.sources import Source, fetch_and_aggregate
+from ip.writers import FORMATS, write_chunks
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8787
+POLL_INTERVAL = 2.0
+LATENCY_WINDOW = 10000  # latest requests of every endpoint kept for percentiles
+MAX_BODY = 16 << 20
+PERCENTILES = (50, 90, 99)
+TEXT = "text/plain; charset=utf-8"
+ENDPOINTS = ("lookup", "export", "stats", "reload")  # latency of other paths is recorded as "other"
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+            500: "Internal Server Error"}
+
+Response = Tuple[int, str, bytes]
+
+
+@dataclass
+class ListSpec:
+    name: str
+    location: str
+    countries: Optional[List[str]] = None
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "ListSpec":
+        """Parses ``NAME[@CC,CC]=[FORMAT=]LOCATION``, e.g. ``cz@CZ=czsk.csv``"""
+        name, sep, location = spec.partition("=")
+        if not sep or not name or not location:
+            raise ValueError(f"Seznam musí být zadán jako NAME[@CC,CC]=[FORMAT=]LOCATION: '{spec}'")
+        name, _, countries = name.partition("@")
+        return cls(name, location, countries.upper().split(",") if countries else None)
+
+    def signature(self) -> Optional[Tuple[int, int]]:
+        """Returns modification time and size of a local source file, ``None`` for a URL"""
+        source = Source.from_spec(self.location)
+        if source.is_url:
+            return None
+        stat = os.stat(source.location)
+        return stat.st_mtime_ns, stat.st_size
+
+
+@dataclass
+class ListState:
+    """Immutable snapshot of a loaded list; only :attr:`exports` is filled lazily"""
+    spec: ListSpec
+    chunk: Chunk
+    index: LookupIndex
+    stats: PipelineStats
+    signature: Optional[Tuple[int, int]]
+    loaded_at: float
+    exports: Dict[str, bytes] = field(default_factory=dict)
+
+
+def load_list(spec: ListSpec) -> ListState:
+    """Reads and aggregates the source of a list; blocking, meant for a worker thread"""
+    signature = spec.signature()
+    stats = PipelineStats()
+    chunk = fetch_and_aggregate([Source.from_spec(spec.location)], stats, countries=spec.countries)
+    return ListState(spec, chunk, LookupIndex((spec.name, ranges) for ranges in chunk), stats, signature,
+                     time.time())
+
+
+def render_export(state: ListState, output_format: str) -> bytes:
+    f = io.StringIO()
+    write_chunks(f, [state.chunk], FORMATS[output_format](state.spec.name))
+    return f.getvalue().encode()
+
+
+class LatencyStats:
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.counts: Dict[str, int] = {}
+
+    def record(self, endpoint: str, seconds: float):
+        self.latencies.setdefault(endpoint, deque(maxlen=self.window)).append(seconds)
+        self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def summary(self) -> Dict[str, dict]:
+        """Returns request count and latency percentiles (in milliseconds, nearest rank) of every endpoint"""
+        out = {}
+        for endpoint, latencies in self.latencies.items():
+            ordered = sorted(latencies)
+            item = {"requests": self.counts[endpoint]}
+            for percentile in PERCENTILES:
+                rank = max(0, -(-percentile * len(ordered) // 100) - 1)
+                item[f"p{percentile}_ms"] = round(ordered[rank] * 1000, 3)
+            item["max_ms"] = round(ordered[-1] * 1000, 3)
+            out[endpoint] = item
+        return out
+
+
+class AggregateServer:
+    def __init__(self, specs: Sequence[ListSpec], poll_interval: float = POLL_INTERVAL):
+        self.specs = {spec.name: spec for spec in specs}
+        self.poll_interval = poll_interval
+        self.lists: Dict[str, ListState] = {}
+        self.latency = LatencyStats()
+        self._reloading: Dict[str, asyncio.Task] = {}
+        self._watcher: Optional[asyncio.Future] = None
+
+    async def reload(self, name: str) -> bool:
+        """Loads the list in a worker thread and swaps it in; concurrent reloads of one list are joined
+
+        Returns ``False`` when the source failed to load and the previous state was kept.
+        """
+        task = self._reloading.get(name)
+        if task is None:
+            task = self._reloading[name] = asyncio.ensure_future(self._reload(name))
+            task.add_done_callback(lambda _: self._reloading.pop(name, None))
+        return await task
+
+    async def _reload(self, name: str) -> bool:
+        try:
+            state = await asyncio.get_running_loop().run_in_executor(None, load_list, self.specs[name])
+        except Exception as e:
+            print(f"Seznam {name} se nepodařilo načíst: {e}", file=sys.stderr)
+            if name not in self.lists:
+                raise
+            return False
+        self.lists[name] = state
+        print(f"Seznam {name} načten: {len(state.chunk[0]):n} IPv4 a {len(state.chunk[1]):n} IPv6 subnetů")
+        return True
+
+    async def reload_all(self):
+        await asyncio.gather(*(self.reload(name) for name in self.specs))
+
+    async def check_changes(self):
+        """Reloads lists whose local source file has changed since it was loaded"""
+        changed = []
+        for name, state in self.lists.items():
+            try:
+                signature = state.spec.signature()
+            except OSError:
+                continue  # e.g. the file is being replaced
+            if signature != state.signature:
+                changed.append(name)
+        await asyncio.gather(*(self.reload(name) for name in changed), return_exceptions=True)
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self.check_changes()
+
+    def lookup(self, addresses: List[str], names: Optional[List[str]] = None) -> List[List[str]]:
+        """Returns names of the lists containing every address"""
+        states = [self.lists[name] for name in names or self.specs if name in self.lists]
+        out = [[] for _ in addresses]
+        for state in states:
+            for found, payload in zip(out, state.index.lookup_many(addresses)):
+                if payload is not None:
+                    found.append(state.spec.name)
+        return out
+
+    async def export(self, name: str, output_format: str) -> bytes:
+        state = self.lists[name]
+        cached = state.exports.get(output_format)
+        if cached is None:
+            cached = await asyncio.get_running_loop().run_in_executor(None, render_export, state, output_format)
+            state.exports[output_format] = cached
+        return cached
+
+    def _states(self):
+        return [(name, self.lists[name]) for name in self.specs if name in self.lists]
+
+    def stats(self) -> dict:
+        return {
+            "lists": {name: {"location": state.spec.location, "loaded_at": state.loaded_at,
+                             "subnets_v4": state.stats.subnets_v4, "subnets_v6": state.stats.subnets_v6,
+                             "addresses_v4": state.stats.addresses_v4, "addresses_v6": state.stats.addresses_v6}
+                      for name, state in self._states()},
+            "latency": self.latency.summary(),
+        }
+
+    async def respond(self, method: str, target: str, body: bytes) -> Response:
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        path = unquote(url.path).strip("/").split("/")
+        names = query.get("list", []) + (path[1:] if path[0] == "export" else [])
+        unknown = [name for name in names if name not in self.lists]
+        if unknown:
+            return 404, TEXT, f"Neznámý seznam {unknown[0]}\n".encode()
+        if path == ["lookup"] and method in ("GET", "POST"):
+            try:  # also UnicodeDecodeError of the body
+                addresses = query.get("ip", []) + [line.strip() for line in body.decode().splitlines() if line.strip()]
+                found = self.lookup(addresses, query.get("list"))
+            except ValueError as e:
+                return 400, TEXT, f"{e}\n".encode()
+            text = "".join(f"{address}\t{','.join(names) or '-'}\n" for address, names in zip(addresses, found))
+            return 200, TEXT, text.encode()
+        if len(path) == 2 and path[0] == "export" and method == "GET":
+            output_format = query.get("format", ["plain"])[0]
+            if output_format not in FORMATS:
+                return 400, TEXT, f"Neznámý formát {output_format}; možnosti: {', '.join(FORMATS)}\n".encode()
+            return 200, TEXT, await self.export(path[1], output_format)
+        if path == ["stats"] and method == "GET":
+            return 200, "application/json", json.dumps(self.stats(), indent=2).encode()
+        if path == ["reload"] and method == "POST":
+            names = query.get("list", list(self.specs))
+            failed = [name for name, ok in zip(names, await asyncio.gather(*map(self.reload, names))) if not ok]
+            if failed:
+                return 500, TEXT, f"Nepodařilo se načíst: {', '.join(failed)}; zůstávají předchozí data\n".encode()
+            return 200, TEXT, b"OK\n"
+        if path[0] in ENDPOINTS:
+            return 405, TEXT, b"Method not allowed\n"
+        return 404, TEXT, b"Not found\n"
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    start = time.perf_counter()
+                    headers = {}
+                    while True:
+                        line = (await reader.readline()).decode("latin-1").strip()
+                        if not line:
+                            break
+                        name, _, value = line.partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                    method, target, version = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length", 0))
+                    if length < 0:
+                        raise ValueError(f"Negative Content-Length {length}")
+                except (ValueError, asyncio.LimitOverrunError):  # also a line over the limit of the reader
+                    await self._send(writer, (400, TEXT, b"Bad request\n"), False)
+                    break
+                if length > MAX_BODY:
+                    await self._send(writer, (413, TEXT, b"Too large\n"), False)
+                    break
+                body = await reader.readexactly(length)
+                try:
+                    response = await self.respond(method, target, body)
+                except Exception as e:
+                    response = 500, TEXT, f"{type(e).__name__}: {e}\n".encode()
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._send(writer, response, keep_alive)
+                endpoint = urlsplit(target).path.strip("/").split("/")[0]
+                self.latency.record(endpoint if endpoint in ENDPOINTS else "other", time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, response: Response, keep_alive: bool):
+        status, content_type, body = response
+        writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                     f"\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                    socket_path: str = None) -> asyncio.AbstractServer:
+        """Loads all lists and starts listening; lists are watched for changes while the server runs"""
+        await self.reload_all()
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle, socket_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        self._watcher = asyncio.ensure_future(self.watch())
+        return server
+
+    def stop_watching(self):
+        if self._watcher:
+            self._watcher.cancel()
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: str = None):
+        server = await self.start(host, port, socket_path)
+        addresses = [socket_path] if socket_path else [f"http://{host}:{s.getsockname()[1]}" for s in server.sockets]
+        print(f"Server naslouchá na {', '.join(addresses)}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.stop_watching()
+
+
+def cli(argv: List[str] = None):
+    import locale
+
+    locale.setlocale(locale.LC_ALL, '')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--list", action="append", required=True, metavar="NAME[@CC,CC]=[FORMAT=]LOCATION",
+                        help="seznam držený v paměti; zdrojem je soubor, soubor .gz nebo URL (viz --source v main.py);"
+                             " @CC,CC omezí zdroj na rozsahy zadaných zemí; lze zadat vícekrát")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"adresa pro naslouchání (výchozí: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port (výchozí: {DEFAULT_PORT})")
+    parser.add_argument("--socket", help="naslouchá na Unix socketu místo TCP")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL,
+                        help=f"po kolika sekundách se kontrolují změny zdrojových souborů (výchozí: {POLL_INTERVAL})")
+    args = parser.parse_args(argv)
+    try:
+        specs = [ListSpec.from_spec(spec) for spec in args.list]
+    except ValueError as e:
+        parser.error(str(e))
+    server = AggregateServer(specs, args.poll_interval)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
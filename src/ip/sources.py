@@ -0,0 +1,242 @@
+"""Concurrent reading of several input sources by :mod:`asyncio`, merged into a single aggregation.
+
+A source is a local file, a gzip file or an HTTP(S) URL, each with its own parser (dbip CSV, RIR delegated
+statistics, a list of subnets; detected from the first line unless given). Every source is read by its own task;
+blocks are split into chunks of lines and parsed as soon as they arrive, so parsing of one source runs while the
+others wait for I/O. Parsed chunks meet in a bounded queue; its consumer compacts the collected subnets whenever
+they double, and finally aggregates them by one :func:`ip.aggregate_subnets` run with ``union=True``, because
+sources may overlap and need not be sorted.
+"""
+import asyncio
+import zlib
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Collection, List, Optional, Sequence
+from urllib.parse import urljoin, urlsplit
+
+from ip import aggregate_subnets
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.parse import PARSERS, detect_format
+from ip.pipeline import CHUNK_SIZE, Chunk, PipelineStats, filter_chunks, parse_chunks
+
+BLOCK_SIZE = 1 << 18
+QUEUE_SIZE = 16  # parsed chunks waiting for the consumer
+COMPACT_MIN = 100000  # subnets collected before the first compaction
+MAX_REDIRECTS = 5
+TIMEOUT = 60  # seconds to wait for the response headers and for every block of the body
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+@dataclass
+class Source:
+    location: str
+    line_format: str = "auto"  # "auto" is resolved by :func:`ip.parse.detect_format` from the first chunk
+    stats: PipelineStats = field(default_factory=PipelineStats)
+
+    @classmethod
+    def from_spec(cls, spec: str, line_format: str = "auto") -> "Source":
+        """Parses ``[FORMAT=]LOCATION``, e.g. ``rir-delegated=https://example.org/delegated-ripencc-latest``"""
+        prefix, sep, location = spec.partition("=")
+        if sep and prefix in PARSERS:
+            return cls(location, prefix)
+        return cls(spec, line_format)
+
+    @property
+    def is_url(self) -> bool:
+        return self.location.startswith(("http://", "https://"))
+
+
+def needs_sources(spec: str) -> bool:
+    """Tells whether ``spec`` (a URL, a gzip file or ``FORMAT=LOCATION``) needs this module instead of
+    :mod:`ip.pipeline`"""
+    source = Source.from_spec(spec)
+    return source.is_url or source.location.endswith(".gz") or source.location != spec
+
+
+async def _read_file(file_name: str) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    with open(file_name, "rb") as f:
+        while True:
+            block = await loop.run_in_executor(None, f.read, BLOCK_SIZE)
+            if not block:
+                return
+            yield block
+
+
+async def _request(url: str):
+    """Sends a GET request; returns the status, lower-case headers and the open streams"""
+    parts = urlsplit(url)
+    https = parts.scheme == "https"
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or (443 if https else 80),
+                                                   ssl=https or None)
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    try:
+        # HTTP/1.0 without Accept-Encoding: the body comes neither chunked nor compressed by the server
+        writer.write(f"GET {path} HTTP/1.0\r\nHost: {parts.netloc.rpartition('@')[2]}\r\n"
+                     f"User-Agent: ip-aggregate\r\nConnection: close\r\n\r\n".encode("ascii"))
+        await writer.drain()
+        status_line = (await reader.readline()).decode("latin-1")
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise OSError(f"Invalid HTTP response from {url}: {status_line.strip()!r}") from None
+    except BaseException:  # also a cancellation by the timeout
+        writer.close()
+        raise
+    return status, headers, reader, writer
+
+
+async def _with_timeout(awaitable, url: str):
+    try:
+        return await asyncio.wait_for(awaitable, TIMEOUT)
+    except asyncio.TimeoutError:
+        raise OSError(f"Timed out after {TIMEOUT} s waiting for {url}") from None
+
+
+async def _read_url(url: str) -> AsyncIterator[bytes]:
+    """Yields blocks of the body; raises :class:`OSError` if the body is shorter than its ``Content-Length``"""
+    for _ in range(MAX_REDIRECTS + 1):
+        status, headers, reader, writer = await _with_timeout(_request(url), url)
+        try:
+            if status in (301, 302, 303, 307, 308) and "location" in headers:
+                url = urljoin(url, headers["location"])
+                continue
+            if status != 200:
+                raise OSError(f"HTTP {status} for {url}")
+            received = 0
+            while True:
+                block = await _with_timeout(reader.read(BLOCK_SIZE), url)
+                if not block:
+                    break
+                received += len(block)
+                yield block
+            length = headers.get("content-length", "")
+            if length.isdigit() and received < int(length):
+                raise OSError(f"Incomplete body of {url}: received {received} of {length} bytes")
+            return
+        finally:
+            writer.close()
+    raise OSError(f"Too many redirects for {url}")
+
+
+async def _decompress(blocks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Decompresses gzip data, recognized by its magic bytes; passes anything else through"""
+    decompressor = None
+    head = b""
+    async for block in blocks:
+        if decompressor is None:
+            head += block
+            if len(head) < len(GZIP_MAGIC):
+                continue
+            if not head.startswith(GZIP_MAGIC):
+                yield head
+                async for block in blocks:
+                    yield block
+                return
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            block = head
+        out = decompressor.decompress(block)
+        while decompressor.eof and decompressor.unused_data:  # concatenated gzip members
+            rest = decompressor.unused_data
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            out += decompressor.decompress(rest)
+        if out:
+            yield out
+    if decompressor is None and head:
+        yield head
+
+
+async def _line_chunks(blocks: AsyncIterator[bytes], chunk_size: int) -> AsyncIterator[List[str]]:
+    rest = b""
+    lines = []
+    async for block in blocks:
+        lines.extend((rest + block).split(b"\n"))
+        rest = lines.pop()
+        while len(lines) >= chunk_size:
+            yield [line.decode() for line in lines[:chunk_size]]
+            del lines[:chunk_size]
+    if rest:
+        lines.append(rest)
+    if lines:
+        yield [line.decode() for line in lines]
+
+
+def filter_countries(lines: List[str], line_format: str, countries: Collection[str]) -> List[str]:
+    """Keeps stripped lines of ``countries``; lines without a country column (e.g. subnet lists) are kept too"""
+    if line_format == "rir-delegated":
+        return [line for line in lines if line.count("|") < 2 or line.split("|", 2)[1] in countries]
+    out = []
+    for line in lines:
+        _, comma, country = line.rpartition(",")
+        if not comma or country.strip() in countries:
+            out.append(line)
+    return out
+
+
+async def _produce(source: Source, queue: asyncio.Queue, filter_str: Optional[str],
+                   countries: Optional[Collection[str]], chunk_size: int):
+    blocks = _read_url(source.location) if source.is_url else _read_file(source.location)
+    try:
+        async for lines in _line_chunks(_decompress(blocks), chunk_size):
+            lines = next(filter_chunks([lines], filter_str))
+            if source.line_format == "auto" and lines:
+                source.line_format = detect_format(lines)
+            if countries is not None:
+                lines = filter_countries(lines, source.line_format, countries)
+            await queue.put(next(parse_chunks([lines], source.stats, source.line_format)))
+    finally:
+        await queue.put(None)
+
+
+async def _collect(queue: asyncio.Queue, producers: int, stats: PipelineStats) -> Chunk:
+    collected = [CIDRSet(), CIDRv6Set()]
+    compacted = [0, 0]
+    while producers:
+        chunk = await queue.get()
+        if chunk is None:
+            producers -= 1
+            continue
+        for family, parsed in enumerate(chunk):
+            ranges = collected[family]
+            ranges.extend(parsed)
+            if len(ranges) > max(2 * compacted[family], COMPACT_MIN):
+                collected[family] = aggregate_subnets(ranges, union=True, stats=stats)
+                compacted[family] = len(collected[family])
+    return collected[0], collected[1]
+
+
+async def aggregate_sources(sources: Sequence[Source], stats: PipelineStats, filter_str: str = None,
+                            countries: Collection[str] = None, chunk_size: int = CHUNK_SIZE) -> Chunk:
+    """Reads all ``sources`` concurrently and aggregates their union; updates ``stats`` and ``Source.stats``
+
+    ``filter_str`` keeps only lines containing it, ``countries`` only lines of those country codes.
+    """
+    queue = asyncio.Queue(QUEUE_SIZE)
+    producers = [asyncio.ensure_future(_produce(source, queue, filter_str, countries, chunk_size))
+                 for source in sources]
+    consumer = asyncio.ensure_future(_collect(queue, len(producers), stats))
+    try:
+        await asyncio.gather(*producers)
+        collected = await consumer
+    finally:
+        for task in producers + [consumer]:
+            task.cancel()
+    ranges_v4, ranges_v6 = (aggregate_subnets(ranges, union=True, stats=stats) for ranges in collected)
+    stats.lines_v4 += sum(source.stats.lines_v4 for source in sources)
+    stats.lines_v6 += sum(source.stats.lines_v6 for source in sources)
+    stats.ranges_split += sum(source.stats.ranges_split for source in sources)
+    stats.subnets_v4, stats.subnets_v6 = len(ranges_v4), len(ranges_v6)
+    stats.addresses_v4, stats.addresses_v6 = ranges_v4.size(), ranges_v6.size()
+    return ranges_v4, ranges_v6
+
+
+def fetch_and_aggregate(sources: Sequence[Source], stats: PipelineStats, filter_str: str = None,
+                        countries: Collection[str] = None, chunk_size: int = CHUNK_SIZE) -> Chunk:
+    """Synchronous entry point of :func:`aggregate_sources`"""
+    return asyncio.run(aggregate_sources(sources, stats, filter_str, countries, chunk_size))
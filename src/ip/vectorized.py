@@ -0,0 +1,86 @@
+"""Batch decomposition of whole columns of address ranges into subnets.
+
+NumPy is optional; without it (or for addresses wider than 32 bits) the pure-Python path is used.
+Both paths return the same subnets in the same order.
+"""
+from array import array
+from typing import Sequence, Tuple
+
+from ip import split_range
+from ip.convert import CIDR
+
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+
+def split_ranges(starts: Sequence[int], ends: Sequence[int], bits: int = CIDR.BITS, use_numpy: bool = None):
+    """Covers every range ``starts[i]``..``ends[i]`` (inclusive) with the fewest subnets; a range with
+    ``starts[i] > ends[i]`` yields none.
+
+    Returns parallel arrays ``(prefixes, suffixes)`` ordered by range and then by address: NumPy arrays
+    from the vectorized path, ``array.array`` from the pure-Python one (a list of prefixes for IPv6).
+    """
+    return split_ranges_counted(starts, ends, bits, use_numpy)[:2]
+
+
+def split_ranges_counted(starts: Sequence[int], ends: Sequence[int], bits: int = CIDR.BITS,
+                         use_numpy: bool = None) -> Tuple:
+    """Same as :func:`split_ranges`; also returns how many ranges needed more than one subnet"""
+    if use_numpy is None:
+        use_numpy = numpy is not None and bits <= 32
+    if use_numpy:
+        return _split_ranges_numpy(starts, ends, bits)
+    return _split_ranges_python(starts, ends, bits)
+
+
+def _split_ranges_python(starts: Sequence[int], ends: Sequence[int], bits: int):
+    prefixes = array("I") if bits <= 32 else []
+    suffixes = array("B")
+    split = 0
+    for a, b in zip(starts, ends):
+        count = len(suffixes)
+        for prefix, suffix in split_range(int(a), int(b), bits):
+            prefixes.append(prefix)
+            suffixes.append(suffix)
+        if len(suffixes) - count > 1:
+            split += 1
+    return prefixes, suffixes, split
+
+
+def _bit_length(x):
+    # exact as long as `x` fits into the 53-bit mantissa of float64
+    return numpy.frexp(x.astype(numpy.float64))[1].astype(numpy.int64)
+
+
+def _split_ranges_numpy(starts, ends, bits: int) -> Tuple:
+    if bits > 32:
+        raise ValueError(f"Vectorized split supports at most 32-bit addresses, not {bits}")
+    current = numpy.asarray(starts, dtype=numpy.int64)
+    end = numpy.asarray(ends, dtype=numpy.int64) + 1
+    rows = numpy.arange(len(current))
+    valid = current < end  # a reversed range is empty, the same as in `split_range`
+    current, end, rows = current[valid], end[valid], rows[valid]
+    out_rows, out_prefixes, out_suffixes = [], [], []
+    split = None
+    # every round emits one subnet per unfinished range; at most 2 * `bits` rounds are needed
+    while len(current):
+        aligned = numpy.where(current == 0, 1 << bits, current & -current)  # largest subnet starting at `current`
+        fitting = 1 << (_bit_length(end - current) - 1)  # largest subnet not overshooting `end`
+        size = numpy.minimum(aligned, fitting)
+        out_rows.append(rows)
+        out_prefixes.append(current)
+        out_suffixes.append(bits + 1 - _bit_length(size))
+        current = current + size
+        unfinished = current < end
+        current, end, rows = current[unfinished], end[unfinished], rows[unfinished]
+        if split is None:
+            split = len(current)  # ranges not covered by the first subnet
+    if not out_rows:
+        return numpy.empty(0, dtype=numpy.uint32), numpy.empty(0, dtype=numpy.uint8), 0
+    rows = numpy.concatenate(out_rows)
+    prefixes = numpy.concatenate(out_prefixes)
+    suffixes = numpy.concatenate(out_suffixes)
+    order = numpy.argsort(rows, kind="stable")  # rounds already emit subnets of every range in address order
+    return prefixes[order].astype(numpy.uint32), suffixes[order].astype(numpy.uint8), split
@@ -0,0 +1,193 @@
+"""Text output formats of aggregated subnets.
+
+Subnets are formatted in batches (one per :class:`ip.cidrset.CIDRSet`) into a single string: IPv4 addresses are
+assembled from a precomputed table of dotted halves and IPv6 addresses are compressed by ``inet_ntop``
+(see :meth:`ip.convert.CIDRv6._int2ip`). Every format is a subclass of :class:`OutputFormat` registered
+in :data:`FORMATS`; a file name ending with ``.gz`` is written gzip-compressed.
+"""
+from typing import Dict, Iterable, List, Optional, TextIO, Tuple, Type
+
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.convert import CIDRv6
+from ip.pipeline import Chunk
+
+LIST_NAME = "Country_IP_Allows"
+SPOOL_SIZE = 1 << 22  # characters of IPv6 output kept in memory before they go to a temporary file
+SPOOL_BLOCK = 1 << 16
+
+_SUFFIXES = [str(i) for i in range(129)]
+_halves: List[str] = []
+
+
+def _dotted_halves() -> List[str]:
+    """Returns ``"a.b"`` for every 16-bit number ``a << 8 | b``, built on first use"""
+    if not _halves:
+        octets = [str(i) for i in range(256)]
+        _halves.extend(f"{a}.{b}" for a in octets for b in octets)
+    return _halves
+
+
+def format_subnets(ranges: CIDRSet) -> List[str]:
+    """Returns subnets as strings, e.g. ``192.0.2.0/24``; equal to ``[str(x) for x in ranges]``"""
+    suffixes = _SUFFIXES
+    if isinstance(ranges, CIDRv6Set):
+        int2ip = CIDRv6._int2ip
+        return [f"{int2ip(prefix)}/{suffixes[suffix]}" for prefix, suffix in ranges.pairs()]
+    halves = _dotted_halves()
+    return [f"{halves[prefix >> 16]}.{halves[prefix & 0xFFFF]}/{suffixes[suffix]}"
+            for prefix, suffix in ranges.pairs()]
+
+
+class OutputFormat:
+    """Output consisting of a section per address family (IPv4 first): header, subnets and footer.
+
+    Subnets are written by :attr:`lines` templates with ``{address}`` and ``{comment}`` fields.
+    """
+    extensions: Tuple[str, ...] = ()
+    headers = ("", "")
+    footers = ("", "")
+    lines = ("{address}\n", "{address}\n")
+
+    def __init__(self, comment: str = ""):
+        self.comment = comment
+
+    def header(self, family: int) -> str:
+        return self.headers[family].format(comment=self.comment, list=LIST_NAME)
+
+    def footer(self, family: int) -> str:
+        return self.footers[family].format(comment=self.comment, list=LIST_NAME)
+
+    def batch_parts(self, family: int) -> Tuple[str, str, str]:
+        """Returns ``(start, separator, end)`` so that a batch is ``start + separator.join(addresses) + end``"""
+        line = self.lines[family].replace("{address}", "\0").format(comment=self.comment, list=LIST_NAME)
+        before, after = line.split("\0")
+        return before, after + before, after
+
+    def format_batch(self, family: int, ranges: CIDRSet) -> str:
+        if not ranges:
+            return ""
+        start, separator, end = self.batch_parts(family)
+        return start + separator.join(format_subnets(ranges)) + end
+
+
+class PlainText(OutputFormat):
+    """One subnet per line"""
+
+
+class RouterOS(OutputFormat):
+    """MikroTik RouterOS script"""
+    extensions = (".rsc",)
+    headers = ("/ip firewall address-list\n", "/ipv6 firewall address-list\n")
+    footers = ("\n", "\n")
+    lines = ('add address={address} comment="{comment}" list={list}\n',) * 2
+
+
+class Nftables(OutputFormat):
+    """Script for ``nft -f`` filling interval sets of the ``inet filter`` table"""
+    extensions = (".nft",)
+    headers = ("add table inet filter\n"
+               "add set inet filter {list}_v4 {{ type ipv4_addr; flags interval; auto-merge; }}\n"
+               "add set inet filter {list}_v6 {{ type ipv6_addr; flags interval; auto-merge; }}\n"
+               "# {comment}\n", "")
+
+    def batch_parts(self, family: int) -> Tuple[str, str, str]:
+        return f"add element inet filter {LIST_NAME}_v{6 if family else 4} {{ ", ", ", " }\n"
+
+
+class Ipset(OutputFormat):
+    """Input of ``ipset restore``"""
+    extensions = (".ipset",)
+    headers = ("create {list} hash:net family inet comment -exist\n",
+               "create {list}_v6 hash:net family inet6 comment -exist\n")
+    lines = ('add {list} {address} comment "{comment}" -exist\n',
+             'add {list}_v6 {address} comment "{comment}" -exist\n')
+
+
+class Iptables(OutputFormat):
+    """Shell script accepting the subnets by ``iptables``/``ip6tables`` rules in their own chain"""
+    extensions = (".iptables",)
+    headers = ("iptables -N {list} 2>/dev/null\n", "ip6tables -N {list} 2>/dev/null\n")
+    lines = ('iptables -A {list} -s {address} -m comment --comment "{comment}" -j ACCEPT\n',
+             'ip6tables -A {list} -s {address} -m comment --comment "{comment}" -j ACCEPT\n')
+
+
+FORMATS: Dict[str, Type[OutputFormat]] = {
+    "plain": PlainText,
+    "rsc": RouterOS,
+    "nftables": Nftables,
+    "ipset": Ipset,
+    "iptables": Iptables,
+}
+
+
+def format_for_file(file_name: str) -> Type[OutputFormat]:
+    """Chooses the format by extension of ``file_name`` (ignoring ``.gz``); defaults to :class:`PlainText`"""
+    name = file_name.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    for output_format in FORMATS.values():
+        if name.endswith(output_format.extensions):
+            return output_format
+    return PlainText
+
+
+def open_output(file_name: str, do_append: bool):
+    mode = "a" if do_append else "w"
+    if file_name.lower().endswith(".gz"):
+        import gzip
+
+        return gzip.open(file_name, mode + "t", compresslevel=6)
+    return open(file_name, mode)
+
+
+def write_text(to_file, chunks: Iterable[Chunk], do_append: bool, comment: str = "",
+               output_format: Optional[Type[OutputFormat]] = None) -> int:
+    """Writes subnets in ``output_format`` (chosen by file extension by default), one batch per chunk and family
+
+    Returns the number of subnets written.
+    """
+    output = (output_format or format_for_file(to_file))(comment)
+    with open_output(to_file, do_append) as f:
+        return write_chunks(f, chunks, output)
+
+
+def write_chunks(f: TextIO, chunks: Iterable[Chunk], output: OutputFormat) -> int:
+    """Writes subnets into an open text file, e.g. :class:`io.StringIO`
+
+    IPv4 batches are written as they come. IPv6 ones are formatted into a temporary file (kept in memory up to
+    :data:`SPOOL_SIZE` characters) and copied after the IPv4 section when ``chunks`` are exhausted, because their
+    section comes second and aggregation hands out the last IPv4 subnets at the end,
+    see :class:`ip.pipeline.ChunkAggregator`. Returns the number of subnets written.
+    """
+    f.write(output.header(0))
+    count = 0
+    spool_v6 = None
+    try:
+        for ranges_v4, ranges_v6 in chunks:
+            f.write(output.format_batch(0, ranges_v4))
+            count += len(ranges_v4)
+            if ranges_v6:
+                if spool_v6 is None:
+                    spool_v6 = _spool()
+                spool_v6.write(output.format_batch(1, ranges_v6))
+                count += len(ranges_v6)
+        f.write(output.footer(0))
+        f.write(output.header(1))
+        if spool_v6 is not None:
+            spool_v6.seek(0)
+            while True:
+                block = spool_v6.read(SPOOL_BLOCK)
+                if not block:
+                    break
+                f.write(block)
+        f.write(output.footer(1))
+    finally:
+        if spool_v6 is not None:
+            spool_v6.close()
+    return count
+
+
+def _spool():
+    import tempfile
+
+    return tempfile.SpooledTemporaryFile(SPOOL_SIZE, "w+")
@@ -1,82 +1,287 @@
 import argparse
-from collections import deque
-from typing import Deque, Callable
+import os
+from functools import partial
+from itertools import chain
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, Tuple
 
-from ip import aggregate_subnets
-from ip.convert import CIDR, CIDRv6
-from ip.db import create_connection, insert_into
+# only modules needed by every run are imported here; the others load with the option which needs them
+from ip.cache import DEFAULT_DIRECTORY, DEFAULT_MAX_BYTES
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.parse import PARSERS
+from ip.pipeline import (CHUNK_SIZE, RUN_SIZE, Chunk, PipelineStats, aggregate_chunks, aggregate_countries,
+                         filter_chunks, parse_chunks, read_chunks, read_ranges)
+from ip.writers import FORMATS, write_text
+from ip.metrics import DISABLED, Metrics, profile, subnet_count
+from ip.db import BATCH_SIZE, TABLES, Backend, MySQLBackend, clear_list, connect, sync_into, to_rows
 
+if TYPE_CHECKING:
+    from ip.cache import AggregateCache
 
-# noinspection PyUnusedLocal
-def write_plain_text(to_file, ranges_v4: Deque[CIDR], ranges_v6: Deque[CIDR], do_append: bool, comment: str = None):
-    with open(to_file, "a" if do_append else "w") as f:
-        for x in ranges_v4 + ranges_v6:
-            f.write(f"{x}\n")
+DEFAULT_COMMENT = "Czech Republic"
+COUNTRY_NAMES = {"CZ": "Czech Republic", "SK": "Slovakia"}
 
 
-def write_rsc(to_file, ranges_v4: Deque[CIDR], ranges_v6: Deque[CIDR], do_append: bool, comment: str):
-    with open(to_file, "a" if do_append else "w") as f:
-        f.write("/ip firewall address-list\n")
-        for x in ranges_v4:
-            f.write(f'add address={x} comment="{comment}" list=Country_IP_Allows\n')
-        f.write("\n")
-        f.write("/ipv6 firewall address-list\n")
-        for x in ranges_v6:
-            f.write(f'add address={x} comment="{comment}" list=Country_IP_Allows\n')
-        f.write("\n")
+def write_index(to_file, chunks: Iterable[Chunk], do_append: bool, comment: str) -> int:
+    """Writes a binary lookup index (see :mod:`ip.lookup`); the comment is the payload of every subnet
 
+    Returns the number of subnets written.
+    """
+    from ip.lookup import LookupIndex, load_entries
 
-def write_to_db(to_file, ranges_v4: Deque[CIDR], ranges_v6: Deque[CIDR], do_append: bool, comment: str):
-    with open(to_file) as f:
-        exec(f.read())
-    connection = create_connection(locals()["ADDRESS"], locals()["USER"], locals()["PASSWORD"], locals()["DB"])
+    entries = list(load_entries(to_file)) if do_append and os.path.exists(to_file) else []
+    ranges = (CIDRSet(), CIDRv6Set())
+    for chunk in chunks:
+        for collected, chunk_ranges in zip(ranges, chunk):
+            collected.extend(chunk_ranges)
+    entries.extend((comment, family_ranges) for family_ranges in ranges)
+    LookupIndex(entries).save(to_file)
+    return subnet_count(ranges)
+
+
+def write_to_db(chunks: Iterable[Chunk], do_append: bool, comment: str, backend: Backend,
+                sync: bool = False, batch_size: int = BATCH_SIZE, strategy: str = "executemany") -> int:
+    """Inserts the subnets into both tables, or only the changes with ``sync``; returns the number of inserted rows"""
+    if sync:
+        ranges = (CIDRSet(), CIDRv6Set())
+        for chunk in chunks:
+            for collected, chunk_ranges in zip(ranges, chunk):
+                collected.extend(chunk_ranges)
+        return sum(sync_into(backend, table, table_ranges, comment, batch_size)[0]
+                   for table, table_ranges in zip(TABLES, ranges))
+    counts = [0, 0]
     try:
-        insert_into(connection, "address_list_ipv4", ranges_v4, comment, delete_old=not do_append)
-        insert_into(connection, "address_list_ipv6", ranges_v6, comment, delete_old=not do_append)
-    finally:
-        connection.close()
+        for table in TABLES:
+            clear_list(backend, table, delete_old=not do_append)
+        for chunk in chunks:
+            for family, ranges in enumerate(chunk):
+                counts[family] += backend.insert_rows(TABLES[family], to_rows(ranges, comment), batch_size, strategy)
+        backend.commit()
+    except Exception:
+        backend.rollback()
+        raise
+    for table, count in zip(TABLES, counts):
+        print(f"Do tabulky {table} bylo vloženo {count} řádků.")
+    return sum(counts)
 
 
-def process_file(args: argparse.Namespace, write_routine: Callable[[str, Deque[CIDR], Deque[CIDR], bool, str], None]):
+def process_file(args: argparse.Namespace, write_routine: Callable[[str, Iterable[Chunk], bool, str], int],
+                 metrics: Metrics = DISABLED):
     from_file = args.from_file
     to_file = args.destination
-    filter_str = args.filter
     do_append = args.append
-    with open(from_file) as f:
+    cache, file_hash = open_cache(args)
+    key = cache and cache.key(file_hash, filter=args.filter, format=args.format, union=args.union or args.unsorted)
+    cached = cache and cache.get(key)
+    if cached:
+        print(f"Loading {from_file} from cache...")
+        chunk, stats = cached
+        chunks = [chunk]
+    else:
         print(f"Loading {from_file}...")
-        ranges_v4 = deque()
-        ranges_v6 = deque()
-        len_orig_v4 = 0
-        len_orig_v6 = 0
-        for line in f:
-            if filter_str and filter_str not in line:
-                continue
-            line = line.strip()
-            if not line:
-                continue
-            if CIDR.match(line):
-                len_orig_v4 += 1
-                ranges_v4.extend(CIDR.many_from_str(line))
-                continue
-            if CIDRv6.match(line):
-                len_orig_v6 += 1
-                ranges_v6.extend(CIDRv6.many_from_str(line))
-                continue
-            raise ValueError(f"Unprocessed line!\n'{line}'")
-    print("Aggregating...")
-    print(f"original v4 ranges = {len_orig_v4:n}")
-    print(f"original v6 ranges = {len_orig_v6:n}")
-    ranges_v4 = aggregate_subnets(ranges_v4, report=True)
-    len_final_v4 = len(ranges_v4)
-    if len_orig_v4:
-        print(f"aggregated v4 ranges = {len_final_v4:n} ({100 * len_final_v4 / len_orig_v4:.2f}%)")
-    ranges_v6 = aggregate_subnets(ranges_v6, report=True)
-    len_final_v6 = len(ranges_v6)
-    if len_orig_v6:
-        print(f"aggregated v6 ranges = {len_final_v6:n} ({100 * len_final_v6 / len_orig_v6:.2f}%)")
-    write_routine(to_file, ranges_v4, ranges_v6, do_append, args.comment)
+        stats = PipelineStats()
+        chunks = metrics.time_iter("read", read_chunks(from_file, args.chunk_size), "lines_read")
+        chunks = metrics.time_iter("filter", filter_chunks(chunks, args.filter), "lines_parsed")
+        if args.jobs > 1:
+            from ip.parallel import aggregate_parallel
+            chunks = aggregate_parallel(chunks, stats, args.jobs, args.format, union=args.union)
+            chunks = metrics.time_iter("parse+aggregate", chunks, "subnets_aggregated", subnet_count)
+        else:
+            chunks = metrics.time_iter("parse", parse_chunks(chunks, stats, args.format), "subnets_parsed",
+                                       subnet_count)
+            if args.unsorted:
+                from ip.external import aggregate_unsorted
+                chunks = aggregate_unsorted(chunks, stats, args.sort_buffer, args.tmp_dir, args.chunk_size)
+            else:
+                chunks = aggregate_chunks(chunks, stats, union=args.union)
+            chunks = metrics.time_iter("aggregate", chunks, "subnets_aggregated", subnet_count)
+        if cache:
+            chunks = store_in_cache(chunks, cache, key, stats)
+    if transforms_result(args):
+        chunks = metrics.time_iter("transform", transform_ranges(chunks, stats, args, read_excluded(args.exclude)))
+    with metrics.timer("write"):
+        metrics.add("rows_written", write_routine(to_file, chunks, do_append, args.comment or DEFAULT_COMMENT))
+    metrics.add_stats(stats)
+    print_report(stats)
     print(f"Nové IP rozsahy {'připojeny k' if do_append else 'zapsány do'} "
-          f"{'DB dle' if write_routine == write_to_db else 'souboru'} {to_file}\n")
+          f"{'DB dle' if args.to_db else 'souboru'} {to_file}\n")
+
+
+def split_countries(value: str) -> List[str]:
+    """Returns upper-case country codes of a comma separated list, e.g. ``"cz, sk"``"""
+    return [country.strip() for country in value.upper().split(",") if country.strip()]
+
+
+def process_countries(args: argparse.Namespace, write_routine: Callable[[str, Iterable[Chunk], bool, str], int],
+                      metrics: Metrics = DISABLED):
+    """Reads the input once and writes every requested country separately"""
+    from_file = args.from_file
+    countries = None if args.countries.strip().lower() == "all" else split_countries(args.countries)
+    cache, file_hash = open_cache(args)
+    keys = {}
+    results = None
+    if cache and countries:  # "all" countries are not known before the input is read
+        keys = {country: cache.key(file_hash, filter=args.filter, format=args.format, union=args.union,
+                                   country=country) for country in countries}
+        results = {country: cache.get(key) for country, key in keys.items()}
+        if all(results.values()):
+            print(f"Loading {from_file} from cache...")
+        else:
+            results = None
+    if results is None:
+        print(f"Loading {from_file}...")
+        chunks = metrics.time_iter("read", read_chunks(from_file, args.chunk_size), "lines_read")
+        chunks = metrics.time_iter("filter", filter_chunks(chunks, args.filter), "lines_parsed")
+        with metrics.timer("parse+aggregate"):
+            results = aggregate_countries(chunks, countries, args.format, union=args.union)
+        for country, key in keys.items():
+            if country in results:
+                cache.put(key, *results[country])
+    excluded = read_excluded(args.exclude)
+    do_append = args.append
+    for country in countries or sorted(results):
+        if country not in results:
+            print(f"Ve vstupu nejsou žádné rozsahy pro zemi {country}\n")
+            continue
+        chunk, stats = results[country]
+        # other braces in the path or comment are kept as they are
+        to_file = args.destination.replace("{country}", country)
+        comment = args.comment.replace("{country}", country) if args.comment else COUNTRY_NAMES.get(country, country)
+        chunks = [chunk]
+        if transforms_result(args):
+            chunks = metrics.time_iter("transform", transform_ranges(chunks, stats, args, excluded))
+        with metrics.timer("write"):
+            metrics.add("rows_written", write_routine(to_file, chunks, do_append, comment))
+        metrics.add_stats(stats)
+        print(f"--- {country} ({comment}) ---")
+        print_report(stats)
+        print(f"Nové IP rozsahy {'připojeny k' if do_append else 'zapsány do'} "
+              f"{'DB dle' if args.to_db else 'souboru'} {to_file}\n")
+        if to_file == args.destination:
+            do_append = True  # all countries go to the same destination
+
+
+def process_delta(args: argparse.Namespace, write_routine: Callable[[str, Iterable[Chunk], bool, str], int],
+                  metrics: Metrics = DISABLED):
+    """Updates subnets aggregated from a previous version of the input by the lines changed since then"""
+    from ip.delta import update_aggregated
+
+    old_input, previous_output = args.update
+    print(f"Loading changes between {old_input} and {args.from_file}...")
+    with metrics.timer("update"):
+        delta, stats = update_aggregated(previous_output, old_input, args.from_file, args.filter, args.format)
+    metrics.add("lines_added", delta.lines_added)
+    metrics.add("lines_removed", delta.lines_removed)
+    print(f"changed input lines: +{delta.lines_added:n} -{delta.lines_removed:n}")
+    print(f"changed subnets: +{sum(map(len, delta.added)):n} -{sum(map(len, delta.removed)):n}")
+    with metrics.timer("write"):
+        metrics.add("rows_written",
+                    write_routine(args.destination, [delta.ranges], args.append, args.comment or DEFAULT_COMMENT))
+    metrics.add_stats(stats)
+    print_report(stats)
+    if args.diff:
+        with open(args.diff, "w") as f:
+            for sign, chunk in (("-", delta.removed), ("+", delta.added)):
+                for x in chain(*chunk):
+                    f.write(f"{sign}{x}\n")
+        print(f"Změny subnetů zapsány do souboru {args.diff}")
+    print(f"Nové IP rozsahy {'připojeny k' if args.append else 'zapsány do'} "
+          f"{'DB dle' if args.to_db else 'souboru'} {args.destination}\n")
+
+
+def process_sources(args: argparse.Namespace, write_routine: Callable[[str, Iterable[Chunk], bool, str], int],
+                    metrics: Metrics = DISABLED):
+    """Reads the input and all ``--source`` inputs concurrently and writes their union aggregated together"""
+    from ip.sources import Source, fetch_and_aggregate
+
+    sources = [Source.from_spec(spec, args.format) for spec in [args.from_file] + (args.source or [])]
+    countries = args.source_countries and split_countries(args.source_countries)
+    print(f"Loading {', '.join(source.location for source in sources)}...")
+    stats = PipelineStats()
+    with metrics.timer("fetch+aggregate"):
+        chunk = fetch_and_aggregate(sources, stats, args.filter, countries, args.chunk_size)
+    for source in sources:
+        print(f"{source.location} ({source.line_format}): "
+              f"{source.stats.lines_v4 + source.stats.lines_v6:n} rozsahů")
+    metrics.add("subnets_aggregated", subnet_count(chunk))
+    chunks = [chunk]
+    if transforms_result(args):
+        chunks = metrics.time_iter("transform", transform_ranges(chunks, stats, args, read_excluded(args.exclude)))
+    with metrics.timer("write"):
+        metrics.add("rows_written",
+                    write_routine(args.destination, chunks, args.append, args.comment or DEFAULT_COMMENT))
+    metrics.add_stats(stats)
+    print_report(stats)
+    print(f"Nové IP rozsahy {'připojeny k' if args.append else 'zapsány do'} "
+          f"{'DB dle' if args.to_db else 'souboru'} {args.destination}\n")
+
+
+def read_excluded(file_names: Optional[List[str]]) -> Optional[Chunk]:
+    """Returns subnets of all ``--exclude`` files, or ``None`` when there are none"""
+    if not file_names:
+        return None
+    excluded = (CIDRSet(), CIDRv6Set())
+    for file_name in file_names:
+        excluded = tuple(ranges | more for ranges, more in zip(excluded, read_ranges(file_name)))
+    return excluded
+
+
+def transforms_result(args: argparse.Namespace) -> bool:
+    return bool(args.exclude or args.complement or args.max_entries is not None or args.max_extra is not None)
+
+
+def transform_ranges(chunks: Iterable[Chunk], stats: PipelineStats, args: argparse.Namespace,
+                     excluded: Optional[Chunk]) -> Iterator[Chunk]:
+    """Collects all subnets and applies --exclude, --complement and lossy aggregation to them; updates ``stats``"""
+    from ip.lossy import aggregate_lossy
+
+    ranges = (CIDRSet(), CIDRv6Set())
+    for chunk in chunks:
+        for collected, chunk_ranges in zip(ranges, chunk):
+            collected.extend(chunk_ranges)
+    if excluded:
+        ranges = tuple(collected - more for collected, more in zip(ranges, excluded))
+    if args.complement:
+        ranges = tuple(~collected for collected in ranges)
+    if args.max_entries is not None or args.max_extra is not None:
+        (ranges_v4, stats.extra_addresses_v4), (ranges_v6, stats.extra_addresses_v6) = (
+            aggregate_lossy(collected, args.max_entries, args.max_extra) for collected in ranges)
+        ranges = ranges_v4, ranges_v6
+    stats.subnets_v4, stats.subnets_v6 = map(len, ranges)
+    stats.addresses_v4, stats.addresses_v6 = (collected.size() for collected in ranges)
+    yield ranges
+
+
+def open_cache(args: argparse.Namespace) -> Tuple[Optional["AggregateCache"], Optional[str]]:
+    """Returns the cache selected by ``--cache`` and hash of the input file, or ``None, None``"""
+    if not args.cache:
+        return None, None
+    from ip.cache import AggregateCache, hash_file
+
+    return AggregateCache(args.cache, args.cache_size << 20), hash_file(args.from_file)
+
+
+def store_in_cache(chunks: Iterable[Chunk], cache: "AggregateCache", key: str,
+                   stats: PipelineStats) -> Iterator[Chunk]:
+    """Passes chunks through and stores all of them in the cache once they are exhausted"""
+    collected = (CIDRSet(), CIDRv6Set())
+    for chunk in chunks:
+        for ranges, chunk_ranges in zip(collected, chunk):
+            ranges.extend(chunk_ranges)
+        yield chunk
+    cache.put(key, collected, stats)
+
+
+def print_report(stats: PipelineStats):
+    print(f"original v4 ranges = {stats.lines_v4:n}")
+    print(f"original v6 ranges = {stats.lines_v6:n}")
+    for family, total, len_orig, len_final, extra in (
+            ("v4", stats.addresses_v4, stats.lines_v4, stats.subnets_v4, stats.extra_addresses_v4),
+            ("v6", stats.addresses_v6, stats.lines_v6, stats.subnets_v6, stats.extra_addresses_v6)):
+        print(f"Total number of {family} addresses: {total:n}", '' if total < 1e9 else f"~= {total:.2e}")
+        if len_orig:
+            print(f"aggregated {family} ranges = {len_final:n} ({100 * len_final / len_orig:.2f}%)")
+        if extra:
+            print(f"added {family} addresses = {extra:n} (lossy aggregation)")
 
 
 def parse_arguments():
@@ -86,7 +291,9 @@ def parse_arguments():
                     "\n"
                     "Příklad použití:\n"
                     """python3 src/main.py czsk.csv --to-db db-config.py --filter ",CZ" && """
-                    """python3 src/main.py czsk.csv --to-db db-config.py --filter ",SK" --append --comment Slovakia""",
+                    """python3 src/main.py czsk.csv --to-db db-config.py --filter ",SK" --append --comment Slovakia\n"""
+                    "nebo jedním průchodem vstupu:\n"
+                    """python3 src/main.py czsk.csv --to-db db-config.py --countries CZ,SK""",
         formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument('from_file', help='jméno souboru, který obsahuje IP rozsahy; '
                                           'na každém řádku právě jeden rozsah;\n'
@@ -95,14 +302,105 @@ def parse_arguments():
                                           "    5.6.7.0  ,  5.6.7.128  ,  KOMENTÁŘ",
                         )
     parser.add_argument("destination", help="soubor pro výstup; "
-                                            "formát výstupních dat závisí na příponě uvedeného souboru.")
+                                            "formát výstupních dat závisí na příponě uvedeného souboru:\n"
+                                            "    .rsc      = skript pro MikroTik\n"
+                                            "    .nft      = skript pro nft -f (množiny v tabulce inet filter)\n"
+                                            "    .ipset    = vstup pro ipset restore\n"
+                                            "    .iptables = shellový skript s pravidly iptables/ip6tables\n"
+                                            "    .idx      = binární index pro vyhledávání adres (python3 -m ip.lookup)\n"
+                                            "    jinak seznam subnetů, jeden na řádek\n"
+                                            "přípona .gz navíc výstup zkomprimuje (např. seznam.rsc.gz)")
     parser.add_argument("--append", "-a", action="store_true",
                         help="zachová předchozí výstupní data, tedy NEpřepíše soubor, NEsmaže stará data z databáze;\n"
                              "NEkontroluje, jestli tímto nevzniknou duplicitní záznamy")
-    parser.add_argument("--comment", default="Czech Republic",
-                        help="komentář přidělený každému výstupnímu záznamu (výchozí hodnota: 'Czech Republic')")
+    parser.add_argument("--comment",
+                        help=f"komentář přidělený každému výstupnímu záznamu (výchozí hodnota: '{DEFAULT_COMMENT}');\n"
+                             "s --countries může obsahovat {country} a výchozí hodnotou je název země")
     parser.add_argument("--filter",
                         help="zpracuje pouze takové vstupní řádky, které obsahují zadaný řetězec")
+    parser.add_argument("--countries",
+                        help="seznam kódů zemí oddělených čárkou (např. CZ,SK) nebo 'all';\n"
+                             "vstup se načte jen jednou a každá země se agreguje a zapíše zvlášť;\n"
+                             "obsahuje-li 'destination' {country}, zapíše se každá země do vlastního souboru,\n"
+                             "jinak se všechny země zapíší za sebou do jednoho výstupu")
+    parser.add_argument("--format", choices=("auto",) + tuple(PARSERS), default="auto",
+                        help="formát vstupního souboru (výchozí hodnota: auto);\n"
+                             "    dbip-csv      = 5.6.7.0,5.6.7.128,CZ\n"
+                             "    cidr-list     = 1.2.3.0/24\n"
+                             "    rir-delegated = ripencc|CZ|ipv4|5.6.7.0|256|20100512|allocated\n"
+                             "konkrétní formát se zpracuje rychleji než auto, které zkouší všechny formáty")
+    parser.add_argument("--output-format", choices=tuple(FORMATS),
+                        help="formát výstupního souboru bez ohledu na jeho příponu")
+    parser.add_argument("--union", action="store_true",
+                        help="sloučí i překrývající se a sousední rozsahy; vstup pak nemusí být seřazený")
+    parser.add_argument("--unsorted", action="store_true",
+                        help="vstup nemusí být seřazený (např. spojené soubory z více zdrojů); subnety se seřadí\n"
+                             "externě po dávkách uložených do dočasných souborů, takže paměť zůstává omezená\n"
+                             "i pro vstup větší než RAM; překrývající se a sousední rozsahy se sloučí jako s --union")
+    parser.add_argument("--sort-buffer", type=int, default=RUN_SIZE, metavar="N",
+                        help=f"s --unsorted: počet subnetů jedné rodiny adres v paměti, než se seřazené zapíší\n"
+                             f"do dočasného souboru (výchozí hodnota: {RUN_SIZE})")
+    parser.add_argument("--tmp-dir", metavar="DIR",
+                        help="s --unsorted: adresář pro dočasné soubory (výchozí: systémový, viz TMPDIR)")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="počet procesů pro paralelní zpracování (výchozí hodnota: 1);\n"
+                             "při více procesech se celý vstup drží v paměti")
+    parser.add_argument("--exclude", action="append", metavar="FILE",
+                        help="odečte od výsledku IP rozsahy ze souboru FILE (např. vlastní blocklist);\n"
+                             "lze zadat vícekrát; výsledek je nejmenší možný počet subnetů")
+    parser.add_argument("--complement", action="store_true",
+                        help="zapíše naopak všechny adresy, které ve výsledku NEjsou (např. pro deny-list)")
+    parser.add_argument("--max-entries", type=int, metavar="N",
+                        help="ztrátová agregace: slučuje sousední subnety do společného nadřazeného subnetu, dokud\n"
+                             "jich není nejvýše N (pro IPv4 a IPv6 zvlášť); přednost mají sloučení, která přidají\n"
+                             "nejméně adres navíc; počet přidaných adres se vypíše")
+    parser.add_argument("--max-extra", type=int, metavar="N",
+                        help="ztrátová agregace: slučuje subnety, dokud by celkem nepřidala víc než N adres navíc\n"
+                             "(pro IPv4 a IPv6 zvlášť); s --max-entries platí obě omezení")
+    parser.add_argument("--update", nargs=2, metavar=("OLD_FILE", "OLD_OUTPUT"),
+                        help="místo agregace celého vstupu aplikuje jen řádky změněné oproti předchozí verzi vstupu\n"
+                             "OLD_FILE na seznam subnetů OLD_OUTPUT, který z ní vznikl (jeden subnet na řádek);\n"
+                             "rozsahy ve vstupu se nesmí překrývat")
+    parser.add_argument("--diff", metavar="FILE",
+                        help="s --update: zapíše přidané (+) a odebrané (-) subnety do souboru FILE")
+    parser.add_argument("--source", action="append", metavar="[FORMAT=]LOCATION",
+                        help="další vstup zpracovaný souběžně s 'from_file' (lze zadat vícekrát); vstupem může být\n"
+                             "soubor, soubor .gz nebo URL http(s)://; formát se pozná z prvního řádku, nebo se zadá\n"
+                             "předponou, např. rir-delegated=https://ftp.ripe.net/.../delegated-ripencc-latest;\n"
+                             "zapíše se sjednocení všech vstupů; i samotný 'from_file' může být .gz nebo URL")
+    parser.add_argument("--source-countries", metavar="CC[,CC...]",
+                        help="se --source: zpracuje jen rozsahy zadaných zemí (sloupec země v dbip i RIR formátu);\n"
+                             "řádky bez země (seznam subnetů) se zpracují vždy")
+    parser.add_argument("--cache", nargs="?", const=DEFAULT_DIRECTORY, metavar="DIR",
+                        help=f"uloží výsledek agregace do cache (výchozí adresář: {DEFAULT_DIRECTORY});\n"
+                             "při nezměněném vstupu a parametrech se vstup znovu nezpracovává")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES >> 20, metavar="MB",
+                        help=f"maximální velikost cache v MB (výchozí hodnota: {DEFAULT_MAX_BYTES >> 20});\n"
+                             "nejdéle nepoužité záznamy se mažou")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help=f"počet vstupních řádků zpracovaných najednou (výchozí hodnota: {CHUNK_SIZE});\n"
+                             "seřazený vstup se agreguje průběžně, takže spotřeba paměti nezávisí na velikosti\n"
+                             "souboru (výstup IPv6 se do konce vstupu odkládá do dočasného souboru)")
+
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="zapíše strojově čitelné metriky běhu (časy fází, počty řádků a subnetů, paměť)\n"
+                             "do souboru FILE; formát dle --metrics-format")
+    parser.add_argument("--metrics-format", choices=("json", "prometheus"),
+                        help="formát metrik (výchozí: prometheus pro soubor *.prom, jinak json);\n"
+                             "prometheus = textfile pro node_exporter")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profiluje běh pomocí cProfile a uloží statistiky do souboru FILE")
+
+    parser.add_argument("--sync", action="store_true",
+                        help="s --to-db: místo smazání a vložení všech řádků seznamu vloží jen nové\n"
+                             "a smaže jen zaniklé řádky se stejným komentářem; --append se ignoruje")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"počet řádků v jednom INSERT dotazu a v jedné transakci při --sync "
+                             f"(výchozí hodnota: {BATCH_SIZE})")
+    parser.add_argument("--db-strategy", choices=MySQLBackend.STRATEGIES, default="executemany",
+                        help="způsob vkládání řádků do DB (výchozí hodnota: executemany);\n"
+                             "    values    = jeden INSERT s mnoha řádky na každou dávku\n"
+                             "    load-data = LOAD DATA LOCAL INFILE, jen MySQL s povoleným local_infile")
 
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("--to-file", "-f", action="store_true",
@@ -110,26 +408,77 @@ def parse_arguments():
     group.add_argument("--to-db", "-d", action="store_true",
                        help="výstup bude zapsán do databáze;\n"
                             "soubor s údaji potřebnými pro připojení k DB je specifikovaný parametrem 'destination'")
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.unsorted and (args.countries or args.jobs > 1 or args.update):
+        parser.error("--unsorted nelze kombinovat s --countries, --jobs ani --update")
+    if args.countries and args.jobs > 1:
+        parser.error("--countries nelze kombinovat s --jobs")
+    if args.update and args.countries:
+        parser.error("--update nelze kombinovat s --countries")
+    if args.update and transforms_result(args):
+        parser.error("--update nelze kombinovat s --exclude, --complement, --max-entries ani --max-extra")
+    if args.diff and not args.update:
+        parser.error("--diff lze použít jen s --update")
+    args.use_sources = bool(args.source)
+    if not args.use_sources and (args.from_file.endswith(".gz") or not os.path.exists(args.from_file)):
+        from ip.sources import needs_sources  # a URL or FORMAT=LOCATION isn't an existing file
+
+        args.use_sources = needs_sources(args.from_file)
+    if args.use_sources and (args.countries or args.update or args.jobs > 1 or args.cache):
+        parser.error("--source, soubor .gz ani URL nelze kombinovat s --countries, --update, --jobs ani --cache")
+    if args.source_countries and not args.use_sources:
+        parser.error("--source-countries lze použít jen se --source")
+    return args
 
 
 def cli():
+    import locale
+
+    locale.setlocale(locale.LC_ALL, '')  # thousands separators of the reports
     args = parse_arguments()
+    metrics = Metrics() if args.metrics else DISABLED
+    with profile(args.profile):
+        run(args, metrics)
+    if args.metrics:
+        metrics.add_derived()
+        metrics.write(args.metrics, args.metrics_format)
+        print(f"Metriky zapsány do souboru {args.metrics}")
+    if args.profile:
+        print(f"Profil zapsán do souboru {args.profile} (python3 -m pstats {args.profile})")
+
+
+def select_process(args: argparse.Namespace) -> Callable:
+    if args.update:
+        return process_delta
+    if args.use_sources:
+        return process_sources
+    return process_countries if args.countries else process_file
+
+
+def run(args: argparse.Namespace, metrics: Metrics):
     destination = args.destination  # type: str
     if args.to_file:
         assert not destination.endswith(".py"), f"Pravděpodobná chyba v zadaných parametrech, " \
                                                 f"výstupní soubor {destination} je Python skript!"
-        write_routine = write_rsc if destination.lower().endswith(".rsc") else write_plain_text
-        process_file(args=args, write_routine=write_routine)
+        if destination.lower().endswith(".idx"):
+            write_routine = write_index
+        else:
+            write_routine = partial(write_text, output_format=args.output_format and FORMATS[args.output_format])
+        select_process(args)(args=args, write_routine=write_routine, metrics=metrics)
     elif args.to_db:
         assert destination.endswith(".py"), f"Pravděpodobná chyba v zadaných parametrech, " \
                                             f" soubor {destination} musí být Python skript!"
+        config = {}
         with open(destination) as f:
-            exec(f.read())
-        db_vars = {"ADDRESS", "DB", "USER", "PASSWORD"}
-        assert db_vars.issubset(locals().keys()), f"Chybí tyto hodnoty: {db_vars - locals().keys()}"
-        # TODO: podpora CZ+SK
-        process_file(args=args, write_routine=write_to_db)
+            exec(f.read(), config)
+        db_vars = {"DB"} if config.get("BACKEND") == "sqlite" else {"ADDRESS", "DB", "USER", "PASSWORD"}
+        assert db_vars.issubset(config.keys()), f"Chybí tyto hodnoty: {db_vars - config.keys()}"
+        process = select_process(args)
+        with connect(config, allow_local_infile=args.db_strategy == "load-data") as backend:
+            # the destination is the DB config file, so it isn't passed on
+            process(args=args, metrics=metrics,
+                    write_routine=lambda _, *rest: write_to_db(*rest, backend=backend, sync=args.sync,
+                                                               batch_size=args.batch_size, strategy=args.db_strategy))
     else:
         raise ValueError(f"Nebyla zvolena žádná známá akce;\nargs={args}")
 
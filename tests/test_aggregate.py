@@ -0,0 +1,59 @@
+from collections import deque
+from os.path import abspath, dirname, join
+
+import pytest
+
+from ip import aggregate_subnets, aggregate_subnets_reference
+from ip.convert import CIDR, CIDRv6
+
+RANGES_FILE = join(dirname(abspath(__file__)), "..", "czech_ranges.txt")
+AGGREGATED_FILE = join(dirname(abspath(__file__)), "..", "czech_ranges_aggregated.txt")
+
+
+def load(file_name, cls=CIDR):
+    with open(file_name) as f:
+        return deque(cls.from_str(line) for line in f if line.strip())
+
+
+def subnets(*strings, cls=CIDR):
+    return deque(cls.from_str(s) for s in strings)
+
+
+def test_matches_reference():
+    ranges = load(RANGES_FILE)
+    aggregated = aggregate_subnets(ranges)
+    assert aggregated == aggregate_subnets_reference(ranges)
+    assert [str(x) for x in aggregated] == [str(x) for x in load(AGGREGATED_FILE)]
+
+
+def test_matches_reference_union():
+    ranges = load(RANGES_FILE)
+    assert aggregate_subnets(ranges, union=True) == aggregate_subnets_reference(ranges)
+
+
+@pytest.mark.parametrize("strings,expected", [
+    (["10.0.0.0/24", "10.0.1.0/24", "10.0.2.0/23"], ["10.0.0.0/22"]),
+    (["10.0.1.0/24", "10.0.2.0/24"], ["10.0.1.0/24", "10.0.2.0/24"]),
+    (["10.0.0.0/25", "10.0.0.128/26", "10.0.0.192/26", "10.0.2.0/24"], ["10.0.0.0/24", "10.0.2.0/24"]),
+])
+def test_merge_buddies(strings, expected):
+    assert [str(x) for x in aggregate_subnets(subnets(*strings))] == expected
+
+
+def test_union_overlapping_and_unsorted():
+    ranges = subnets("10.0.2.0/23", "10.0.0.0/24", "10.0.0.128/25", "10.0.1.0/24", "10.0.5.0/24", "10.0.4.0/23")
+    assert [str(x) for x in aggregate_subnets(ranges, union=True)] == ["10.0.0.0/22", "10.0.4.0/23"]
+
+
+def test_union_from_zero():
+    ranges = subnets("0.0.0.0/31", "0.0.0.2/32")
+    assert [str(x) for x in aggregate_subnets(ranges, union=True)] == ["0.0.0.0/31", "0.0.0.2/32"]
+
+
+def test_ipv6():
+    ranges = subnets("2a03:4a80::/33", "2a03:4a80:8000::/33", "2a03:4a81::/32", cls=CIDRv6)
+    assert [str(x) for x in aggregate_subnets(ranges)] == ["2a03:4a80::/31"]
+
+
+def test_empty():
+    assert aggregate_subnets(deque()) == deque()
@@ -0,0 +1,62 @@
+import os
+from dataclasses import replace
+from os.path import abspath, dirname, join
+
+import pytest
+
+from ip.cache import AggregateCache, hash_file
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.pipeline import PipelineStats, aggregate_chunks, filter_chunks, parse_chunks, read_chunks
+
+ADDRESS_FILE = join(dirname(abspath(__file__)), "..", "czsk.csv")
+
+
+@pytest.fixture(scope="module")
+def aggregated():
+    stats = PipelineStats()
+    chunk = (CIDRSet(), CIDRv6Set())
+    for ranges_v4, ranges_v6 in aggregate_chunks(parse_chunks(filter_chunks(read_chunks(ADDRESS_FILE), ",CZ"), stats),
+                                                 stats):
+        chunk[0].extend(ranges_v4)
+        chunk[1].extend(ranges_v6)
+    return chunk, stats
+
+
+def test_key_depends_on_input_and_options():
+    file_hash = hash_file(ADDRESS_FILE)
+    assert AggregateCache.key(file_hash, union=False, filter=",CZ") == AggregateCache.key(file_hash, filter=",CZ",
+                                                                                          union=False)
+    assert AggregateCache.key(file_hash, union=False) != AggregateCache.key(file_hash, union=True)
+    assert AggregateCache.key(file_hash) != AggregateCache.key(hash_file(__file__))
+
+
+def test_roundtrip(tmp_path, aggregated):
+    cache = AggregateCache(str(tmp_path))
+    key = AggregateCache.key(hash_file(ADDRESS_FILE), filter=",CZ")
+    assert cache.get(key) is None
+    cache.put(key, *aggregated)
+    chunk, stats = cache.get(key)
+    assert chunk == aggregated[0]
+    assert stats == replace(aggregated[1], ranges_split=0, merges=0)
+
+
+def test_corrupted_entry_is_a_miss(tmp_path, aggregated):
+    cache = AggregateCache(str(tmp_path))
+    cache.put("key", *aggregated)
+    path = join(str(tmp_path), "key-v6.bin")
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 1)
+    assert cache.get("key") is None
+
+
+def test_eviction(tmp_path, aggregated):
+    chunk, stats = aggregated
+    entry_size = sum(len(ranges.tobytes()) + 24 for ranges in chunk)
+    cache = AggregateCache(str(tmp_path), max_bytes=2 * entry_size)
+    for i, key in enumerate(("a", "b", "c")):
+        cache.put(key, chunk, stats)
+        for family in ("v4", "v6"):  # make the order of use independent of the timestamp resolution
+            os.utime(join(str(tmp_path), f"{key}-{family}.bin"), (i, i))
+    cache.evict()
+    assert cache.get("a") is None
+    assert cache.get("b") is not None and cache.get("c") is not None
@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from ip import aggregate_subnets
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.convert import CIDR, CIDRv6
+
+
+def test_cidrset():
+    subnets = [CIDR.from_str("10.0.0.0/24"), CIDR.from_str("10.0.1.0/24"), CIDR.from_str("255.255.255.255/32")]
+    s = CIDRSet(subnets)
+    assert len(s) == 3
+    assert list(s) == subnets
+    assert s[2].ip == "255.255.255.255"
+    assert str(s[0]) == "10.0.0.0/24"
+    assert s.size() == 513
+    assert s == CIDRSet.from_pairs(s.pairs())
+
+
+def test_cidrv6set():
+    subnets = [CIDRv6.from_str("2a03:4a80::/32"), CIDRv6.from_str("2a03:4a80:3:ffff:ffff:ffff:ffff:ffff/128")]
+    s = CIDRv6Set(subnets)
+    assert list(s) == subnets
+    assert s[1].ip == "2a03:4a80:3:ffff:ffff:ffff:ffff:ffff"
+    assert s.size() == (1 << 96) + 1
+    assert s != CIDRSet()
+
+
+def test_aggregate_cidrset():
+    s = aggregate_subnets(CIDRv6Set([CIDRv6.from_str("2a03:4a80::/33"), CIDRv6.from_str("2a03:4a80:8000::/33")]))
+    assert isinstance(s, CIDRv6Set)
+    assert [str(x) for x in s] == ["2a03:4a80::/32"]
+    assert aggregate_subnets(CIDRSet(), union=True) == CIDRSet()
+
+
+def test_extend_ranges():
+    s = CIDRSet()
+    s.extend_ranges([CIDR._ip2int("5.39.55.24")], [CIDR._ip2int("5.39.55.255")])
+    assert [str(x) for x in s] == ["5.39.55.24/29", "5.39.55.32/27", "5.39.55.64/26", "5.39.55.128/25"]
+    s = CIDRv6Set()
+    s.extend_ranges([CIDRv6._ip2int("2a0f:e980::")], [CIDRv6._ip2int("2a0f:e987:ffff:ffff:ffff:ffff:ffff:ffff")])
+    assert [str(x) for x in s] == ["2a0f:e980::/29"]
+
+
+def test_bytes():
+    s = CIDRv6Set([CIDRv6.from_str("2a03:4a80::/32"), CIDRv6.from_str("::1/128")])
+    assert CIDRv6Set.record_size() == 17
+    assert CIDRv6Set.frombytes(memoryview(s.tobytes()), 2) == s
+    s = CIDRSet([CIDR.from_str("10.0.0.0/8")])
+    assert s.tobytes() == b"\x00\x00\x00\x0a\x08"
+    assert CIDRSet.frombytes(s.tobytes(), 1) == s
+
+
+def random_set(r, cls=CIDRSet, base=10 << 24, count=30):
+    bits = cls.CIDR_CLASS.BITS
+    return cls.from_pairs((base + (r.getrandbits(12) >> (bits - suffix) << (bits - suffix)), suffix)
+                          for suffix in (r.randint(bits - 8, bits) for _ in range(count)))
+
+
+def addresses(ranges):
+    bits = ranges.CIDR_CLASS.BITS
+    return {address for prefix, suffix in ranges.pairs() for address in range(prefix, prefix + (1 << (bits - suffix)))}
+
+
+@pytest.mark.parametrize("cls", [CIDRSet, CIDRv6Set])
+@pytest.mark.parametrize("seed", range(10))
+def test_set_algebra(cls, seed):
+    r = random.Random(seed)
+    a, b = random_set(r, cls), random_set(r, cls)
+    for result, expected in ((a | b, addresses(a) | addresses(b)),
+                             (a & b, addresses(a) & addresses(b)),
+                             (a - b, addresses(a) - addresses(b))):
+        assert addresses(result) == expected
+        assert result == aggregate_subnets(result, union=True)  # sorted minimal cover
+        assert len(addresses(result)) == result.size()  # disjoint
+
+
+def test_complement():
+    s = CIDRSet([CIDR.from_str("10.0.0.0/8"), CIDR.from_str("192.168.1.0/24")])
+    assert ~~s == s
+    assert (s | ~s) == CIDRSet([CIDR.from_str("0.0.0.0/0")])
+    assert not (s & ~s)
+    assert ~CIDRv6Set() == CIDRv6Set([CIDRv6.from_str("::/0")])
+
+
+def test_host_bits():
+    network = (192 << 24) + (168 << 16)
+    s = CIDRSet.from_pairs([(network + 1, 24), ((10 << 24) + 5, 32)])  # 192.168.0.1/24, 10.0.0.5/32
+    assert s.intervals() == [((10 << 24) + 5, (10 << 24) + 5), (network, network + 255)]
+    assert [str(x) for x in s - CIDRSet([CIDR.from_str("192.168.0.128/25")])] == ["10.0.0.5/32", "192.168.0.0/25"]
+
+
+def test_set_algebra_families():
+    with pytest.raises(TypeError):
+        CIDRSet() | CIDRv6Set()
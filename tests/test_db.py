@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+
+from ip.convert import CIDR
+from ip.db import FIREWALL_LIST, MySQLBackend, SQLiteBackend, insert_into, sync_into, to_rows
+
+TABLE = "address_list_ipv4"
+
+
+@pytest.fixture
+def connection():
+    with SQLiteBackend.connect(":memory:") as backend:
+        yield backend
+
+
+def subnets(*strings):
+    return [CIDR.from_str(s) for s in strings]
+
+
+def rows(connection, comment):
+    return sorted(connection.connection.execute(f"SELECT address, mask FROM {TABLE} WHERE list = ? AND comment = ?",
+                                     (FIREWALL_LIST, comment)))
+
+
+def test_sync(connection):
+    insert_into(connection, TABLE, subnets("10.0.0.0/24", "10.0.2.0/24", "10.0.4.0/24"), "Czech Republic")
+    insert_into(connection, TABLE, subnets("10.0.0.0/24", "10.1.0.0/16"), "Slovakia")
+
+    added, removed = sync_into(connection, TABLE, subnets("10.0.0.0/24", "10.0.4.0/23", "10.0.8.0/24"),
+                               "Czech Republic", batch_size=1)
+    assert (added, removed) == (2, 2)
+    assert rows(connection, "Czech Republic") == [("10.0.0.0", 24), ("10.0.4.0", 23), ("10.0.8.0", 24)]
+    assert rows(connection, "Slovakia") == [("10.0.0.0", 24), ("10.1.0.0", 16)]
+
+    assert sync_into(connection, TABLE, subnets("10.0.0.0/24", "10.0.4.0/23", "10.0.8.0/24"),
+                     "Czech Republic") == (0, 0)
+
+
+def test_insert_rollback(connection):
+    with pytest.raises(sqlite3.Error):
+        insert_into(connection, "missing_table", subnets("10.0.0.0/24"), "Czech Republic")
+
+
+@pytest.mark.parametrize("strategy", SQLiteBackend.STRATEGIES)
+def test_insert_strategies(connection, strategy):
+    ranges = [CIDR(prefix << 8, 24) for prefix in range(1000)]
+    assert insert_into(connection, TABLE, ranges, "Czech Republic", batch_size=300, strategy=strategy) == 1000
+    assert rows(connection, "Czech Republic") == sorted((x.ip, 24) for x in ranges)
+
+
+def test_unsupported_strategy(connection):
+    with pytest.raises(ValueError):
+        insert_into(connection, TABLE, [], "Czech Republic", strategy="load-data")
+
+
+class RecordingConnection:
+    """Stands in for a MySQL connection; remembers executed statements with the rows of a loaded file"""
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, params=()):
+        loaded = []
+        if query.startswith("LOAD DATA"):
+            with open(params[0]) as f:
+                loaded = f.read().splitlines()
+        self.statements.append((query.split(" ", 2)[:2], loaded))
+
+    def close(self):
+        pass
+
+
+def test_mysql_load_data():
+    backend = MySQLBackend(RecordingConnection())
+    ranges = subnets("10.0.0.0/24", "10.0.2.0/24")
+    assert backend.insert_rows(TABLE, to_rows(ranges, "Czech Republic"), strategy="load-data") == 2
+    (command, loaded), = backend.connection.statements
+    assert command == ["LOAD", "DATA"]
+    assert loaded == [f"{x.ip}\t24\t{FIREWALL_LIST}\tCzech Republic\t0" for x in ranges]
+    with pytest.raises(ValueError):
+        backend.insert_rows(TABLE, [], strategy="copy")
+
+
+def test_values_closes_cursor_on_error(connection):
+    cursors = []
+
+    def cursor():
+        cursors.append(connection.connection.cursor())
+        return cursors[-1]
+
+    connection.cursor = cursor
+    with pytest.raises(sqlite3.Error):
+        connection.insert_rows("missing_table", [("10.0.0.0", 24, FIREWALL_LIST, "", 0)], strategy="values")
+    with pytest.raises(sqlite3.ProgrammingError):  # closed
+        cursors[0].execute("SELECT 1")
@@ -0,0 +1,96 @@
+import random
+from ipaddress import ip_address
+from os.path import abspath, dirname, join
+
+import pytest
+
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.delta import apply_delta, update_aggregated
+from ip.pipeline import PipelineStats, aggregate_chunks, filter_chunks, parse_chunks, read_chunks
+
+ADDRESS_FILE = join(dirname(abspath(__file__)), "..", "czsk.csv")
+LINES = [line for chunk in filter_chunks(read_chunks(ADDRESS_FILE)) for line in chunk]
+
+
+def first_address(line):
+    address = ip_address(line.split(",")[0].strip())
+    return address.version, address
+
+
+def aggregate(lines):
+    stats = PipelineStats()
+    out = (CIDRSet(), CIDRv6Set())
+    for chunk in aggregate_chunks(parse_chunks([sorted(lines, key=first_address)], stats), stats):
+        for ranges, finished in zip(out, chunk):
+            ranges.extend(finished)
+    return out
+
+
+def parse(lines):
+    return next(parse_chunks([sorted(lines)], PipelineStats()))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_apply_delta_equals_full_aggregation(seed):
+    r = random.Random(seed)
+    old, new = set(LINES), set(LINES)
+    for line in r.sample(LINES, r.randint(1, 40)):
+        (old if r.random() < 0.5 else new).discard(line)
+    previous, expected = aggregate(old), aggregate(new)
+    removed, added = parse(old - new), parse(new - old)
+    for family in range(2):
+        ranges, added_subnets, removed_subnets = apply_delta(previous[family], removed[family], added[family])
+        assert ranges == expected[family]
+        assert set(added_subnets.pairs()) == set(expected[family].pairs()) - set(previous[family].pairs())
+        assert set(removed_subnets.pairs()) == set(previous[family].pairs()) - set(expected[family].pairs())
+
+
+def test_removal_splits_supernet():
+    aggregated = CIDRSet.from_pairs([(10 << 24, 8)])
+    removed = CIDRSet.from_pairs([(10 << 24 | 1 << 16, 16)])
+    ranges, added, deleted = apply_delta(aggregated, removed, CIDRSet())
+    assert [str(x) for x in ranges] == ["10.0.0.0/16"] + [f"10.{1 << i}.0.0/{16 - i}" for i in range(1, 8)]
+    assert list(deleted.pairs()) == list(aggregated.pairs())
+    assert apply_delta(ranges, CIDRSet(), removed)[0] == aggregated
+
+
+def test_update_aggregated(tmp_path):
+    old_input, previous_output = tmp_path / "old.csv", tmp_path / "old.txt"
+    old_lines = [line for line in LINES[5:-5] if not line.startswith("5.22.154.0 ")] + ["5.22.154.0,5.22.154.127,SK"]
+    old_input.write_text("\n".join(old_lines) + "\n")
+    previous_output.write_text("".join(f"{x}\n" for ranges in aggregate(old_lines) for x in ranges))
+    delta, stats = update_aggregated(str(previous_output), str(old_input), ADDRESS_FILE)
+    assert delta.ranges == aggregate(LINES)
+    assert delta.lines_removed == 1
+    assert delta.lines_added == 11
+    assert stats.lines_v4 + stats.lines_v6 == len(LINES)
+    assert stats.subnets_v4 == len(delta.ranges[0])
+
+
+def write_lines(path, lines):
+    path.write_text("".join(f"{line}\n" for line in lines))
+    return str(path)
+
+
+def test_update_duplicates(tmp_path):
+    lines = LINES[:50]
+    old_lines = [lines[0]] + lines[:20] + lines[21:]
+    new_lines = lines[:10] + [lines[9]] + lines[10:20] + [lines[20]] * 2 + lines[21:40]
+    previous_output = write_lines(tmp_path / "old.txt", [x for ranges in aggregate(set(old_lines)) for x in ranges])
+    delta, stats = update_aggregated(previous_output, write_lines(tmp_path / "old.csv", old_lines),
+                                     write_lines(tmp_path / "new.csv", new_lines))
+    assert delta.ranges == aggregate(set(new_lines))
+    assert (delta.lines_removed, delta.lines_added) == (1 + 10, 1 + 2)
+    assert (stats.lines_v4, stats.lines_v6) == (len(new_lines), 0)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_update_unsorted(tmp_path, seed):
+    r = random.Random(seed)
+    old_lines, new_lines = r.sample(LINES, len(LINES) - 20), r.sample(LINES, len(LINES) - 20)
+    previous_output = write_lines(tmp_path / "old.txt", [x for ranges in aggregate(old_lines) for x in ranges])
+    delta, stats = update_aggregated(previous_output, write_lines(tmp_path / "old.csv", old_lines),
+                                     write_lines(tmp_path / "new.csv", new_lines), line_format="dbip-csv")
+    assert delta.ranges == aggregate(new_lines)
+    assert stats.lines_v4 + stats.lines_v6 == len(new_lines)
+    assert stats.lines_v6 == sum(":" in line for line in new_lines)
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from ip import UnionMerger, aggregate_subnets
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.external import ExternalSorter, aggregate_unsorted
+from ip.pipeline import PipelineStats
+
+
+def random_chunks(r, count, chunk_size):
+    chunks = []
+    for _ in range(0, count, chunk_size):
+        v4 = CIDRSet.from_pairs((r.getrandbits(16) << 16, r.randint(12, 32)) for _ in range(chunk_size))
+        v6 = CIDRv6Set.from_pairs(((0x2a00 << 112) + (r.getrandbits(32) << 80), r.randint(24, 64))
+                                  for _ in range(chunk_size // 2))
+        chunks.append((v4, v6))
+    return chunks
+
+
+@pytest.mark.parametrize("seed,run_size", [(0, 50), (1, 333), (2, 10 ** 6)])
+def test_same_as_union(tmp_path, seed, run_size):
+    chunks = random_chunks(random.Random(seed), 3000, 200)
+    stats = PipelineStats()
+    out = (CIDRSet(), CIDRv6Set())
+    for chunk in aggregate_unsorted(chunks, stats, run_size, str(tmp_path), chunk_size=100):
+        for ranges, more in zip(out, chunk):
+            ranges.extend(more)
+    for family, ranges in enumerate(out):
+        collected = type(ranges)()
+        for chunk in chunks:
+            collected.extend(chunk[family])
+        assert ranges == aggregate_subnets(collected, union=True)
+    assert (stats.subnets_v4, stats.addresses_v6) == (len(out[0]), out[1].size())
+
+
+def test_multiple_merge_passes(tmp_path):
+    r = random.Random(3)
+    pairs = [(r.getrandbits(32), 32) for _ in range(1000)]
+    sorter = ExternalSorter(run_size=10, directory=str(tmp_path), fan_in=4)
+    open_runs = []
+    with sorter:
+        for i in range(0, len(pairs), 7):
+            sorter.push((CIDRSet.from_pairs(pairs[i:i + 7]), CIDRv6Set()))
+            open_runs.append(len(sorter.runs[0]))
+        # 71 spilled runs (a buffer of 2 pushes spills) are 1013 in base 4: the digits are runs of every level
+        assert open_runs[-1] == 1 + 0 + 1 + 3
+        assert max(open_runs) <= 3 * 4
+        runs = list(sorter.runs[0])
+        assert list(sorter.sorted_pairs(0)) == sorted(pairs)
+        assert len(sorter.runs[0]) < 4
+        assert list(sorter.sorted_pairs(1)) == []
+    assert all(f.closed for f in runs) and not sorter.runs[0]
+
+
+def test_union_merger():
+    merger = UnionMerger(32)
+    finished = []
+    for prefix, suffix in [(0x0A000000, 24), (0x0A000080, 25), (0x0A000100, 24), (0x0A000300, 24)]:
+        finished += merger.push(prefix, suffix)
+    finished += merger.flush()
+    assert finished == [(0x0A000000, 23), (0x0A000300, 24)]
+    with pytest.raises(ValueError):
+        merger.push(0x09000000, 8)
@@ -0,0 +1,108 @@
+import random
+from os.path import abspath, dirname, join
+
+import pytest
+
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.convert import CIDR, CIDRv6
+from ip.lookup import LookupIndex, PrefixTrie, cli, load_entries, save_entries
+from ip.pipeline import aggregate_countries, filter_chunks, read_chunks
+
+ADDRESS_FILE = join(dirname(abspath(__file__)), "..", "czsk.csv")
+
+
+@pytest.fixture(scope="module")
+def entries():
+    results = aggregate_countries(filter_chunks(read_chunks(ADDRESS_FILE)))
+    return [(country, ranges) for country, (chunk, _) in results.items() for ranges in chunk]
+
+
+def brute_force(entries, family, address):
+    for country, ranges in entries:
+        if isinstance(ranges, CIDRv6Set) == family and any(address in subnet for subnet in ranges):
+            return country
+    return None
+
+
+def sample_addresses(entries, count=100):
+    r = random.Random(0)
+    out = []
+    for _, ranges in entries:
+        for subnet in r.sample(list(ranges), count // 4):
+            family = isinstance(ranges, CIDRv6Set)
+            out += [(family, subnet.prefix), (family, subnet.next_address() - 1), (family, subnet.next_address())]
+    return out + [(False, r.randrange(1 << 32)) for _ in range(count)]
+
+
+def test_index(entries, tmp_path):
+    index = LookupIndex(entries)
+    trie_v4, trie_v6 = PrefixTrie.from_entries(entries)
+    addresses = sample_addresses(entries)
+    for family, address in addresses:
+        expected = brute_force(entries, family, address)
+        assert index.lookup(address, ipv6=family) == expected
+        assert (trie_v6 if family else trie_v4).lookup(address) == expected
+    assert index.lookup("2.16.25.7") == "CZ"
+    assert index.lookup("2a0f:e980::1") == "SK"
+    assert "1.1.1.1" not in index
+
+    file_name = str(tmp_path / "index.idx")
+    index.save(file_name)
+    loaded = LookupIndex.load(file_name)
+    assert loaded.lookup_many(a for f, a in addresses if not f) == index.lookup_many(a for f, a in addresses if not f)
+    assert len(loaded) == len(index)
+
+
+def test_lookup_many_numpy(entries):
+    numpy = pytest.importorskip("numpy")
+    index = LookupIndex(entries)
+    addresses = [a for family, a in sample_addresses(entries) if not family] + [0, (1 << 32) - 1]
+    assert index.lookup_many(numpy.array(addresses, dtype=numpy.uint32)) == index.lookup_many(addresses)
+    assert LookupIndex().lookup_many(numpy.array(addresses)) == [None] * len(addresses)
+
+
+def test_overlap():
+    with pytest.raises(ValueError):
+        LookupIndex([("A", CIDRSet([CIDR.from_str("10.0.0.0/8")])), ("B", CIDRSet([CIDR.from_str("10.1.0.0/16")]))])
+
+
+def test_malformed_address(entries, tmp_path, capsys):
+    index = LookupIndex(entries)
+    trie_v4, _ = PrefixTrie.from_entries(entries)
+    for address in ("10.0.0.300", "2a0f::e980::1", "CZ"):
+        with pytest.raises(ValueError, match="Neplatná IP adresa"):
+            index.lookup(address)
+    with pytest.raises(ValueError):
+        trie_v4.lookup("10.0.0")
+    file_name = str(tmp_path / "index.idx")
+    index.save(file_name)
+    assert cli([file_name, "2.16.25.7", "10.0.0.300", "127.0.0.1"]) == 1
+    out, err = capsys.readouterr()
+    assert out.splitlines() == ["2.16.25.7\tCZ", "127.0.0.1\t-"]
+    assert err == "Neplatná IP adresa '10.0.0.300'\n"
+
+
+def test_trie_longest_prefix(tmp_path):
+    entries = [("A", CIDRSet([CIDR.from_str("10.0.0.0/8"), CIDR.from_str("10.1.2.0/24")])),
+               ("B", CIDRSet([CIDR.from_str("10.1.0.0/16"), CIDR.from_str("0.0.0.0/0")])),
+               ("C", CIDRv6Set([CIDRv6.from_str("2a03:4a80::/32")]))]
+    trie_v4, trie_v6 = PrefixTrie.from_entries(entries)
+    assert trie_v4.lookup_many(["10.1.2.3", "10.1.3.3", "10.2.0.0", "11.0.0.0"]) == ["A", "B", "A", "B"]
+    assert trie_v6.lookup("2a03:4a80:1::") == "C"
+    assert trie_v6.lookup("2a03:4a81::") is None
+
+    with pytest.raises(ValueError):
+        trie_v4.lookup("2a03:4a80:1::")
+    with pytest.raises(ValueError):
+        trie_v6.lookup("10.1.2.3")
+    trie_v4.insert(CIDR.from_str("10.1.0.0/16").prefix, 16, "B")  # the same subnet again doesn't duplicate it
+    assert len(trie_v4) == 4 and len(trie_v6) == 1
+    trie = PrefixTrie(32)
+    trie.insert(1 << 24, 8, "A")
+    trie.insert(1 << 24, 8, "B")
+    assert len(trie) == 1 and trie.lookup("1.2.3.4") == "B"
+    assert [(p, [str(x) for x in r]) for p, r in trie.entries()] == [("B", ["1.0.0.0/8"])]
+
+    file_name = str(tmp_path / "trie.idx")
+    save_entries(file_name, list(trie_v4.entries()) + list(trie_v6.entries()))
+    assert sorted((p, list(r)) for p, r in load_entries(file_name)) == sorted((p, list(r)) for p, r in entries)
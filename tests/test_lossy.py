@@ -0,0 +1,107 @@
+import random
+from os.path import abspath, dirname, join
+
+import pytest
+
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.convert import CIDR
+from ip.lossy import aggregate_lossy
+from ip.pipeline import read_ranges
+
+ADDRESS_FILE = join(dirname(abspath(__file__)), "..", "czsk.csv")
+
+
+def brute_force(ranges, max_entries=None, max_extra=None):
+    """Greedy merging which tries all neighbours in every step"""
+    bits = ranges.CIDR_CLASS.BITS
+    subnets = [(prefix, prefix + (1 << (bits - suffix)) - 1)
+               for prefix, suffix in ranges.from_intervals(ranges.intervals()).pairs()]
+    extra = 0
+    while len(subnets) > 1:
+        candidates = []
+        for (start, _), (_, end) in zip(subnets, subnets[1:]):
+            length = (start ^ end).bit_length()
+            start = start >> length << length
+            end = start + (1 << length) - 1
+            inside = [(a, b) for a, b in subnets if start <= a and b <= end]
+            cost = end - start + 1 - sum(b - a + 1 for a, b in inside)
+            candidates.append((cost, 1 - len(inside), start, end))
+        cost, removed, start, end = min(candidates)
+        if max_extra is not None and extra + cost > max_extra:
+            break
+        if max_entries is not None and len(subnets) <= max_entries and cost:
+            break
+        subnets = sorted([(a, b) for a, b in subnets if not start <= a <= end] + [(start, end)])
+        extra += cost
+    return ranges.from_pairs((a, bits + 1 - (b - a + 1).bit_length()) for a, b in subnets), extra
+
+
+def check(ranges, out, extra):
+    exact = ranges.from_intervals(ranges.intervals())
+    assert out == out.from_intervals(out.intervals())  # sorted, disjoint and fully merged
+    assert out & exact == exact
+    assert out.size() == exact.size() + extra
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_max_entries(seed):
+    r = random.Random(seed)
+    ranges = CIDRSet.from_pairs((r.getrandbits(10) << 22 >> shift << shift, 32 - shift)
+                                for shift in (r.randint(0, 24) for _ in range(r.randint(2, 20))))
+    for max_entries in range(1, len(ranges) + 1):
+        out, extra = aggregate_lossy(ranges, max_entries=max_entries)
+        assert len(out) <= max_entries
+        check(ranges, out, extra)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_brute_force(seed):
+    r = random.Random(seed)
+    ranges = CIDRSet.from_pairs((r.getrandbits(8) << 24 >> shift << shift, 32 - shift)
+                                for shift in (r.randint(0, 26) for _ in range(r.randint(2, 25))))
+    for max_entries in range(1, len(ranges) + 1):
+        assert aggregate_lossy(ranges, max_entries=max_entries) == brute_force(ranges, max_entries=max_entries)
+    for max_extra in (0, 1 << 10, 1 << 20, 1 << 28):
+        assert aggregate_lossy(ranges, max_extra=max_extra) == brute_force(ranges, max_extra=max_extra)
+
+
+def test_cost_lowered_by_merge():
+    # merging 219.0.0.0/10 with 221.0.0.0/12 into 216.0.0.0/5 lowers the costs of the supernets around it
+    ranges = CIDRSet([CIDR.from_str(s) for s in ("42.0.0.0/16", "44.0.0.0/16", "192.0.0.0/4", "208.0.0.0/15",
+                                                 "219.0.0.0/10", "221.0.0.0/12")])
+    out, extra = aggregate_lossy(ranges, max_entries=3)
+    assert [str(x) for x in out] == ["42.0.0.0/16", "44.0.0.0/16", "192.0.0.0/3"]
+    assert (out, extra) == brute_force(ranges, max_entries=3)
+
+
+def test_cheapest_merge_first():
+    ranges = CIDRSet([CIDR.from_str(s) for s in ("10.0.0.0/24", "10.0.2.0/24", "10.0.4.0/24", "10.0.8.0/24")])
+    out, extra = aggregate_lossy(ranges, max_entries=3)
+    assert [str(x) for x in out] == ["10.0.0.0/22", "10.0.4.0/24", "10.0.8.0/24"]
+    assert extra == 512
+
+
+def test_max_extra():
+    ranges, _ = read_ranges(ADDRESS_FILE)
+    exact = len(ranges.from_intervals(ranges.intervals()))
+    out, extra = aggregate_lossy(ranges, max_extra=0)
+    assert len(out) == exact and extra == 0
+    out, extra = aggregate_lossy(ranges, max_extra=10000)
+    assert extra <= 10000
+    assert len(out) < exact
+    check(ranges, out, extra)
+    out, extra = aggregate_lossy(ranges, max_entries=100, max_extra=10000)
+    assert extra <= 10000 and len(out) > 100
+
+
+def test_ipv6():
+    _, ranges = read_ranges(ADDRESS_FILE)
+    out, extra = aggregate_lossy(ranges, max_entries=100)
+    assert len(out) <= 100
+    check(ranges, out, extra)
+    assert aggregate_lossy(CIDRv6Set(), max_entries=1) == (CIDRv6Set(), 0)
+
+
+def test_limit_required():
+    with pytest.raises(ValueError):
+        aggregate_lossy(CIDRSet())
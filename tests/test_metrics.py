@@ -0,0 +1,71 @@
+import json
+import pstats
+import time
+
+from ip.metrics import DISABLED, Metrics, profile
+
+
+def slow(items, seconds):
+    for item in items:
+        time.sleep(seconds)
+        yield item
+
+
+def test_time_iter_exclusive():
+    metrics = Metrics()
+    inner = metrics.time_iter("inner", slow(range(5), 0.01), counter="inner_items", size=lambda item: 1)
+    outer = metrics.time_iter("outer", slow(inner, 0.002), counter="outer_items", size=lambda item: 2)
+    start = time.perf_counter()
+    assert list(outer) == list(range(5))
+    total = time.perf_counter() - start
+    assert metrics.counters == {"inner_items": 5, "outer_items": 10}
+    assert metrics.timers["inner"] >= 0.05 and metrics.timers["outer"] >= 0.01
+    # the time of the inner stage is not counted into the outer one
+    assert metrics.timers["inner"] + metrics.timers["outer"] <= total
+
+
+def test_timer_and_counters():
+    metrics = Metrics()
+    with metrics.timer("write"):
+        with metrics.timer("flush"):
+            time.sleep(0.01)
+    metrics.add("lines_read", 10)
+    metrics.add("lines_parsed", 7)
+    metrics.add_derived()
+    assert metrics.timers["write"] < metrics.timers["flush"]
+    assert metrics.counters["lines_filtered"] == 3
+    assert "merges" not in metrics.counters
+
+
+def test_write(tmp_path):
+    metrics = Metrics()
+    metrics.add("subnets_aggregated", 3)
+    with metrics.timer("aggregate"):
+        pass
+    metrics.write(str(tmp_path / "metrics.json"))
+    data = json.loads((tmp_path / "metrics.json").read_text())
+    assert data["counters"] == {"subnets_aggregated": 3}
+    assert set(data["stage_seconds"]) == {"aggregate"}
+    metrics.write(str(tmp_path / "metrics.prom"))
+    lines = (tmp_path / "metrics.prom").read_text().splitlines()
+    assert "ip_aggregate_subnets_aggregated 3" in lines
+    assert any(line.startswith('ip_aggregate_stage_seconds{stage="aggregate"} ') for line in lines)
+    assert all(line.startswith("# TYPE ip_aggregate_") or line.startswith("ip_aggregate_") for line in lines)
+
+
+def test_disabled():
+    items = [1, 2, 3]
+    assert DISABLED.time_iter("parse", items, counter="subnets") is items
+    DISABLED.add("lines_read")
+    with DISABLED.timer("write"):
+        pass
+    assert not DISABLED.counters and not DISABLED.timers
+
+
+def test_profile(tmp_path):
+    file_name = str(tmp_path / "profile.out")
+    with profile(file_name):
+        sorted(range(1000), key=lambda x: -x)
+    assert pstats.Stats(file_name).total_calls > 1000
+    with profile(None):
+        pass
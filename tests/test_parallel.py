@@ -0,0 +1,28 @@
+from os.path import abspath, dirname, join
+
+import pytest
+
+from ip.parallel import aggregate_parallel
+from ip.pipeline import PipelineStats, aggregate_chunks, filter_chunks, parse_chunks, read_chunks
+
+ADDRESS_FILE = join(dirname(abspath(__file__)), "..", "czsk.csv")
+RANGES_FILE = join(dirname(abspath(__file__)), "..", "czech_ranges.txt")
+
+
+def merged(chunks):
+    chunks = list(chunks)
+    out_v4, out_v6 = chunks[0]
+    for ranges_v4, ranges_v6 in chunks[1:]:
+        out_v4.extend(ranges_v4)
+        out_v6.extend(ranges_v6)
+    return out_v4, out_v6
+
+
+@pytest.mark.parametrize("file_name,union", [(ADDRESS_FILE, False), (ADDRESS_FILE, True), (RANGES_FILE, False)])
+def test_same_as_sequential(file_name, union):
+    expected_stats = PipelineStats()
+    expected = merged(aggregate_chunks(parse_chunks(filter_chunks(read_chunks(file_name, 500)), expected_stats),
+                                       expected_stats, union=union))
+    stats = PipelineStats()
+    assert merged(aggregate_parallel(filter_chunks(read_chunks(file_name, 500)), stats, 2, union=union)) == expected
+    assert stats == expected_stats
@@ -0,0 +1,95 @@
+from os.path import abspath, dirname, join
+
+import pytest
+
+from ip.parse import detect_format, parse_cidr_list, parse_dbip_csv, parse_rir_delegated
+from ip.pipeline import PipelineStats, filter_chunks, parse_chunks, read_chunks
+
+ADDRESS_FILE = join(dirname(abspath(__file__)), "..", "czsk.csv")
+RANGES_FILE = join(dirname(abspath(__file__)), "..", "czech_ranges.txt")
+
+
+@pytest.mark.parametrize("file_name,line_format", [(ADDRESS_FILE, "dbip-csv"), (RANGES_FILE, "cidr-list")])
+def test_same_as_auto(file_name, line_format):
+    chunks = list(filter_chunks(read_chunks(file_name, 1000)))
+    expected_stats = PipelineStats()
+    stats = PipelineStats()
+    assert list(parse_chunks(chunks, stats, line_format)) == list(parse_chunks(chunks, expected_stats))
+    assert stats == expected_stats
+
+
+def test_cidr_list():
+    ranges_v4, ranges_v6 = parse_cidr_list(["10.0.0.0/8", "2a03:4a80::/32", "10.1.2.3", "::1"], PipelineStats())
+    assert [str(x) for x in ranges_v4] == ["10.0.0.0/8", "10.1.2.3/32"]
+    assert [str(x) for x in ranges_v6] == ["2a03:4a80::/32", "::1/128"]
+
+
+@pytest.mark.parametrize("line", ["1.2.3.0/40", "2a03:4a80::/129", "10.0.0.0/-1", "10.0.0.0/+8", "10.0.0.0/x",
+                                  "10.0.0.0/", "10.0.0.0/8/8"])
+def test_cidr_list_invalid(line):
+    with pytest.raises(ValueError, match="Unprocessed line"):
+        parse_cidr_list([line], PipelineStats())
+
+
+@pytest.mark.parametrize("line", ["10.0.0.0,2a03:4a80::,CZ", "10.0.0.0", "10.0.0.256,10.0.1.0,CZ",
+                                  "1.0.0.10,1.0.0.5,CZ", "2a03::10,2a03::5,CZ"])
+def test_dbip_csv_invalid(line):
+    with pytest.raises(ValueError):
+        parse_dbip_csv([line], PipelineStats())
+
+
+def test_rir_delegated():
+    lines = ["2|ripencc|20240101|5|19830705|20240101|+0100", "ripencc|*|ipv4|*|2|summary",
+             "ripencc|CZ|ipv4|10.0.0.0|768|20100512|allocated", "ripencc|CZ|asn|1234|1|20100512|allocated",
+             "ripencc|CZ|ipv6|2001:db8::|32|20100512|assigned", "ripencc||ipv4|10.2.0.0|256||available"]
+    stats = PipelineStats()
+    ranges_v4, ranges_v6 = parse_rir_delegated(lines, stats)
+    assert [str(x) for x in ranges_v4] == ["10.0.0.0/23", "10.0.2.0/24"]
+    assert [str(x) for x in ranges_v6] == ["2001:db8::/32"]
+    assert (stats.lines_v4, stats.lines_v6) == (1, 1)
+    with pytest.raises(ValueError):
+        parse_rir_delegated(["ripencc|CZ|ipv4|10.0.0|256|20100512|allocated"], PipelineStats())
+
+
+def test_rir_delegated_extended():
+    lines = ["2.3|ripencc|1705014000|5|19830705|20240111|+0100", "# comment",
+             "ripencc|CZ|ipv4|10.0.0.0|256|20100512|allocated|a1b2", "ripencc||ipv6|2001:db8::|32||reserved|",
+             "ripencc|ZZ|ipv4|10.1.0.0|256||reserved|"]
+    ranges_v4, ranges_v6 = parse_rir_delegated(lines, PipelineStats())
+    assert [str(x) for x in ranges_v4] == ["10.0.0.0/24"] and not ranges_v6
+
+
+@pytest.mark.parametrize("line", [
+    "1.0.0.0,1.0.0.255,AU",  # dbip CSV
+    "10.0.0.0/24",  # subnet list
+    "ripencc|CZ|ipv4|10.0.0.0|256",  # too few columns
+    "ripencc|CZ|ipv5|10.0.0.0|256|20100512|allocated",
+    "ripencc|CZ|ipv4|10.0.0.0|256|20100512|unknown",
+    "ripencc|CZ|ipv4|10.0.0.0|-5|20100512|allocated",
+    "ripencc|CZ|ipv4|10.0.0.0|0|20100512|allocated",
+    "ripencc|CZ|ipv4|255.255.255.0|1000|20100512|allocated",
+    "ripencc|CZ|ipv6|2001:db8::|200|20100512|allocated",
+    "ripencc|CZ|ipv6|2001:db8::|-1|20100512|allocated",
+    "ripencc|CZ|ipv6|2001:db8::1|64|20100512|allocated",  # host bits set
+])
+def test_rir_delegated_invalid(line):
+    with pytest.raises(ValueError, match="Unprocessed line"):
+        parse_rir_delegated([line], PipelineStats())
+
+
+def test_rir_delegated_bounds():
+    lines = ["ripencc|CZ|ipv4|255.255.255.0|256|20100512|allocated", "ripencc|CZ|ipv6|::|0|20100512|allocated",
+             "ripencc|CZ|ipv6|2001:db8::1|128|20100512|assigned"]
+    ranges_v4, ranges_v6 = parse_rir_delegated(lines, PipelineStats())
+    assert [str(x) for x in ranges_v4] == ["255.255.255.0/24"]
+    assert [str(x) for x in ranges_v6] == ["::/0", "2001:db8::1/128"]
+
+
+@pytest.mark.parametrize("lines,line_format", [
+    (["# comment", "2|ripencc|20240101|5|19830705|20240101|+0100"], "rir-delegated"),
+    (["", "1.2.3.0,1.2.3.255,CZ"], "dbip-csv"),
+    (["2a03:4a80::/32"], "cidr-list"),
+    (["1.2.3.0 - 1.2.3.255"], "auto"),
+])
+def test_detect_format(lines, line_format):
+    assert detect_format(lines) == line_format
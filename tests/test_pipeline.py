@@ -0,0 +1,80 @@
+from ipaddress import ip_address, summarize_address_range
+from os.path import abspath, dirname, join
+
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.pipeline import PipelineStats, aggregate_chunks, aggregate_countries, filter_chunks, parse_chunks, read_chunks
+
+ADDRESS_FILE = join(dirname(abspath(__file__)), "..", "czsk.csv")
+RANGES_FILE = join(dirname(abspath(__file__)), "..", "czech_ranges.txt")
+
+
+def run(file_name, chunk_size, filter_str=None, union=False):
+    stats = PipelineStats()
+    chunks = parse_chunks(filter_chunks(read_chunks(file_name, chunk_size), filter_str), stats)
+    out_v4 = CIDRSet()
+    out_v6 = CIDRv6Set()
+    for ranges_v4, ranges_v6 in aggregate_chunks(chunks, stats, union=union):
+        out_v4.extend_pairs(ranges_v4.pairs())
+        out_v6.extend_pairs(ranges_v6.pairs())
+    return out_v4, out_v6, stats
+
+
+def test_streaming_matches_batch():
+    expected = run(ADDRESS_FILE, 1 << 20, ",CZ", union=True)
+    for chunk_size in (1, 100, 5000):
+        assert run(ADDRESS_FILE, chunk_size, ",CZ") == expected
+
+
+def test_interleaved_families(tmp_path):
+    lines = [line for chunk in filter_chunks(read_chunks(ADDRESS_FILE)) for line in chunk]
+    lines_v4 = [line for line in lines if ":" not in line]
+    lines_v6 = [line for line in lines if ":" in line]
+    interleaved = [line for pair in zip(lines_v4, lines_v6) for line in pair] + lines_v4[len(lines_v6):]
+    file_name = tmp_path / "interleaved.csv"
+    file_name.write_text("\n".join(interleaved) + "\n")
+    expected = run(ADDRESS_FILE, 1 << 20, union=True)
+    for chunk_size in (1, 7, 1000):
+        assert run(str(file_name), chunk_size) == expected
+
+
+def test_stats():
+    ranges_v4, ranges_v6, stats = run(ADDRESS_FILE, 100)
+    assert (stats.lines_v4, stats.lines_v6) == (2393, 1310)
+    assert (stats.subnets_v4, stats.subnets_v6) == (len(ranges_v4), len(ranges_v6))
+    assert stats.addresses_v4 == ranges_v4.size()
+    ranges = [line.split(",")[:2] for chunk in filter_chunks(read_chunks(ADDRESS_FILE)) for line in chunk]
+    subnets = [len(list(summarize_address_range(ip_address(a.strip()), ip_address(b.strip())))) for a, b in ranges]
+    assert stats.ranges_split == sum(count > 1 for count in subnets)
+    assert stats.merges == sum(subnets) - len(ranges_v4) - len(ranges_v6)
+    for line_format in ("auto", "dbip-csv"):
+        parse_stats = PipelineStats()
+        for _ in parse_chunks(filter_chunks(read_chunks(ADDRESS_FILE)), parse_stats, line_format):
+            pass
+        assert parse_stats.ranges_split == stats.ranges_split
+    assert run(ADDRESS_FILE, 100, union=True)[2].merges == stats.merges
+
+
+def test_output_before_input_is_read():
+    read = []
+
+    def chunks():
+        for chunk in read_chunks(RANGES_FILE, 100):
+            read.append(chunk)
+            yield chunk
+
+    stats = PipelineStats()
+    aggregated = aggregate_chunks(parse_chunks(filter_chunks(chunks()), stats), stats)
+    first = next(ranges_v4 for ranges_v4, _ in aggregated if ranges_v4)
+    assert len(read) < 10
+    expected, _, _ = run(RANGES_FILE, 1 << 20)
+    assert list(first) == list(expected)[:len(first)]
+
+
+def test_countries_single_pass():
+    chunks = filter_chunks(read_chunks(ADDRESS_FILE, 100))
+    results = aggregate_countries(chunks, ["CZ", "SK", "XX"], "dbip-csv")
+    assert sorted(results) == ["CZ", "SK"]
+    for country in ("CZ", "SK"):
+        ranges_v4, ranges_v6, stats = run(ADDRESS_FILE, 100, "," + country)
+        assert results[country] == ((ranges_v4, ranges_v6), stats)
+    assert sorted(aggregate_countries(filter_chunks(read_chunks(ADDRESS_FILE)))) == ["CZ", "SK"]
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import os
+from os.path import abspath, dirname, join
+
+from ip.server import AggregateServer, LatencyStats, ListSpec
+
+ADDRESS_FILE = join(dirname(abspath(__file__)), "..", "czsk.csv")
+
+
+async def request(reader, writer, method, target, body=b""):
+    writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                 + body)
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode().strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.lower()] = value.strip()
+    return status, (await reader.readexactly(int(headers["content-length"]))).decode()
+
+
+def run_server(specs, test, socket_path=None):
+    async def main():
+        aggregate_server = AggregateServer(specs, poll_interval=3600)
+        server = await aggregate_server.start("127.0.0.1", 0, socket_path)
+        try:
+            if socket_path:
+                reader, writer = await asyncio.open_unix_connection(socket_path)
+            else:
+                reader, writer = await asyncio.open_connection("127.0.0.1", server.sockets[0].getsockname()[1])
+            await test(aggregate_server, reader, writer)
+            writer.close()
+            await writer.wait_closed()
+            await asyncio.sleep(0.01)  # lets the server see the end of the connection
+        finally:
+            aggregate_server.stop_watching()
+            server.close()
+            await server.wait_closed()
+    asyncio.run(main())
+
+
+def test_lookup_and_export(tmp_path):
+    own = tmp_path / "own.txt"
+    own.write_text("10.0.0.0/24\n10.0.1.0/24\n2001:470:6e::/48\n")
+    specs = [ListSpec.from_spec(f"cz@CZ={ADDRESS_FILE}"), ListSpec.from_spec(f"own={own}")]
+
+    async def test(aggregate_server, reader, writer):
+        addresses = b"2.16.25.1\n10.0.1.5\n2001:470:6e::1\n8.8.8.8\n"
+        status, text = await request(reader, writer, "POST", "/lookup", addresses)
+        assert status == 200
+        assert text.splitlines() == ["2.16.25.1\tcz", "10.0.1.5\town", "2001:470:6e::1\tcz,own", "8.8.8.8\t-"]
+        status, text = await request(reader, writer, "GET", "/lookup?ip=2001:470:6e::1&list=own")
+        assert text == "2001:470:6e::1\town\n"
+        status, text = await request(reader, writer, "GET", "/export/own?format=rsc")
+        assert status == 200 and 'add address=10.0.0.0/23 comment="own"' in text
+        assert (await request(reader, writer, "GET", "/export/own"))[1] == "10.0.0.0/23\n2001:470:6e::/48\n"
+        assert (await request(reader, writer, "GET", "/export/nope"))[0] == 404
+        assert (await request(reader, writer, "GET", "/export/own?format=xml"))[0] == 400
+        assert (await request(reader, writer, "GET", "/lookup?ip=10.0.0.300"))[0] == 400
+        assert (await request(reader, writer, "DELETE", "/lookup"))[0] == 405
+        status, text = await request(reader, writer, "GET", "/stats")
+        stats = json.loads(text)
+        assert list(stats["lists"]) == ["cz", "own"] and stats["lists"]["own"]["subnets_v4"] == 1
+        assert stats["latency"]["lookup"]["requests"] == 4
+        assert stats["latency"]["lookup"]["p50_ms"] <= stats["latency"]["lookup"]["p99_ms"]
+
+    run_server(specs, test)
+
+
+def test_hot_reload(tmp_path):
+    own = tmp_path / "own.txt"
+    own.write_text("10.0.0.0/24\n")
+    socket_path = str(tmp_path / "server.sock")
+
+    async def test(aggregate_server, reader, writer):
+        assert (await request(reader, writer, "GET", "/lookup?ip=10.0.1.1"))[1] == "10.0.1.1\t-\n"
+        before = aggregate_server.lists["own"]
+        await request(reader, writer, "GET", "/export/own")
+        own.write_text("10.0.0.0/24\n10.0.1.0/24\n")
+        os.utime(own, ns=(0, before.signature[0] + 10 ** 9))
+        await aggregate_server.check_changes()
+        assert aggregate_server.lists["own"] is not before
+        assert (await request(reader, writer, "GET", "/lookup?ip=10.0.1.1"))[1] == "10.0.1.1\town\n"
+        assert (await request(reader, writer, "GET", "/export/own"))[1] == "10.0.0.0/23\n"
+        # a broken source keeps the previous list
+        own.write_text("not an address\n")
+        assert (await request(reader, writer, "POST", "/reload?list=own"))[0] == 500
+        assert (await request(reader, writer, "GET", "/lookup?ip=10.0.1.1"))[1] == "10.0.1.1\town\n"
+
+    run_server([ListSpec("own", str(own))], test, socket_path)
+
+
+def test_bad_requests(tmp_path):
+    own = tmp_path / "own.txt"
+    own.write_text("10.0.0.0/24\n")
+
+    async def test(aggregate_server, reader, writer):
+        for target in ("/", "/favicon.ico", "/a/b"):
+            assert (await request(reader, writer, "GET", target))[0] == 404
+        assert set(aggregate_server.latency.counts) == {"other"}
+        assert (await request(reader, writer, "POST", "/lookup", b"\xff"))[0] == 400
+        writer.write(b"GET /lookup?ip=10.0.0.1 HTTP/1.1\r\nContent-Length: -1\r\n\r\n")
+        assert (await reader.readline()).split()[1] == b"400"
+
+    run_server([ListSpec("own", str(own))], test)
+
+
+def test_header_too_long(tmp_path):
+    own = tmp_path / "own.txt"
+    own.write_text("10.0.0.0/24\n")
+
+    async def test(aggregate_server, reader, writer):
+        writer.write(b"GET /stats HTTP/1.1\r\nCookie: " + b"x" * (1 << 17) + b"\r\n\r\n")
+        assert (await reader.readline()).split()[1] == b"400"
+
+    run_server([ListSpec("own", str(own))], test)
+
+
+def test_latency_percentiles():
+    stats = LatencyStats(window=100)
+    for i in range(1, 201):
+        stats.record("lookup", i / 1000)
+    summary = stats.summary()["lookup"]
+    assert summary == {"requests": 200, "p50_ms": 150.0, "p90_ms": 190.0, "p99_ms": 199.0, "max_ms": 200.0}
+
+
+def test_list_spec():
+    assert ListSpec.from_spec("eu@cz,sk=rir-delegated=https://example.org/x") == ListSpec(
+        "eu", "rir-delegated=https://example.org/x", ["CZ", "SK"])
+    assert ListSpec.from_spec("own=a.txt") == ListSpec("own", "a.txt")
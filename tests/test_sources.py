@@ -0,0 +1,123 @@
+import gzip
+import shutil
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from os.path import abspath, dirname, join
+
+import pytest
+
+from ip import aggregate_subnets
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.pipeline import PipelineStats, filter_chunks, parse_chunks, read_chunks, read_ranges
+from ip import sources
+from ip.sources import Source, fetch_and_aggregate, needs_sources
+
+ADDRESS_FILE = join(dirname(abspath(__file__)), "..", "czsk.csv")
+RANGES_FILE = join(dirname(abspath(__file__)), "..", "czech_ranges.txt")
+RIR_LINES = [
+    "2|ripencc|20240101|5|19830705|20240101|+0100",
+    "ripencc|*|ipv4|*|2|summary",
+    "ripencc|CZ|ipv4|10.0.0.0|768|20100512|allocated",
+    "ripencc|SK|ipv4|10.1.0.0|256|20100512|assigned",
+    "ripencc|CZ|asn|1234|1|20100512|allocated",
+    "ripencc|CZ|ipv6|2001:db8::|32|20100512|allocated",
+    "ripencc||ipv4|10.2.0.0|256||available",
+]
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/truncated.txt":  # the connection closes before the announced body is sent
+            self.send_response(200)
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            self.wfile.write(b"10.0.0.0/24\n")
+        elif self.path == "/stalled.txt":
+            time.sleep(1)
+        else:
+            super().do_GET()
+
+
+@pytest.fixture
+def server(tmp_path):
+    shutil.copy(ADDRESS_FILE, tmp_path / "czsk.csv")
+    with open(ADDRESS_FILE, "rb") as f, gzip.open(tmp_path / "czsk.csv.gz", "wb") as out:
+        shutil.copyfileobj(f, out)
+    (tmp_path / "delegated.txt").write_text("\n".join(RIR_LINES) + "\n")
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(tmp_path)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", tmp_path
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def expected(*chunks):
+    out = (CIDRSet(), CIDRv6Set())
+    for chunk in chunks:
+        for ranges, more in zip(out, chunk):
+            ranges.extend(more)
+    return tuple(aggregate_subnets(ranges, union=True) for ranges in out)
+
+
+@pytest.mark.parametrize("name", ["czsk.csv", "czsk.csv.gz"])
+def test_local_and_url_same(server, name):
+    url, directory = server
+    results = [fetch_and_aggregate([Source(location)], PipelineStats()) for location in (str(directory / name),
+                                                                                         f"{url}/{name}")]
+    assert results[0] == results[1] == expected(read_ranges(ADDRESS_FILE))
+
+
+def test_union_of_sources(server):
+    url, directory = server
+    sources = [Source(f"{url}/czsk.csv.gz"), Source(RANGES_FILE),
+               Source.from_spec(f"rir-delegated={url}/delegated.txt")]
+    stats = PipelineStats()
+    ranges_v4, ranges_v6 = fetch_and_aggregate(sources, stats, chunk_size=1000)
+    rir = (CIDRSet.from_pairs([(10 << 24, 23), ((10 << 24) + (2 << 8), 24), ((10 << 24) + (1 << 16), 24)]),
+           CIDRv6Set.from_pairs([(0x20010db8 << 96, 32)]))
+    assert (ranges_v4, ranges_v6) == expected(read_ranges(ADDRESS_FILE), read_ranges(RANGES_FILE), rir)
+    assert [source.line_format for source in sources] == ["dbip-csv", "cidr-list", "rir-delegated"]
+    assert sources[2].stats.lines_v4 == 2 and sources[2].stats.lines_v6 == 1
+    assert stats.lines_v4 == sum(source.stats.lines_v4 for source in sources)
+    assert (stats.subnets_v4, stats.addresses_v6) == (len(ranges_v4), ranges_v6.size())
+
+
+def test_countries(server):
+    url, _ = server
+    chunk = fetch_and_aggregate([Source(f"{url}/czsk.csv"), Source(f"{url}/delegated.txt")], PipelineStats(),
+                                countries={"SK"})
+    sk = next(parse_chunks(filter_chunks(read_chunks(ADDRESS_FILE), ",SK"), PipelineStats()))
+    assert chunk == expected(sk, (CIDRSet.from_pairs([((10 << 24) + (1 << 16), 24)]), CIDRv6Set()))
+
+
+def test_missing_url(server):
+    url, _ = server
+    with pytest.raises(OSError, match="404"):
+        fetch_and_aggregate([Source(ADDRESS_FILE), Source(f"{url}/missing.csv")], PipelineStats())
+
+
+def test_truncated_url(server):
+    url, _ = server
+    with pytest.raises(OSError, match="received 12 of 1000 bytes"):
+        fetch_and_aggregate([Source(f"{url}/truncated.txt")], PipelineStats())
+
+
+def test_url_timeout(server, monkeypatch):
+    url, _ = server
+    monkeypatch.setattr(sources, "TIMEOUT", 0.1)
+    with pytest.raises(OSError, match="Timed out"):
+        fetch_and_aggregate([Source(f"{url}/stalled.txt")], PipelineStats())
+
+
+def test_needs_sources():
+    assert not needs_sources("czsk.csv")
+    assert needs_sources("czsk.csv.gz")
+    assert needs_sources("https://example.org/czsk.csv")
+    assert needs_sources("rir-delegated=delegated.txt")
+    assert Source.from_spec("a=b.csv") == Source("a=b.csv")
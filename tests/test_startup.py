@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+from os.path import abspath, dirname, join
+
+SRC = join(dirname(abspath(__file__)), "..", "src")
+# `import main` takes ~95 ms on a slow CI runner (~140 ms before the optional modules were made lazy)
+IMPORT_BUDGET_US = 250000
+# loaded only by the options which need them
+LAZY_MODULES = ("asyncio", "sqlite3", "mysql", "gzip", "hashlib", "tempfile", "json", "cProfile",
+                "concurrent.futures", "ip.external", "ip.sources", "ip.lookup", "ip.delta", "ip.lossy", "ip.parallel",
+                "numpy")
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=SRC)
+    return subprocess.run([sys.executable, *args], env=env, capture_output=True, text=True, check=True)
+
+
+def import_times(module: str):
+    """Returns cumulative import time in microseconds of every module imported by ``import module``"""
+    times = {}
+    for line in run_python("-X", "importtime", "-c", f"import {module}").stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_budget():
+    best = min(import_times("main")["main"] for _ in range(3))
+    assert best < IMPORT_BUDGET_US, f"import main took {best} us"
+
+
+def test_optional_modules_are_lazy():
+    imported = import_times("main")
+    assert not [module for module in LAZY_MODULES if module in imported]
+
+
+def test_optional_modules_not_loaded():
+    loaded = run_python("-c", "import sys, main; print(' '.join(sys.modules))").stdout.split()
+    assert not [module for module in LAZY_MODULES if module in loaded]
+
+
+def test_import_keeps_locale():
+    out = run_python("-c", "import locale, ip, main; print(locale.setlocale(locale.LC_NUMERIC))").stdout
+    assert out.strip() == "C"
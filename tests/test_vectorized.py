@@ -0,0 +1,57 @@
+import random
+from ipaddress import ip_address, summarize_address_range
+from os.path import abspath, dirname, join
+
+import pytest
+
+from ip.convert import CIDR, CIDRv6
+from ip.vectorized import split_ranges
+
+ADDRESS_FILE = join(dirname(abspath(__file__)), "..", "czsk.csv")
+
+
+def load_columns(cls):
+    starts, ends = [], []
+    with open(ADDRESS_FILE) as f:
+        for line in f:
+            if cls.match(line) and (cls is CIDRv6 or not CIDRv6.match(line)):
+                a, b = line.split(",")[:2]
+                starts.append(cls._ip2int(a))
+                ends.append(cls._ip2int(b))
+    return starts, ends
+
+
+def expected_pairs(cls, starts, ends):
+    return [(int(x.network_address), x.prefixlen) for a, b in zip(starts, ends)
+            for x in summarize_address_range(ip_address(cls._int2ip(a)), ip_address(cls._int2ip(b)))]
+
+
+@pytest.mark.parametrize("cls", [CIDR, CIDRv6])
+def test_python_path(cls):
+    starts, ends = load_columns(cls)
+    prefixes, suffixes = split_ranges(starts, ends, cls.BITS, use_numpy=False)
+    assert list(zip(prefixes, suffixes)) == expected_pairs(cls, starts, ends)
+
+
+def test_numpy_path():
+    numpy = pytest.importorskip("numpy")
+    starts, ends = load_columns(CIDR)
+    r = random.Random(0)
+    for _ in range(1000):
+        a = r.randrange(1 << 32)
+        starts.append(a)
+        ends.append(r.randrange(a, min(1 << 32, a + r.choice((10, 1 << 12, 1 << 24, 1 << 32)))))
+    starts += [0, 0, 5, (1 << 32) - 1]
+    ends += [(1 << 32) - 1, 2, (1 << 32) - 1, (1 << 32) - 1]
+    prefixes, suffixes = split_ranges(numpy.array(starts, dtype=numpy.uint32), numpy.array(ends, dtype=numpy.uint32))
+    expected_prefixes, expected_suffixes = split_ranges(starts, ends, use_numpy=False)
+    assert prefixes.tolist() == expected_prefixes.tolist()
+    assert suffixes.tolist() == expected_suffixes.tolist()
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_reversed_ranges(use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    prefixes, suffixes = split_ranges([10, 0, 20], [5, 3, 19], use_numpy=use_numpy)
+    assert list(zip(prefixes, suffixes)) == [(0, 30)]
@@ -0,0 +1,100 @@
+import gzip
+import random
+
+import pytest
+
+from ip import writers
+from ip.cidrset import CIDRSet, CIDRv6Set
+from ip.convert import CIDRv6
+from ip.writers import FORMATS, Iptables, Nftables, RouterOS, format_for_file, format_subnets, write_text
+
+
+@pytest.fixture
+def chunks():
+    r = random.Random(0)
+    v4 = CIDRSet.from_pairs(sorted((r.getrandbits(32), r.randint(8, 32)) for _ in range(200)))
+    v6 = CIDRv6Set.from_pairs(sorted((r.getrandbits(128), r.randint(16, 128)) for _ in range(200)))
+    return [(v4, CIDRv6Set()), (CIDRSet(), v6)]
+
+
+def test_format_subnets_equals_str(chunks):
+    for chunk in chunks:
+        for ranges in chunk:
+            assert format_subnets(ranges) == [str(x) for x in ranges]
+
+
+@pytest.mark.parametrize("ip", [
+    "::",
+    "::ffff:102:304",
+    "::102:304",
+    "1:0:0:2::",  # the first of equally long runs of zeros is compressed
+    "2a01:afc0:0:2::",
+])
+def test_ipv6_compression(ip):
+    assert CIDRv6._int2ip(CIDRv6._ip2int(ip)) == ip
+
+
+def test_rsc(tmp_path, chunks):
+    out = tmp_path / "out.rsc"
+    write_text(str(out), chunks, False, "CZ")
+    lines = out.read_text().splitlines()
+    assert lines[0] == "/ip firewall address-list"
+    assert lines[1] == f'add address={chunks[0][0][0]} comment="CZ" list=Country_IP_Allows'
+    assert lines.index("/ipv6 firewall address-list") == 202
+    assert len(lines) == 404
+
+
+def test_ipv4_after_ipv6(tmp_path, chunks):
+    out, expected = tmp_path / "out.rsc", tmp_path / "expected.rsc"
+    v4 = chunks[0][0]
+    write_text(str(out), [(v4[:100], CIDRv6Set()), chunks[1], (v4[100:], CIDRv6Set())], False, "CZ")
+    write_text(str(expected), chunks, False, "CZ")
+    assert out.read_text() == expected.read_text()
+
+
+def test_ipv6_spooled_to_file(tmp_path, chunks, monkeypatch):
+    out, expected = tmp_path / "out.rsc", tmp_path / "expected.rsc"
+    write_text(str(expected), chunks, False, "CZ")
+    monkeypatch.setattr(writers, "SPOOL_SIZE", 100)
+    monkeypatch.setattr(writers, "SPOOL_BLOCK", 7)
+    v6 = chunks[1][1]
+    assert write_text(str(out), [(CIDRSet(), v6[:50]), chunks[0], (CIDRSet(), v6[50:])], False, "CZ") == 400
+    assert out.read_text() == expected.read_text()
+
+
+def test_only_ipv4(tmp_path, chunks):
+    out = tmp_path / "out.txt"
+    assert write_text(str(out), chunks[:1], False) == 200
+    assert out.read_text().splitlines() == [str(x) for x in chunks[0][0]]
+
+
+def test_gzip_and_append(tmp_path, chunks):
+    out = str(tmp_path / "out.txt.gz")
+    write_text(out, chunks[:1], False)
+    write_text(out, chunks[1:], True)
+    with gzip.open(out, "rt") as f:
+        assert f.read().splitlines() == [str(x) for chunk in chunks for ranges in chunk for x in ranges]
+
+
+def test_nftables_batches(tmp_path, chunks):
+    out = tmp_path / "out"
+    write_text(str(out), chunks, False, output_format=Nftables)
+    elements = [line for line in out.read_text().splitlines() if line.startswith("add element")]
+    assert elements[0] == "add element inet filter Country_IP_Allows_v4 { " + ", ".join(
+        str(x) for x in chunks[0][0]) + " }"
+    assert elements[1].startswith("add element inet filter Country_IP_Allows_v6 { ")
+    assert len(elements) == 2
+
+
+@pytest.mark.parametrize("output_format", FORMATS.values())
+def test_every_subnet_is_written(tmp_path, chunks, output_format):
+    out = tmp_path / "out"
+    write_text(str(out), chunks, False, comment="Czech Republic", output_format=output_format)
+    text = out.read_text()
+    assert all(str(x) in text for chunk in chunks for ranges in chunk for x in ranges)
+
+
+def test_format_for_file():
+    assert format_for_file("a.RSC") is RouterOS
+    assert format_for_file("a.iptables.gz") is Iptables
+    assert format_for_file("a.txt") is FORMATS["plain"]